@@ -0,0 +1,38 @@
+"""
+Structure-aware chunking compared against the previous ingestion
+(HTMLTagReader sections and the default sentence splitter) on the bundled files.
+
+    python -m bench.chunking
+"""
+from llama_index.core import Document, Settings, SimpleDirectoryReader
+from llama_index.core.utils import get_tokenizer
+from llama_index.readers.file import HTMLTagReader
+
+from server.utils.chunking import StructuredChunker
+from server.utils.html_cleaning import html_to_markdown
+
+
+if __name__ == "__main__":
+    files = ["server/data/sildenafill.pdf", "server/data/goodrx-support.html"]
+    tokenizer = get_tokenizer()
+    pipelines = {
+        "sentence splitter": (
+            SimpleDirectoryReader(input_files=files, file_extractor={".html": HTMLTagReader()}).load_data(),
+            Settings.transformations,
+        ),
+    }
+    documents = SimpleDirectoryReader(input_files=files[:1]).load_data()
+    with open(files[1], "r") as f:
+        documents.append(Document(text=html_to_markdown(f.read()), metadata={"file_path": files[1]}))
+    pipelines["structured"] = (documents, [StructuredChunker()])
+
+    for name, (documents, transformations) in pipelines.items():
+        nodes = documents
+        for transformation in transformations:
+            nodes = transformation(nodes)
+        tokens = [len(tokenizer(node.get_content())) for node in nodes]
+        distinct = len({node.get_content() for node in nodes})
+        print(
+            f"{name:>17}: {len(nodes)} nodes ({len(nodes) - distinct} duplicates), {sum(tokens)} tokens,"
+            f" {sum(tokens) / len(nodes):.0f} avg / {max(tokens)} max per node"
+        )
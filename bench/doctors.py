@@ -0,0 +1,44 @@
+"""
+Nearest-doctor search on a synthetic nationwide directory of providers
+clustered around metro areas. Correctness against brute force is covered
+by tests/test_doctors.py.
+
+    python -m bench.doctors
+"""
+import time
+
+import numpy as np
+
+from server.utils.doctors import DoctorDirectory
+
+
+if __name__ == "__main__":
+    rng = np.random.default_rng(0)
+    num_providers = 1_000_000
+    specialties = ["family medicine", "internal medicine", "pediatrics", "cardiology", "dermatology",
+                   "psychiatry", "oncology", "neurology", "orthopedics", "endocrinology"]
+    metros = np.column_stack([rng.uniform(25, 49, 300), rng.uniform(-124, -67, 300)])
+    metro = rng.integers(0, len(metros), num_providers)
+    lats = metros[metro, 0] + rng.normal(0, 0.3, num_providers)
+    lons = metros[metro, 1] + rng.normal(0, 0.3, num_providers)
+    rural = rng.random(num_providers) < 0.1
+    lats[rural] = rng.uniform(25, 49, rural.sum())
+    lons[rural] = rng.uniform(-124, -67, rural.sum())
+    ids = [str(i) for i in range(num_providers)]
+    provider_specialties = [specialties[i] for i in rng.integers(0, len(specialties), num_providers)]
+
+    start = time.perf_counter()
+    directory = DoctorDirectory(ids, ids, provider_specialties, ids, lats, lons)
+    print(f"indexed {len(directory)} providers in {time.perf_counter() - start:.2f}s")
+
+    queries = np.column_stack([rng.uniform(25, 49, 2000), rng.uniform(-124, -67, 2000)])
+    for name, search in [
+        ("5 nearest", lambda lat, lon: directory._grid(None).nearest(lat, lon, 5)),
+        ("5 nearest cardiologists", lambda lat, lon: directory._grid("cardiology").nearest(lat, lon, 5)),
+        ("within 10 km", lambda lat, lon: directory._grid(None).within(lat, lon, 10.0)),
+    ]:
+        start = time.perf_counter()
+        for lat, lon in queries:
+            search(lat, lon)
+        per_query_ms = (time.perf_counter() - start) / len(queries) * 1000
+        print(f"{name}: {per_query_ms:.3f} ms/query")
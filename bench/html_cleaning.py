@@ -0,0 +1,48 @@
+"""
+Micro-benchmark of page cleaning on the bundled GoodRx support page.
+
+    python -m bench.html_cleaning
+"""
+import re
+import time
+
+import html2text
+
+from server.utils.html_cleaning import HTML_CLEAN_WORKERS, _get_pool, html_to_clean_text, remove_links
+
+
+def _legacy_remove_links(string):
+    # the previous two-pass implementation, for comparison
+    string = re.sub(r"\*\s*\(https?://[^\)]+\)\[.*?\]\s*\*", "", string)
+
+    def replace_match(match):
+        text = match.group(1)
+        return text if text else ""
+
+    return re.sub(r"https?://(?:www\.)?((?!www\.).)+?", replace_match, string)
+
+
+def _timeit(fn, *args, repeat=20):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = fn(*args)
+    return (time.perf_counter() - start) / repeat * 1000, result
+
+
+if __name__ == "__main__":
+    with open("server/data/goodrx-support.html", "r") as f:
+        html = f.read()
+
+    convert_ms, text = _timeit(html2text.html2text, html, repeat=5)
+    legacy_ms, legacy = _timeit(_legacy_remove_links, text)
+    current_ms, cleaned = _timeit(remove_links, text)
+    assert cleaned == legacy, "link stripping differs from the legacy output"
+
+    print(f"html: {len(html)} chars, text: {len(text)} chars")
+    print(f"html2text: {convert_ms:.2f} ms/page")
+    print(f"link stripping: legacy {legacy_ms:.3f} ms, precompiled {current_ms:.3f} ms ({legacy_ms / current_ms:.1f}x)")
+
+    pages = [html] * 64
+    serial_s = _timeit(lambda: [html_to_clean_text(page) for page in pages], repeat=1)[0] / 1000
+    pooled_s = _timeit(lambda: list(_get_pool().map(html_to_clean_text, pages)), repeat=1)[0] / 1000
+    print(f"64 pages: serial {serial_s:.2f} s, process pool {pooled_s:.2f} s ({HTML_CLEAN_WORKERS} workers)")
@@ -0,0 +1,119 @@
+"""
+Load test: concurrent websocket clients against a local fake LLM on one event
+loop, reporting turn latency and time to first token. The clients share the
+server's loop and CPU, so latencies are an upper bound.
+
+    python -m bench.load_test [clients] [turns]
+"""
+import asyncio
+import contextlib
+import io
+import sys
+import tempfile
+import time
+
+import aiohttp
+import numpy as np
+import uvicorn
+from fastapi import FastAPI
+from llama_index.core import Settings
+from llama_index.core.embeddings import MockEmbedding
+from llama_index.core.llms import ChatMessage, ChatResponse, CustomLLM, LLMMetadata
+
+from server.router import agent
+from server.utils.chat_store import chat_journal
+
+
+if __name__ == "__main__":
+    num_clients = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    num_turns = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+    class FakeLLM(CustomLLM):
+        """Streams a canned reply with network-like latency and never calls tools."""
+
+        first_token_s: float = 0.05
+        token_s: float = 0.005
+
+        @property
+        def metadata(self):
+            return LLMMetadata(is_function_calling_model=True)
+
+        def complete(self, prompt, formatted=False, **kwargs):
+            raise NotImplementedError
+
+        def stream_complete(self, prompt, formatted=False, **kwargs):
+            raise NotImplementedError
+
+        async def achat(self, messages, **kwargs):
+            await asyncio.sleep(self.first_token_s)
+            return ChatResponse(message=ChatMessage(role="assistant", content="summary"))
+
+        async def astream_chat_with_tools(self, tools, chat_history=None, **kwargs):
+            words = f"You said: {chat_history[-1].content}".split(" ")
+
+            async def gen():
+                content = ""
+                await asyncio.sleep(self.first_token_s)
+                for word in words:
+                    await asyncio.sleep(self.token_s)
+                    delta = f"{word} "
+                    content += delta
+                    yield ChatResponse(message=ChatMessage(role="assistant", content=content), delta=delta)
+
+            return gen()
+
+        def get_tool_calls_from_response(self, response, error_on_no_tool_call=True, **kwargs):
+            return []
+
+    # identical vectors make every route ambiguous, so each turn reaches the LLM
+    Settings.embed_model = MockEmbedding(embed_dim=8)
+    agent.llm = llm = FakeLLM()
+    chat_journal.chat_dir = tempfile.mkdtemp()
+
+    async def client(url, turn_ms, first_token_ms):
+        async with aiohttp.ClientSession() as http:
+            async with http.ws_connect(url) as ws:
+                await ws.receive_json()  # session id
+                await ws.receive_str()  # welcome message
+                for turn in range(num_turns):
+                    start = time.perf_counter()
+                    first_token = None
+                    await ws.send_str(f"message {turn} about my prescription")
+                    while True:
+                        message = await ws.receive_json()
+                        if "delta" in message and first_token is None:
+                            first_token = time.perf_counter()
+                        if "response" in message:
+                            break
+                    turn_ms.append((time.perf_counter() - start) * 1000)
+                    first_token_ms.append((first_token - start) * 1000)
+                await ws.send_str("bye")
+                await ws.receive_str()
+
+    async def main():
+        app = FastAPI()
+        app.include_router(agent.router)
+        server = uvicorn.Server(uvicorn.Config(app, port=0, log_level="warning", ws="wsproto"))
+        server_task = asyncio.create_task(server.serve())
+        while not server.started:
+            await asyncio.sleep(0.01)
+        port = server.servers[0].sockets[0].getsockname()[1]
+        url = f"http://127.0.0.1:{port}/agent/ws"
+
+        turn_ms, first_token_ms = [], []
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            await asyncio.gather(*(client(url, turn_ms, first_token_ms) for _ in range(num_clients)))
+        elapsed = time.perf_counter() - start
+
+        server.should_exit = True
+        await server_task
+
+        print(f"{num_clients} clients x {num_turns} turns in {elapsed:.2f}s ({len(turn_ms) / elapsed:.0f} turns/s)")
+        print(f"fake LLM: {llm.first_token_s * 1000:.0f} ms to first token, {llm.token_s * 1000:.0f} ms per token")
+        for name, values in [("turn latency", turn_ms), ("time to first token", first_token_ms)]:
+            p50, p99 = np.percentile(values, [50, 99])
+            print(f"{name}: p50 {p50:.1f} ms, p99 {p99:.1f} ms")
+        print(f"sessions resident: {len(agent.sessions)}")
+
+    asyncio.run(main())
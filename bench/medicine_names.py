@@ -0,0 +1,37 @@
+"""
+Medicine name normalization: what common variants map to, how many answer
+cache keys they collapse into, and the cost per name with and without the cache.
+
+    python -m bench.medicine_names
+"""
+import time
+
+from server.utils.medicine_names import MedicineNameIndex, medicine_name_index
+
+
+if __name__ == "__main__":
+    variants = [
+        "sildenafil", "Sildenafil", "sildenafill", "sildenafel", "Viagra", "viagra 50mg", "VIAGRA 100 mg tablets",
+        "Lipitor 20mg", "atorvastatin", "atorvastatine", "Toprol XL 25 mg", "metoprolol er", "co-amoxiclav 625mg",
+        "Ozempic 0.5mg", "semaglutid", "paracetamol", "Tylenol extra strength", "unknownium",
+        # other medicines and words close to dictionary names, which must not be corrected
+        "citalopram", "felodipine", "prednisolone", "allergy", "advice",
+    ]
+    for variant in variants:
+        match = medicine_name_index.normalize(variant)
+        suggestion = medicine_name_index.suggest(variant) if match is None else None
+        print(f"{variant!r:28} -> {match}" + (f" (did you mean {suggestion.matched}?)" if suggestion else ""))
+
+    raw_keys = {variant.strip().lower() for variant in variants}
+    canonical_keys = {medicine_name_index.canonical_name(variant) for variant in variants}
+    print(f"{len(variants)} variants: {len(raw_keys)} raw cache keys, {len(canonical_keys)} canonical ones")
+
+    runs = 2000
+    uncached = MedicineNameIndex.load()._normalize
+    for label, normalize in [("uncached", uncached), ("cached", medicine_name_index.normalize)]:
+        start = time.perf_counter()
+        for _ in range(runs // len(variants)):
+            for variant in variants:
+                normalize(variant)
+        per_call_us = (time.perf_counter() - start) / (runs // len(variants) * len(variants)) * 1e6
+        print(f"{label}: {per_call_us:.1f} us per name")
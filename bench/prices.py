@@ -0,0 +1,33 @@
+"""
+Price comparison against stub providers: a slow vendor beyond the latency
+budget and a failing one, cold and then from the cache.
+
+    python -m bench.prices
+"""
+import asyncio
+
+from server.utils.prices import PriceComparer, StaticPriceProvider
+
+
+if __name__ == "__main__":
+    comparer = PriceComparer(
+        providers=[
+            StaticPriceProvider("Amazon", default=10.99, delay=0.05),
+            StaticPriceProvider("Walmart", {"atorvastatin": 7.49}, default=9.99, delay=0.1),
+            StaticPriceProvider("Slow Pharmacy", default=5.99, delay=1.0),
+            StaticPriceProvider("Broken Vendor", error="503 from vendor"),
+        ],
+        latency_budget=0.3,
+    )
+
+    async def main():
+        for attempt in ["cold", "cached"]:
+            result = await comparer.acompare("atorvastatin", "20mg", "94103")
+            print(
+                f"{attempt}: {result['elapsed_ms']} ms, best {result['best'].provider} ${result['best'].price},"
+                f" {len(result['quotes'])} quotes, failed {result['failed']}, pending {result['pending']}"
+            )
+            # let the slow vendor land in the cache
+            await asyncio.sleep(1.0)
+
+    asyncio.run(main())
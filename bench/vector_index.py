@@ -0,0 +1,64 @@
+"""
+Compares faiss index types against flat search, on the persisted vectors if
+the corpus is large enough and a synthetic clustered corpus otherwise.
+
+    python -m bench.vector_index IVF,Flat HNSW32 IVF,PQ64
+"""
+import os
+import sys
+import time
+
+import faiss
+import numpy as np
+
+from server.utils.vector_index import EMBED_DIM, FAISS_MIN_TRAIN_VECTORS, get_search_params, make_faiss_index
+
+
+def evaluate_index(faiss_index, vectors, queries, k=10):
+    """Reports recall@k and per-query latency of `faiss_index` against exact flat search."""
+    flat = faiss.IndexFlatL2(vectors.shape[1])
+    flat.add(vectors)
+
+    start = time.perf_counter()
+    _, expected = flat.search(queries, k)
+    flat_ms = (time.perf_counter() - start) / len(queries) * 1000
+
+    start = time.perf_counter()
+    _, found = faiss_index.search(queries, k)
+    index_ms = (time.perf_counter() - start) / len(queries) * 1000
+
+    hits = sum(len(set(e) & set(f)) for e, f in zip(expected, found))
+    return {
+        "recall_at_k": hits / (len(queries) * k),
+        "flat_ms": flat_ms,
+        "index_ms": index_ms,
+    }
+
+
+if __name__ == "__main__":
+    factories = sys.argv[1:] or ["IVF,Flat", "HNSW32", "IVF,PQ64"]
+    rng = np.random.default_rng(0)
+
+    vectors = None
+    persist_path = os.path.join("storage", "default__vector_store.json")
+    if os.path.exists(persist_path):
+        stored = faiss.read_index(persist_path)
+        if isinstance(faiss.downcast_index(stored), faiss.IndexFlat) and stored.ntotal >= FAISS_MIN_TRAIN_VECTORS:
+            vectors = stored.reconstruct_n(0, stored.ntotal)
+    if vectors is None:
+        centers = rng.normal(size=(200, EMBED_DIM)).astype("float32")
+        vectors = centers[rng.integers(0, 200, 20000)] + 0.3 * rng.normal(size=(20000, EMBED_DIM)).astype("float32")
+    queries = vectors[rng.choice(len(vectors), 200, replace=False)] + 0.05 * rng.normal(size=(200, EMBED_DIM)).astype("float32")
+
+    print(f"{len(vectors)} vectors, {len(queries)} queries, k=10")
+    for factory in factories:
+        start = time.perf_counter()
+        faiss_index = make_faiss_index(vectors, factory=factory, min_train_vectors=0)
+        faiss_index.add(vectors)
+        build_s = time.perf_counter() - start
+        report = evaluate_index(faiss_index, vectors, queries)
+        print(
+            f"{factory:>12}: recall@10 {report['recall_at_k']:.3f}, "
+            f"{report['index_ms']:.3f} ms/query (flat {report['flat_ms']:.3f} ms), "
+            f"build {build_s:.1f} s, params {get_search_params(faiss_index)}"
+        )
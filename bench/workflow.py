@@ -0,0 +1,48 @@
+"""
+Per-turn CPU overhead outside the LLM call: building the tool list and
+lookups, and the OpenAI request payload (tool JSON schemas), rebuilt every
+turn versus compiled once into an AgentRegistry.
+
+    python -m bench.workflow
+"""
+import time
+import timeit
+
+from llama_index.core.llms import ChatMessage
+from llama_index.core.program.function_program import get_function_tool
+from llama_index.llms.openai import OpenAI
+
+from server.utils.agent_config import get_agent_configs
+from server.utils.workflow import AgentRegistry, RequestTransfer, TransferToAgent
+
+
+if __name__ == "__main__":
+    llm = OpenAI(model="gpt-4o", api_key="unused")
+    agent_configs = get_agent_configs()
+    messages = [ChatMessage(role="user", content="hi")]
+
+    def rebuilt_turn():
+        for ac in agent_configs:
+            tools = [get_function_tool(RequestTransfer)] + ac.tools
+            llm._prepare_chat_with_tools(tools, chat_history=messages)
+            {tool.metadata.get_name(): tool for tool in ac.tools}
+        "".join(f"{ac.name}: {ac.description}\n" for ac in agent_configs)
+        llm._prepare_chat_with_tools([get_function_tool(TransferToAgent)], chat_history=messages)
+
+    start = time.perf_counter()
+    registry = AgentRegistry(agent_configs)
+    compile_ms = (time.perf_counter() - start) * 1000
+
+    def compiled_turn():
+        for agent in registry.agents.values():
+            llm._prepare_chat_with_tools(agent.tools, chat_history=messages)
+            agent.tools_by_name.get("RequestTransfer")
+        registry.agent_context_str
+        llm._prepare_chat_with_tools(registry.orchestrator_tools, chat_history=messages)
+
+    runs = 500
+    rebuilt = timeit.timeit(rebuilt_turn, number=runs) / runs * 1000
+    compiled = timeit.timeit(compiled_turn, number=runs) / runs * 1000
+    print(f"registry compiled once in {compile_ms:.2f} ms")
+    print(f"rebuilt per turn:  {rebuilt:.3f} ms")
+    print(f"compiled registry: {compiled:.3f} ms ({rebuilt / compiled:.1f}x)")
@@ -1,7 +1,9 @@
 import uvicorn
 from fastapi import FastAPI
 from server.router import knowledge, agent
-from server.utils.embedding import create_index
+from server.utils.chat_store import chat_journal
+from server.utils.embedding import create_index, med_index
+from server.utils.prices import price_comparer
 
 app = FastAPI()
 
@@ -13,6 +15,23 @@ app.include_router(knowledge.router)
 app.include_router(agent.router)
 
 
+@app.on_event("startup")
+def load_med_index():
+    # load the index once so requests are served from memory
+    med_index.load()
+
+
+@app.on_event("startup")
+def migrate_chat_history():
+    # the history from before sessions existed is resumed by connecting with LEGACY_SESSION_ID
+    chat_journal.migrate_legacy()
+
+
+@app.on_event("shutdown")
+async def close_price_providers():
+    await price_comparer.aclose()
+
+
 def main():
     create_index()
     uvicorn.run("server.app:app", host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
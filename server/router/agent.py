@@ -1,13 +1,20 @@
-import os
-import json
-from fastapi import APIRouter
+import asyncio
+from typing import List, Optional
+
+from fastapi import APIRouter, HTTPException, Query
 from fastapi import WebSocket, WebSocketDisconnect
 from llama_index.core.memory import ChatMemoryBuffer
 from llama_index.llms.openai import OpenAI
 
 from server.utils.agent_config import get_agent_configs, get_initial_state
-from server.utils.embedding import get_med_index, save_chat
-from server.utils.workflow import ConciergeAgent, ProgressEvent, ToolApprovedEvent, ToolRequestEvent
+from server.utils.answer_cache import answer_cache
+from server.utils.chat_store import chat_journal
+from server.utils.context_window import ContextCompactor
+from server.utils.embedding import aget_answers, get_answer
+from server.utils.intent_router import intent_router
+from server.utils.sessions import CHAT_TOKEN_LIMIT, SessionStore
+from server.utils.tool_stats import tool_stats
+from server.utils.workflow import AgentRegistry, ChatMessageEvent, ConciergeAgent, ProgressEvent, TokenEvent, ToolApprovedEvent, ToolRequestEvent
 
 from colorama import Fore, Style
     
@@ -18,39 +25,85 @@ router = APIRouter(
 
 
 @router.get('/query')
-def ask_agent(query: str):
-	index = get_med_index()
+def ask_agent(query: str, drug_name: Optional[str] = None):
+	# drug_name limits retrieval to the documents about that medicine
+	answer = get_answer(query, drug_name=drug_name)
+
+	return {'question': query, 'answer': answer}
+
+
+@router.post('/query_batch')
+async def ask_agent_batch(queries: List[str], drug_names: Optional[List[str]] = Query(None)):
+	# drug_names, if given, holds the medicine to filter each query's retrieval by, '' for none
+	if drug_names is not None and len(drug_names) != len(queries):
+		raise HTTPException(
+			status_code=422,
+			detail=f'drug_names has {len(drug_names)} entries for {len(queries)} queries.',
+		)
+	answers = await aget_answers(
+		queries, drug_names=[drug_name or None for drug_name in drug_names] if drug_names else None
+	)
+
+	return [{'question': query, 'answer': answer} for query, answer in zip(queries, answers)]
+
+
+@router.get('/cache_stats')
+def get_cache_stats():
+	return {'answers': answer_cache.stats()}
+
+
+@router.get('/router_stats')
+def get_router_stats():
+	return intent_router.stats()
 
-	query_engine = index.as_query_engine()
-	response = query_engine.query(query)
 
-	return {'question': query, 'answer': response.response}
+@router.get('/tool_stats')
+def get_tool_stats():
+	return tool_stats.stats()
 
-def load_chat():
-    """Load memory from file."""
-    if os.path.exists('server/memory.json'):
-        with open('server/memory.json', 'r') as f:
-            return ChatMemoryBuffer.from_dict(json.load(f))
-    return ChatMemoryBuffer.from_defaults(llm=llm)
+def load_chat(session_id):
+    """Load a session's memory from its journal."""
+    return ChatMemoryBuffer.from_defaults(
+        chat_history=chat_journal.load(session_id),
+        llm=llm,
+        token_limit=CHAT_TOKEN_LIMIT,
+    )
 
 
-# Initialize shared configurations
+def compact_chat(session_id, memory):
+    """Compact a session's journal, and its memory with it, once it grows too big."""
+    if chat_journal.compact(session_id):
+        memory.set(chat_journal.load(session_id))
+
+
+# Initialize shared configurations; everything here is read-only per turn
 llm = OpenAI(model="gpt-4o", temperature=0.4)
-memory = load_chat()
 initial_state = get_initial_state()
+sessions = SessionStore(load_memory=load_chat, on_disconnect=compact_chat, initial_state=initial_state)
 agent_configs = get_agent_configs()
+# tool schemas, tool lookups and prompts are built once, not per turn
+agent_registry = AgentRegistry(agent_configs)
+context_compactor = ContextCompactor()
 
 
-workflow = ConciergeAgent(timeout=None)
+def new_workflow():
+    """A workflow for one connection; a workflow holds on to every context it has run."""
+    return ConciergeAgent(timeout=None, context_compactor=context_compactor)
 
 
 @router.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
     await websocket.accept()
+    # loading and compacting journals is file IO, keep it off the event loop
+    session = await asyncio.to_thread(sessions.connect, websocket.query_params.get('session_id'))
+    memory = session.memory
+    workflow = new_workflow()
+    ctx = None
     try:
+        await websocket.send_json({'session_id': session.session_id})
+
         # send chat history
-        chat_history = memory.model_dump()['chat_store']['store'].get('chat_history') or []
-        conversation = [{'role': message['role'], 'message': message['content']} for message in chat_history if message['role'] in ["user", "assistant"] and message['content'] is not None]
+        conversation = [{'role': message.role.value, 'message': message.content} for message in memory.get_all() if message.role.value in ["user", "assistant"] and message.content is not None]
         
         if conversation:
             await websocket.send_json({'conversation': conversation})  
@@ -58,18 +111,35 @@ async def websocket_endpoint(websocket: WebSocket):
         # Welcome message
         await websocket.send_text(f"Hi there! How can I help you today?")
 
-        user_msg = await websocket.receive_text()
-        handler = workflow.run(
-            user_msg=user_msg,
-            agent_configs=agent_configs,
-            llm=llm,
-            chat_history=memory.get(),
-            initial_state=initial_state,
-        )
-
         while True:
+            # Wait for the user's next message
+            user_msg = await websocket.receive_text()
+            if user_msg.strip().lower() in ["exit", "quit", "bye"]:
+                await websocket.send_text(f"Fare the well!")
+                break
+
+            # Continue this connection's context, if any; the session's user
+            # state only seeds a new one
+            chat_history = memory.get()
+            handler = workflow.run(
+                ctx=ctx,
+                user_msg=user_msg,
+                agent_registry=agent_registry,
+                llm=llm,
+                chat_history=chat_history,
+                initial_state=session.user_state,
+            )
+            ctx = handler.ctx
+
             async for event in handler.stream_events():
-                if isinstance(event, ToolRequestEvent):
+                if isinstance(event, TokenEvent):
+                    # forward the reply as it is generated
+                    await websocket.send_json({'delta': event.delta})
+                elif isinstance(event, ChatMessageEvent):
+                    # journal each message as it is produced, so a crash mid-turn loses nothing
+                    memory.put(event.message)
+                    await asyncio.to_thread(chat_journal.append, session.session_id, [event.message])
+                elif isinstance(event, ToolRequestEvent):
                     await websocket.send_text(
                         f"Are you sure you want to proceed? Please respond with 'y' or 'n'"
                     )
@@ -90,6 +160,8 @@ async def websocket_endpoint(websocket: WebSocket):
                                 tool_id=event.tool_id,
                                 tool_name=event.tool_name,
                                 tool_kwargs=event.tool_kwargs,
+                                batch_id=event.batch_id,
+                                index=event.index,
                                 approved=True,
                             )
                         )
@@ -102,6 +174,8 @@ async def websocket_endpoint(websocket: WebSocket):
                                 tool_name=event.tool_name,
                                 tool_id=event.tool_id,
                                 tool_kwargs=event.tool_kwargs,
+                                batch_id=event.batch_id,
+                                index=event.index,
                                 approved=False,
                                 response=reason,
                             )
@@ -112,28 +186,12 @@ async def websocket_endpoint(websocket: WebSocket):
             # Await final result and send to the client
             result = await handler
             print(Fore.BLUE + f"AGENT >> {result['response']}" + Style.RESET_ALL)
-            await websocket.send_text(f"{result['response']}")
-
-            # Update memory with only new chat history
-            for i, msg in enumerate(result["chat_history"]):
-                if i >= len(memory.get()):
-                    memory.put(msg)
+            # the full reply replaces whatever deltas the client rendered
+            await websocket.send_json({'response': result['response']})
 
-            # Wait for the user's next message
-            user_msg = await websocket.receive_text()
-            if user_msg.strip().lower() in ["exit", "quit", "bye"]:
-                await websocket.send_text(f"Fare the well!")
-                break
-
-            # Pass in the existing context and continue the conversation
-            handler = workflow.run(
-                ctx=handler.ctx,
-                user_msg=user_msg,
-                agent_configs=agent_configs,
-                llm=llm,
-                chat_history=memory.get(),
-                initial_state=initial_state,
-            )
+            session.user_state = await ctx.get("user_state")
+            sessions.touch(session)
     except WebSocketDisconnect:
         print("SYSTEM >> Client disconnected.")
-        save_chat(memory)
+    finally:
+        await asyncio.to_thread(sessions.disconnect, session)
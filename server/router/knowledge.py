@@ -2,13 +2,13 @@ import shutil
 from pathlib import Path
 from typing import List
 from fastapi import APIRouter, File, UploadFile
-from llama_index.core import SimpleDirectoryReader
 from llama_index.readers.web import SpiderWebReader
 
-from server.utils.embedding import MedWebPageReader, store_documents
+from server.utils.embedding import MedWebPageReader, astore_documents, load_files, record_files, store_documents
 
 UPLOAD_DIR = Path('./server/data')
 UPLOAD_DIR.mkdir(exist_ok=True)
+UPLOAD_EXTS = ['.pdf', '.md']
 
 router = APIRouter(
     prefix='/knowledge',
@@ -31,24 +31,26 @@ def upload_files(files: List[UploadFile] = File(...)):
             shutil.copyfileobj(file.file, buffer)
         saved_files.append(str(file_path))
 
-    documents = SimpleDirectoryReader(
-        input_dir='server/data',
-        required_exts=['.pdf', '.md']
-    ).load_data(show_progress=True)
+    # parse only the files from this request; already indexed ones are skipped
+    input_files = [path for path in saved_files if Path(path).suffix in UPLOAD_EXTS]
+    documents = load_files(input_files, source_type='upload') if input_files else []
 
-    store_documents(documents)
+    stats = store_documents(documents)
+    record_files(input_files)
 
-    return {'message': 'Files uploaded successfully.', 'files': saved_files}
+    return {'message': 'Files uploaded successfully.', 'files': saved_files, 'ingestion': stats}
 
 
 @router.post('/upload_webpages')
-def parse_webpages(urls: List[str]):
-    documents = MedWebPageReader(
+async def parse_webpages(urls: List[str]):
+    reader = MedWebPageReader(
         html_to_text=True
-    ).load_data(urls=urls)
+    )
+    documents = await reader.aload_data(urls=urls)
    
     print(f'parsed documents from {urls} successfully. total documents: {len(documents)}')
 
-    store_documents(documents)
+    stats = await astore_documents(documents)
+    reader.save_validators()
 
-    return {'message': 'Webpages uploaded successfully.', 'urls': urls}
+    return {'message': 'Webpages uploaded successfully.', 'urls': urls, 'ingestion': stats}
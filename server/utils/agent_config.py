@@ -1,16 +1,21 @@
+import asyncio
 import random
-from typing import List
+from typing import List, Optional
 
 from llama_index.core.tools import BaseTool
 from llama_index.core.workflow import Context
 from pydantic import BaseModel
 
-from server.utils.embedding import get_answer, get_med_index
+from server.utils.embedding import aget_answer, aget_answers, get_med_index
 from server.utils.workflow import (
     AgentConfig,
     ProgressEvent,
 )
 from server.utils.misc import FunctionToolWithContext
+from server.utils.doctors import get_doctor_directory
+from server.utils.geo import geocoder, zip_code_from_address
+from server.utils.medicine_names import medicine_name_index
+from server.utils.prices import price_comparer
 
 
 def get_initial_state() -> dict:
@@ -23,52 +28,106 @@ def get_initial_state() -> dict:
     }
 
 
+def medicine_query(medicine_name: str) -> str:
+    return f'Briefly explain the medicine: {medicine_name}. If there is no reference of {medicine_name}, response with NA.'
+
+
+def medicine_label(medicine_name: str, canonical: str) -> str:
+    if canonical == medicine_name.strip().lower():
+        return medicine_name
+    return f"{medicine_name} ({canonical})"
+
+
+def medicine_hint(medicine_name: str) -> str:
+    """A "did you mean" for a name close to a known medicine but not safely corrected to it."""
+    if medicine_name_index.normalize(medicine_name) is not None:
+        return ""
+    suggestion = medicine_name_index.suggest(medicine_name)
+    return f" Did you mean {suggestion.matched}?" if suggestion is not None else ""
+
+
 class Prescription(BaseModel):
     medicines: List[str] = []
 
 
 def get_medicine_tools() -> list[BaseTool]:
-    def lookup_generic_info(ctx: Context, query: str) -> str:
+    async def lookup_generic_info(ctx: Context, query: str) -> str:
         """Useful for finding generic info about a company/product."""
         ctx.write_event_to_stream(
             ProgressEvent(msg=f"Looking up")
         )
         
-        answer = get_answer(query)
+        answer = await aget_answer(query)
 
         print((query, answer))
 
         return answer
     
-    def lookup_medicine_info(ctx: Context, medicine_name: str) -> str:
+    async def lookup_medicine_info(ctx: Context, medicine_name: str) -> str:
         """Useful for looking up a product or medicine info."""
         ctx.write_event_to_stream(
             ProgressEvent(msg=f"Looking up info for {medicine_name}")
         )
 
-        answer = get_answer(f'Briefly explain the medicine: {medicine_name}. If there is no reference of {medicine_name}, response with NA.')
+        matches = medicine_name_index.normalize_all(medicine_name)
+        if len(matches) > 1:
+            # "advil and tylenol": each medicine gets its own filtered lookup
+            return await lookup_medicines_info(ctx, [match.matched for match in matches])
+
+        # brand, misspelled and dosage-suffixed names share one query and cache entry
+        canonical = medicine_name_index.canonical_name(medicine_name)
+        answer = await aget_answer(medicine_query(canonical), drug_name=canonical)
+
+        print((medicine_name, canonical, answer))
+
+        return f"{medicine_label(medicine_name, canonical)}: {answer}{medicine_hint(medicine_name)}"
+
+    async def lookup_medicines_info(ctx: Context, medicine_names: List[str]) -> str:
+        """Useful for looking up info of several medicines at once, e.g. all medicines of a prescription."""
+        ctx.write_event_to_stream(
+            ProgressEvent(msg=f"Looking up info for {', '.join(medicine_names)}")
+        )
+
+        canonicals = [medicine_name_index.canonical_name(name) for name in medicine_names]
+        answers = await aget_answers([medicine_query(canonical) for canonical in canonicals], drug_names=canonicals)
 
-        print((medicine_name, answer))
+        print(list(zip(medicine_names, canonicals, answers)))
 
-        return f"{medicine_name}: {answer}"
+        return "\n".join(
+            f"{medicine_label(name, canonical)}: {answer}{medicine_hint(name)}"
+            for name, canonical, answer in zip(medicine_names, canonicals, answers)
+        )
 
-    def compare_medicine_prices(ctx: Context, medicine_name: str) -> str:
+    async def compare_medicine_prices(ctx: Context, medicine_name: str, dosage: Optional[str] = None) -> str:
         """Useful for comparing medicine prices across platforms."""
         ctx.write_event_to_stream(
             ProgressEvent(
                 msg=f"Looking up medicine prices for {medicine_name}")
         )
 
-        # todo: API to get medicine prices from all platforms
-        prices = {
-            "Amazon": 10.99,
-            "Walmart": 9.99,
-            "Target": 8.99
-        }
+        matches = medicine_name_index.normalize_all(medicine_name)
+        if len(matches) > 1:
+            names = ", ".join(match.matched for match in matches)
+            return f"{medicine_name} names several medicines ({names}), compare their prices one at a time."
+
+        user_state = await ctx.get("user_state")
+        zip_code = zip_code_from_address(user_state.get("user_address"))
+        match = medicine_name_index.normalize(medicine_name)
+        if match is not None:
+            # quote and cache under the generic name; "viagra 50mg" carries its own dosage
+            medicine_name, dosage = match.canonical, dosage or match.dosage
+        result = await price_comparer.acompare(medicine_name, dosage, zip_code)
+
+        if not result["quotes"]:
+            return f"No prices found for {medicine_name} right now.{medicine_hint(medicine_name)}"
 
         price_str = f"Price for {medicine_name} are:\n"
-        for platform, price in prices.items():
-            price_str += f" {platform}: {price}\n"
+        for quote in result["quotes"]:
+            price_str += f" {quote.provider}: {quote.price}\n"
+        price_str += f"Best price: {result['best'].provider} at {result['best'].price}\n"
+        unavailable = result["failed"] + result["pending"]
+        if unavailable:
+            price_str += f"Not available right now: {', '.join(unavailable)}\n"
 
         return price_str
 
@@ -124,25 +183,42 @@ def get_medicine_tools() -> list[BaseTool]:
         return message + ' ' + copay_availed_msg if copay_available else message
 
     return [
-        FunctionToolWithContext.from_defaults(fn=lookup_medicine_info),
-        FunctionToolWithContext.from_defaults(fn=compare_medicine_prices),
+        FunctionToolWithContext.from_defaults(async_fn=lookup_medicine_info),
+        FunctionToolWithContext.from_defaults(async_fn=lookup_medicines_info),
+        FunctionToolWithContext.from_defaults(async_fn=compare_medicine_prices),
         FunctionToolWithContext.from_defaults(fn=is_prescription_valid),
         FunctionToolWithContext.from_defaults(async_fn=buy_medicines),
     ]
 
 
 def get_patient_support_tools() -> list[BaseTool]:
-    async def find_doctor(ctx: Context, address: str) -> str:
-        """Useful for finding a doctor for a medicine."""
+    async def find_doctor(ctx: Context, address: Optional[str] = None, specialty: Optional[str] = None) -> str:
+        """Useful for finding doctors near an address (defaults to the user's), optionally of a specialty such as cardiology."""
         user_state = await ctx.get("user_state")
-        user_address = user_state['user_address']
+        address = address or user_state.get('user_address')
+        if not address:
+            return "No address is known for the user. Please ask for their zip code."
 
         ctx.write_event_to_stream(
-            ProgressEvent(msg=f"Finding a doctor near {user_address}...")
+            ProgressEvent(msg=f"Finding a doctor near {address}...")
+        )
+
+        directory = await asyncio.to_thread(get_doctor_directory)
+        if directory is None:
+            return "The doctor directory is not available right now."
+
+        location = await asyncio.to_thread(geocoder.geocode, address)
+        if location is None:
+            return f"Could not locate {address}. Please provide a zip code."
+
+        doctors = directory.nearest(*location, k=3, specialty=specialty)
+        if not doctors:
+            return f"No {specialty} doctors found. Known specialties: {', '.join(directory.specialty_names)}."
+
+        return f"Doctors near {address}:\n" + "\n".join(
+            f" {doctor.name} ({doctor.specialty}), {doctor.address}, {doctor.distance_km} km away"
+            for doctor in doctors
         )
-        
-        # todo: find nearby doctors
-        return f"Dr. Smith is a doctor near {user_address}."
 
     return [
         FunctionToolWithContext.from_defaults(async_fn=find_doctor),
@@ -269,6 +345,7 @@ You are a helpful assistant specialized in assisting users with medicine-related
 Guidelines:
 - For general questions, use the `lookup_generic_info` tool.
 - For medicine lookup, only use the `lookup_medicine_info` tool and do not add extenal information, even if it appears unusual.
+- To look up several medicines at once, use the `lookup_medicines_info` tool with all their names in one call.
 - For comparing prices, provide a detailed price comparison using the `compare_medicine_prices` tool.
 - For buying medicines, perform below steps in strict order:
   1) Ensure the user provides a username, password, and delivery address.
@@ -276,6 +353,13 @@ Guidelines:
   3) Confirm the order and provide the user with delivery details.
             """,
             tools=get_medicine_tools(),
+            example_utterances=[
+                "What is sildenafil used for?",
+                "Tell me about the side effects of this medicine",
+                "Compare prices for atorvastatin",
+                "Where can I buy my prescription cheapest?",
+                "I want to order my prescribed medicines",
+            ],
         ),
         AgentConfig(
             name="Patient Support Agent",
@@ -283,9 +367,15 @@ Guidelines:
             system_prompt="""
 You are a helpful assistant that is helping patient to find nearby doctors.
 To do this, the user must supply you with a username, a valid password and user_address. You can ask them to supply these. If the user supplies a username, password and user_address, call the tool "login" to log them in.
+Use the `find_doctor` tool to find nearby doctors, passing a specialty if the user asks for one (e.g. cardiology).
 Once the user is logged in and authenticated, you can transfer them to another agent.
             """,
             tools=get_patient_support_tools(),
+            example_utterances=[
+                "Find a doctor near me",
+                "I need a cardiologist close to my home",
+                "Are there any clinics nearby?",
+            ],
         ),
         AgentConfig(
             name="Authentication Agent",
@@ -298,6 +388,10 @@ If the user supplies a username and password, call the tool "login" to log them
 Once the user is logged in and authenticated, you can transfer them to another agent.
             """,
             tools=get_authentication_tools(),
+            example_utterances=[
+                "I want to log in",
+                "Here is my username and password",
+            ],
         ),
         AgentConfig(
             name="Account Balance Agent",
@@ -311,5 +405,10 @@ If they aren't authenticated, tell them to authenticate first and call the "Requ
 If they're trying to transfer money, they have to check their account balance first, which you can help with.
             """,
             tools=get_account_balance_tools(),
+            example_utterances=[
+                "What is my account balance?",
+                "How much money is left in my account?",
+            ],
+            router_requires_state=["session_token"],
         )
     ]
@@ -0,0 +1,123 @@
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "2048"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "86400"))
+# cosine similarity above which a differently worded query reuses an answer;
+# unset disables the embedding tier
+ANSWER_CACHE_SIMILARITY = os.getenv("ANSWER_CACHE_SIMILARITY")
+
+
+def normalize_query(query: str) -> str:
+    return re.sub(r"\s+", " ", query).strip().strip("?.!").lower()
+
+
+class AnswerCache:
+    """
+    Cache of synthesized answers.
+
+    Entries are looked up by scope (e.g. the drug filter a query ran with)
+    and normalized query and, optionally, by embedding similarity within the
+    same scope. Entries expire after `ttl` seconds, the least recently used
+    ones are evicted beyond `max_entries`, and everything is dropped as soon
+    as a lookup is made against a newer index version. Lookups and answers
+    from an older version, e.g. a request that started before a reload, are
+    ignored.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = ANSWER_CACHE_MAX_ENTRIES,
+        ttl: float = ANSWER_CACHE_TTL,
+        similarity_threshold: float | None = None,
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similarity_threshold = similarity_threshold
+        self._entries = OrderedDict()
+        self._version = None
+        self._lock = threading.Lock()
+        self._stats = {"exact_hits": 0, "similar_hits": 0, "misses": 0, "evictions": 0}
+
+    def _sync_version(self, version) -> bool:
+        """Moves to `version` if it is newer; False if it is older than the cached one."""
+        if self._version is not None and version < self._version:
+            return False
+        if version != self._version:
+            self._entries.clear()
+            self._version = version
+        return True
+
+    def _expired(self, entry):
+        return time.monotonic() - entry["created"] > self.ttl
+
+    def _similar(self, embedding, scope):
+        keys = [
+            key for key, entry in self._entries.items()
+            if key[0] == scope and entry["embedding"] is not None
+        ]
+        if not keys:
+            return None
+        matrix = np.array([self._entries[key]["embedding"] for key in keys], dtype="float32")
+        query = np.asarray(embedding, dtype="float32")
+        scores = matrix @ query / (np.linalg.norm(matrix, axis=1) * np.linalg.norm(query) + 1e-9)
+        best = int(np.argmax(scores))
+        return keys[best] if scores[best] >= self.similarity_threshold else None
+
+    def get(self, query: str, version: int, embedding=None, scope: str | None = None) -> str | None:
+        key = (scope, normalize_query(query))
+        with self._lock:
+            if not self._sync_version(version):
+                self._stats["misses"] += 1
+                return None
+            tier = "exact_hits"
+            if key not in self._entries and embedding is not None and self.similarity_threshold:
+                key = self._similar(embedding, scope)
+                tier = "similar_hits"
+
+            entry = self._entries.get(key)
+            if entry is not None and self._expired(entry):
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self._stats["misses"] += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self._stats[tier] += 1
+            return entry["answer"]
+
+    def put(self, query: str, version: int, answer: str, embedding=None, scope: str | None = None) -> None:
+        key = (scope, normalize_query(query))
+        with self._lock:
+            if not self._sync_version(version):
+                return
+            self._entries[key] = {
+                "answer": answer,
+                "embedding": embedding,
+                "created": time.monotonic(),
+            }
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self._stats["exact_hits"] + self._stats["similar_hits"] + self._stats["misses"]
+            hits = lookups - self._stats["misses"]
+            return {
+                **self._stats,
+                "entries": len(self._entries),
+                "hit_rate": round(hits / lookups, 3) if lookups else 0.0,
+            }
+
+
+answer_cache = AnswerCache(
+    similarity_threshold=float(ANSWER_CACHE_SIMILARITY) if ANSWER_CACHE_SIMILARITY else None
+)
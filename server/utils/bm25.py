@@ -0,0 +1,215 @@
+import json
+import math
+import os
+import re
+
+import numpy as np
+
+BM25_K1 = float(os.getenv("BM25_K1", "1.2"))
+BM25_B = float(os.getenv("BM25_B", "0.75"))
+# rank constant of reciprocal-rank fusion; larger values flatten the rank weights
+RRF_K = int(os.getenv("RRF_K", "60"))
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[-./][a-z0-9]+)*")
+TOKEN_PART_PATTERN = re.compile(r"[a-z]+|\d+(?:\.\d+)?")
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "can", "do", "does", "for", "from", "how", "i", "if",
+    "in", "is", "it", "me", "my", "no", "not", "of", "on", "or", "should", "that", "the", "their", "this",
+    "to", "was", "what", "when", "which", "who", "why", "will", "with", "you", "your",
+}
+
+
+def tokenize(text: str) -> list[str]:
+    """
+    Lowercased word tokens without stopwords.
+
+    Codes and dosages are kept whole and also split into their parts, so
+    "0069-4200-30" and "50mg" match both as written and as "4200" or "50 mg".
+    """
+    tokens = []
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        if token in STOPWORDS:
+            continue
+        tokens.append(token)
+        parts = TOKEN_PART_PATTERN.findall(token)
+        if len(parts) > 1:
+            tokens.extend(part for part in parts if part not in STOPWORDS)
+    return tokens
+
+
+def reciprocal_rank_fusion(rankings: list[list[int]], k: int = RRF_K) -> list[tuple[int, float]]:
+    """Merges ranked id lists by summing 1 / (k + rank); returns (id, score) best first."""
+    scores = {}
+    for ranking in rankings:
+        for rank, id_ in enumerate(ranking, 1):
+            scores[id_] = scores.get(id_, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+
+
+class BM25Index:
+    """
+    In-memory inverted index scoring documents with Okapi BM25.
+
+    Documents are identified by integer ids (the faiss ids of their nodes)
+    and can be added and removed incrementally; postings are turned into
+    arrays lazily per term and only a changed term's arrays are rebuilt.
+    Once saved, later changes are appended to a log next to the file, which
+    is folded back into the file when it outgrows the index.
+    """
+
+    def __init__(self, k1: float = BM25_K1, b: float = BM25_B):
+        self.k1 = k1
+        self.b = b
+        # term -> {id: term frequency}
+        self._postings = {}
+        # id -> number of tokens
+        self._lengths = {}
+        self._total_length = 0
+        # term -> (ids, tfs) arrays; None -> token counts indexed by id
+        self._arrays = {}
+        # file this index was last saved to or loaded from, changes since then and entries in its log
+        self._path = None
+        self._changes = []
+        self._logged = 0
+
+    def __len__(self):
+        return len(self._lengths)
+
+    def add(self, id_: int, text: str):
+        if id_ in self._lengths:
+            raise ValueError(f"Document {id_} is already in the BM25 index.")
+        counts = {}
+        for token in tokenize(text):
+            counts[token] = counts.get(token, 0) + 1
+        self._add_counts(id_, counts)
+
+    def _add_counts(self, id_, counts):
+        length = sum(counts.values())
+        self._lengths[id_] = length
+        self._total_length += length
+        for token, count in counts.items():
+            self._postings.setdefault(token, {})[id_] = count
+            self._arrays.pop(token, None)
+        self._arrays.pop(None, None)
+        if self._path:
+            self._changes.append(["add", id_, counts])
+
+    def remove(self, id_: int, text: str):
+        """Removes document `id_`; `text` must be the text it was added with."""
+        if id_ in self._lengths:
+            self._remove_terms(id_, sorted(set(tokenize(text))))
+
+    def _remove_terms(self, id_, terms):
+        self._total_length -= self._lengths.pop(id_)
+        for token in terms:
+            postings = self._postings.get(token)
+            if postings is not None:
+                postings.pop(id_, None)
+                if not postings:
+                    del self._postings[token]
+            self._arrays.pop(token, None)
+        self._arrays.pop(None, None)
+        if self._path:
+            self._changes.append(["remove", id_, terms])
+
+    def _term_arrays(self, term):
+        arrays = self._arrays.get(term)
+        if arrays is None:
+            postings = self._postings.get(term, {})
+            arrays = (
+                np.fromiter(postings.keys(), dtype="int64", count=len(postings)),
+                np.fromiter(postings.values(), dtype="float32", count=len(postings)),
+            )
+            self._arrays[term] = arrays
+        return arrays
+
+    def _length_array(self):
+        lengths = self._arrays.get(None)
+        if lengths is None:
+            lengths = np.zeros(max(self._lengths) + 1, dtype="float32")
+            lengths[list(self._lengths)] = list(self._lengths.values())
+            self._arrays[None] = lengths
+        return lengths
+
+    def search(self, query: str, top_k: int, ids: np.ndarray | None = None) -> list[tuple[int, float]]:
+        """Returns the top_k (id, score) pairs for query, only among `ids` if given."""
+        if not self._lengths:
+            return []
+        num_docs = len(self._lengths)
+        avg_length = self._total_length / num_docs or 1.0
+        lengths = self._length_array()
+        scores = np.zeros(len(lengths), dtype="float32")
+        for term in set(tokenize(query)):
+            term_ids, tfs = self._term_arrays(term)
+            if not len(term_ids):
+                continue
+            idf = math.log(1 + (num_docs - len(term_ids) + 0.5) / (len(term_ids) + 0.5))
+            norm = self.k1 * (1 - self.b + self.b * lengths[term_ids] / avg_length)
+            scores[term_ids] += idf * tfs * (self.k1 + 1) / (tfs + norm)
+
+        if ids is not None:
+            allowed = np.zeros(len(scores), dtype=bool)
+            allowed[ids[ids < len(scores)]] = True
+            scores[~allowed] = 0
+        matched = np.flatnonzero(scores)
+        if len(matched) > top_k:
+            matched = matched[np.argpartition(-scores[matched], top_k - 1)[:top_k]]
+        order = sorted(matched.tolist(), key=lambda id_: (-scores[id_], id_))
+        return [(id_, float(scores[id_])) for id_ in order]
+
+    def to_dict(self) -> dict:
+        return {
+            "lengths": [[id_, length] for id_, length in self._lengths.items()],
+            "postings": {
+                term: [list(postings.keys()), list(postings.values())] for term, postings in self._postings.items()
+            },
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "BM25Index":
+        index = cls()
+        index._lengths = {id_: length for id_, length in data["lengths"]}
+        index._total_length = sum(index._lengths.values())
+        index._postings = {term: dict(zip(ids, tfs)) for term, (ids, tfs) in data["postings"].items()}
+        return index
+
+    def save(self, path: str):
+        """
+        Saves the index to path. If it was last saved to or loaded from the
+        same path, only the changes since are appended to the log.
+        """
+        log_path = path + ".log"
+        # rewriting the file once the log holds as many entries as there are
+        # documents keeps saves amortized O(changes)
+        if path == self._path and self._logged + len(self._changes) <= len(self._lengths):
+            with open(log_path, "a") as f:
+                f.writelines(json.dumps(change) + "\n" for change in self._changes)
+            self._logged += len(self._changes)
+        else:
+            with open(path, "w") as f:
+                json.dump(self.to_dict(), f)
+            if os.path.exists(log_path):
+                os.remove(log_path)
+            self._path, self._logged = path, 0
+        self._changes = []
+
+    @classmethod
+    def load(cls, path: str) -> "BM25Index":
+        """Loads an index saved with `save`, replaying its log."""
+        with open(path, "r") as f:
+            index = cls.from_dict(json.load(f))
+        log_path = path + ".log"
+        if os.path.exists(log_path):
+            with open(log_path, "r") as f:
+                for line in f:
+                    # a line cut short by a crash mid-save is dropped
+                    if not line.endswith("\n"):
+                        break
+                    action, id_, data = json.loads(line)
+                    if action == "add":
+                        index._add_counts(id_, data)
+                    else:
+                        index._remove_terms(id_, data)
+                    index._logged += 1
+        index._path = path
+        return index
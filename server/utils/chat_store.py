@@ -0,0 +1,96 @@
+import json
+import os
+import threading
+
+from llama_index.core.llms import ChatMessage, MessageRole
+from llama_index.core.memory import ChatMemoryBuffer
+
+CHAT_DIR = os.getenv("CHAT_DIR", "server/memory")
+# a journal is compacted down to CHAT_KEEP_MESSAGES once it grows past this many bytes
+CHAT_COMPACT_BYTES = int(os.getenv("CHAT_COMPACT_BYTES", str(1 << 20)))
+CHAT_KEEP_MESSAGES = int(os.getenv("CHAT_KEEP_MESSAGES", "200"))
+# the single shared conversation kept before there were sessions, and the session it moves to
+LEGACY_CHAT_PATH = os.getenv("LEGACY_CHAT_PATH", "server/memory.json")
+LEGACY_SESSION_ID = os.getenv("LEGACY_SESSION_ID", "legacy-session")
+
+
+class ChatJournal:
+    """
+    Append-only chat history, one JSONL file per session.
+
+    Messages are appended as they arrive, so nothing is lost on a crash and
+    nothing is re-serialized. `compact` rewrites a journal to its most recent
+    messages once it grows past `compact_bytes`.
+    """
+
+    def __init__(
+        self,
+        chat_dir: str = CHAT_DIR,
+        compact_bytes: int = CHAT_COMPACT_BYTES,
+        keep_messages: int = CHAT_KEEP_MESSAGES,
+    ):
+        self.chat_dir = chat_dir
+        self.compact_bytes = compact_bytes
+        self.keep_messages = keep_messages
+        self._lock = threading.Lock()
+
+    def _path(self, session_id: str) -> str:
+        return os.path.join(self.chat_dir, f"{session_id}.jsonl")
+
+    def load(self, session_id: str) -> list[ChatMessage]:
+        path = self._path(session_id)
+        messages = []
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                for line in f:
+                    # a crash mid-append can leave a partial line behind
+                    try:
+                        messages.append(ChatMessage.model_validate_json(line))
+                    except ValueError:
+                        continue
+        return messages
+
+    def append(self, session_id: str, messages: list[ChatMessage]) -> None:
+        if not messages:
+            return
+        os.makedirs(self.chat_dir, exist_ok=True)
+        lines = "".join(message.model_dump_json() + "\n" for message in messages)
+        with self._lock:
+            with open(self._path(session_id), "a") as f:
+                f.write(lines)
+
+    def compact(self, session_id: str, force: bool = False) -> bool:
+        """Rewrites the journal with only its most recent messages, returns True if it did."""
+        path = self._path(session_id)
+        if not os.path.exists(path):
+            return False
+        if not force and os.path.getsize(path) < self.compact_bytes:
+            return False
+        with self._lock:
+            messages = self.load(session_id)[-self.keep_messages:]
+            # start on a user turn, not on tool results whose call was cut off
+            while messages and messages[0].role != MessageRole.USER:
+                messages.pop(0)
+            tmp_path = path + ".tmp"
+            with open(tmp_path, "w") as f:
+                f.writelines(message.model_dump_json() + "\n" for message in messages)
+            os.replace(tmp_path, path)
+        return True
+
+    def migrate_legacy(self, path: str = LEGACY_CHAT_PATH, session_id: str = LEGACY_SESSION_ID) -> int:
+        """
+        Moves the history of the old shared memory.json into the journal of
+        `session_id`, and renames the file so it only happens once. Returns
+        the number of messages moved.
+        """
+        if not os.path.exists(path):
+            return 0
+        with open(path, "r") as f:
+            messages = ChatMemoryBuffer.from_dict(json.load(f)).get_all()
+        self.append(session_id, messages)
+        os.replace(path, path + ".migrated")
+        print(f"moved {len(messages)} messages of {path} to session {session_id}.")
+        return len(messages)
+
+
+chat_journal = ChatJournal()
@@ -0,0 +1,295 @@
+import hashlib
+import os
+import re
+from collections import Counter
+from typing import NamedTuple
+from urllib.parse import urlparse
+
+from llama_index.core.bridge.pydantic import Field, PrivateAttr
+from llama_index.core.node_parser import SentenceSplitter
+from llama_index.core.node_parser.node_utils import build_nodes_from_splits
+from llama_index.core.schema import TransformComponent
+from llama_index.core.utils import get_tokenizer
+
+# token budget of a chunk
+CHUNK_TOKENS = int(os.getenv("CHUNK_TOKENS", "768"))
+# sections shorter than this share a chunk with the following ones
+CHUNK_MIN_TOKENS = int(os.getenv("CHUNK_MIN_TOKENS", "96"))
+# overlap between the windows a single oversized paragraph is cut into
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "32"))
+# a line on at least this many pages, and this share of the pages, of one source is boilerplate
+BOILERPLATE_MIN_PAGES = 3
+BOILERPLATE_MIN_SHARE = 0.5
+
+MARKDOWN_HEADING_PATTERN = re.compile(r"^(#{1,6})\s+(.+?)\s*#*\s*$")
+MARKDOWN_TABLE_PATTERN = re.compile(r"^\s*\|?.*\S\s*\|\s*\S.*$")
+LIST_ITEM_PATTERN = re.compile(r"^\s*(?:[*+-]|\d+[.)])\s+")
+PAGE_NUMBER_PATTERN = re.compile(r"^\s*(?:page\s*)?\d{1,4}(?:\s*(?:of|/)\s*\d{1,4})?\s*$", re.IGNORECASE)
+NUMERIC_CELL_PATTERN = re.compile(r"^[<>±~]?\(?-?\d[\d.,]*\)?(?:%|mg|mcg|ml|h|hr|n)?$", re.IGNORECASE)
+
+
+class Block(NamedTuple):
+    # "heading", "paragraph", "table" or "faq"
+    kind: str
+    text: str
+    level: int = 0
+
+
+def _strip_markup(line):
+    return LIST_ITEM_PATTERN.sub("", line).strip().strip("*_").strip()
+
+
+def _is_table_line(line):
+    if "|" in line and MARKDOWN_TABLE_PATTERN.match(line):
+        return True
+    cells = line.split()
+    numeric = sum(bool(NUMERIC_CELL_PATTERN.match(cell)) for cell in cells)
+    return len(cells) >= 3 and numeric * 2 >= len(cells)
+
+
+def _ends_sentence(line):
+    return line is None or line.rstrip()[-1:] in ".:?!"
+
+
+def _is_question(line, previous_line, markdown):
+    """A line opening an FAQ entry: a bold question in markdown, a question starting a paragraph in plain text."""
+    text = _strip_markup(line)
+    if not text.endswith("?") or not 3 <= len(text) <= 200:
+        return False
+    if markdown:
+        return LIST_ITEM_PATTERN.sub("", line).strip().startswith(("**", "__"))
+    return _ends_sentence(previous_line)
+
+
+def _heading_level(line, previous_line, markdown):
+    """Heading level of a line, 0 if it isn't one; plain text headings are guessed from their shape."""
+    match = MARKDOWN_HEADING_PATTERN.match(line)
+    if match or markdown:
+        return len(match.group(1)) if match else 0
+    text = line.strip()
+    words = text.split()
+    if not 1 <= len(words) <= 8 or len(text) > 60 or not text[0].isupper() or text[-1] in ".,;:?!)":
+        return 0
+    letters = [char for char in text if char.isalpha()]
+    if len(letters) < 4:
+        return 0
+    # all caps, with a real word so formulas like "HOOC OH" don't count
+    if sum(char.isupper() for char in letters) >= 0.8 * len(letters):
+        return 1 if any(len(word) >= 5 and word.isalpha() for word in words) else 0
+    # a short title-case line right after a finished sentence, e.g. "Pharmacodynamics"
+    if _ends_sentence(previous_line):
+        return 2
+    return 0
+
+
+def parse_blocks(text: str) -> list[Block]:
+    """
+    Splits text into headings, paragraphs, tables and FAQ entries.
+
+    Works on markdown (converted HTML) and on text extracted from PDFs, where
+    a paragraph ends at a line that finishes a sentence well short of the
+    usual line width.
+    """
+    lines = [line.rstrip() for line in text.splitlines()]
+    markdown = any(MARKDOWN_HEADING_PATTERN.match(line) for line in lines)
+    lengths = sorted(len(line) for line in lines if line.strip())
+    width = lengths[int(len(lengths) * 0.9)] if lengths else 0
+
+    blocks, current, kind = [], [], None
+
+    def flush():
+        nonlocal current, kind
+        if current:
+            blocks.append(Block(kind, "\n".join(current).strip()))
+        current, kind = [], None
+
+    previous = None
+    for line in lines:
+        if not line.strip():
+            # blank lines end paragraphs and tables; an FAQ answer may span several paragraphs
+            if kind != "faq":
+                flush()
+            previous = None
+            continue
+
+        question = _is_question(line, previous, markdown)
+        level = 0 if kind == "table" or _is_table_line(line) else _heading_level(line, previous, markdown)
+        if level and not question:
+            flush()
+            blocks.append(Block("heading", _strip_markup(line.lstrip("#")), level))
+        elif question:
+            flush()
+            current, kind = [line], "faq"
+        elif _is_table_line(line):
+            if kind not in ("table", "faq"):
+                flush()
+                kind = "table"
+            current.append(line)
+        else:
+            if kind == "table":
+                flush()
+            kind = kind or "paragraph"
+            current.append(line)
+            if kind == "paragraph" and line[-1] in ".!?" and len(line) < 0.8 * width:
+                flush()
+        previous = line
+    flush()
+    return [block for block in blocks if block.text]
+
+
+def _normalize_line(line):
+    return " ".join(line.split()).lower()
+
+
+def boilerplate_lines(page_texts: list[str]) -> set[str]:
+    """Normalized lines that repeat across most pages of a source, e.g. headers, footers and nav bars."""
+    if len(page_texts) < BOILERPLATE_MIN_PAGES:
+        return set()
+    counts = Counter()
+    for text in page_texts:
+        counts.update({_normalize_line(line) for line in text.splitlines() if line.strip()})
+    min_pages = max(BOILERPLATE_MIN_PAGES, BOILERPLATE_MIN_SHARE * len(page_texts))
+    return {line for line, count in counts.items() if count >= min_pages}
+
+
+def _strip_page(text, boilerplate):
+    lines = [line for line in text.splitlines() if _normalize_line(line) not in boilerplate]
+    # page numbers printed at the top or bottom of a page
+    content = [i for i, line in enumerate(lines) if line.strip()]
+    for i in content[:1] + content[-1:]:
+        if PAGE_NUMBER_PATTERN.match(lines[i]):
+            lines[i] = ""
+    return "\n".join(lines)
+
+
+def _source_of(doc):
+    """Pages of one file, or pages of one website, share their boilerplate."""
+    if doc.metadata.get("file_path"):
+        return doc.metadata["file_path"]
+    parsed = urlparse(doc.metadata.get("source") or doc.get_doc_id())
+    return parsed.netloc or doc.get_doc_id()
+
+
+def _document_of(doc):
+    """Pages of one file are chunked together, any other document on its own."""
+    return doc.metadata.get("file_path") or doc.get_doc_id()
+
+
+class StructuredChunker(TransformComponent):
+    """
+    Chunks documents along their structure instead of at fixed sizes.
+
+    Lines repeating across the pages of a file or website are dropped, and
+    so are paragraphs, tables and FAQ entries repeated within one file or
+    page. Each file or web page is then parsed into headings, paragraphs,
+    tables and FAQ entries, which are packed into chunks of up to
+    `chunk_tokens` without being cut, across the page breaks of a file; a
+    chunk belongs to the page it starts on and never spans two files or web
+    pages. A chunk starts at a heading once it has `min_tokens`, and one
+    continuing a section repeats the section's heading. Only blocks larger
+    than a chunk are split, by sentence. Each node's heading path is kept in
+    its "section" metadata.
+    """
+
+    chunk_tokens: int = Field(default=CHUNK_TOKENS)
+    min_tokens: int = Field(default=CHUNK_MIN_TOKENS)
+    overlap_tokens: int = Field(default=CHUNK_OVERLAP_TOKENS)
+    _tokenizer = PrivateAttr()
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._tokenizer = get_tokenizer()
+
+    def _count(self, text):
+        return len(self._tokenizer(text))
+
+    def _split_oversized(self, block):
+        if block.kind == "table":
+            # cut between rows, repeating a markdown table's header in every piece
+            rows = block.text.splitlines()
+            header = rows[:2] if len(rows) > 2 and set(rows[1].strip()) <= set("|-: ") else []
+            pieces, piece = [], list(header)
+            for row in rows[len(header):]:
+                if len(piece) > len(header) and self._count("\n".join(piece + [row])) > self.chunk_tokens:
+                    pieces.append("\n".join(piece))
+                    piece = list(header)
+                piece.append(row)
+            pieces.append("\n".join(piece))
+            return pieces
+        splitter = SentenceSplitter(chunk_size=self.chunk_tokens, chunk_overlap=self.overlap_tokens)
+        return splitter.split_text(block.text)
+
+    def _chunk_blocks(self, blocks):
+        """Yields (section path, text, document of its first block) chunks from the (document, block) pairs of a source."""
+        # (heading, level) pairs above the current block
+        path = []
+        chunk, chunk_tokens, chunk_path, chunk_doc = [], 0, [], None
+
+        def finish():
+            nonlocal chunk, chunk_tokens, chunk_path, chunk_doc
+            if any(kind != "heading" for kind, _ in chunk):
+                yield " > ".join(chunk_path), "\n\n".join(text for _, text in chunk), chunk_doc
+            chunk, chunk_tokens, chunk_path, chunk_doc = [], 0, [], None
+
+        for doc, block in blocks:
+            if block.kind == "heading":
+                if chunk_tokens >= self.min_tokens:
+                    yield from finish()
+                path[:] = [(text, level) for text, level in path if level < block.level] + [(block.text, block.level)]
+                if not chunk_path:
+                    chunk_path = [text for text, _ in path]
+                chunk_doc = chunk_doc or doc
+                chunk.append(("heading", block.text))
+                chunk_tokens += self._count(block.text)
+                continue
+
+            tokens = self._count(block.text)
+            pieces = [block.text] if tokens <= self.chunk_tokens else self._split_oversized(block)
+            for piece in pieces:
+                piece_tokens = tokens if len(pieces) == 1 else self._count(piece)
+                if chunk and chunk_tokens + piece_tokens > self.chunk_tokens:
+                    yield from finish()
+                if not chunk:
+                    # a chunk continuing a section repeats its heading
+                    chunk_path = [text for text, _ in path]
+                    if path:
+                        chunk.append(("heading", path[-1][0]))
+                        chunk_tokens += self._count(path[-1][0])
+                chunk_doc = chunk_doc or doc
+                chunk.append((block.kind, piece))
+                chunk_tokens += piece_tokens
+        yield from finish()
+
+    def __call__(self, nodes, **kwargs):
+        by_source = {}
+        for doc in nodes:
+            by_source.setdefault(_source_of(doc), []).append(doc)
+        boilerplate = {source: boilerplate_lines([doc.text for doc in docs]) for source, docs in by_source.items()}
+
+        by_document = {}
+        for doc in nodes:
+            by_document.setdefault(_document_of(doc), []).append(doc)
+
+        chunked = []
+        for docs in by_document.values():
+            # the pages of a file are chunked as one text, so sections run across pages;
+            # a block repeated in the same file or page is only kept once
+            seen_blocks = set()
+            blocks = []
+            for doc in docs:
+                for block in parse_blocks(_strip_page(doc.text, boilerplate[_source_of(doc)])):
+                    if block.kind != "heading":
+                        digest = hashlib.sha1(_normalize_line(block.text).encode("utf-8")).digest()
+                        if digest in seen_blocks:
+                            continue
+                        seen_blocks.add(digest)
+                    blocks.append((doc, block))
+
+            for section, text, doc in self._chunk_blocks(blocks):
+                node = build_nodes_from_splits([text], doc)[0]
+                node.metadata = {**doc.metadata, "section": section}
+                # the chunk text already starts with its heading
+                node.excluded_embed_metadata_keys = [*doc.excluded_embed_metadata_keys, "section"]
+                node.excluded_llm_metadata_keys = [*doc.excluded_llm_metadata_keys, "section"]
+                chunked.append(node)
+        return chunked
@@ -0,0 +1,120 @@
+import asyncio
+import hashlib
+import os
+
+from llama_index.core.llms import LLM, ChatMessage, MessageRole
+from llama_index.core.utils import get_tokenizer
+from llama_index.core.workflow import Context
+
+# max tokens of system prompt + history sent to the LLM per call
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+# previous turns kept verbatim (minus tool calls) before older ones are summarized
+CONTEXT_KEEP_TURNS = int(os.getenv("CONTEXT_KEEP_TURNS", "3"))
+
+SUMMARY_PROMPT = (
+    "Condense the conversation below into a short summary for the assistant. "
+    "Keep facts needed later: user details, medicines, dosages, prices, orders and open questions.\n\n"
+    "Current summary:\n{summary}\n\n"
+    "New messages:\n{messages}\n\n"
+    "Updated summary:"
+)
+
+
+def _fingerprint(message: ChatMessage) -> str:
+    return hashlib.sha1(f"{message.role.value}:{message.content}".encode()).hexdigest()
+
+
+def _is_tool_noise(message: ChatMessage) -> bool:
+    return message.role == MessageRole.TOOL or bool(message.additional_kwargs.get("tool_calls"))
+
+
+def split_turns(chat_history: list[ChatMessage]) -> list[list[ChatMessage]]:
+    """Splits the history into turns, each starting at a user message."""
+    turns = []
+    for message in chat_history:
+        if message.role == MessageRole.USER or not turns:
+            turns.append([])
+        turns[-1].append(message)
+    return turns
+
+
+class SummaryState:
+    def __init__(self):
+        self.summary = ""
+        self.summarized = set()
+        self.task = None
+
+
+class ContextCompactor:
+    """
+    Builds the LLM input for a step under a token budget.
+
+    The current turn is always sent verbatim. Tool calls and results of
+    previous turns are dropped, the last `keep_turns` of them are kept, and
+    older turns are folded into a running summary that is updated in the
+    background, so no call waits on summarization.
+    """
+
+    def __init__(self, token_budget: int = CONTEXT_TOKEN_BUDGET, keep_turns: int = CONTEXT_KEEP_TURNS):
+        self.token_budget = token_budget
+        self.keep_turns = keep_turns
+        self._tokenizer = get_tokenizer()
+
+    def count_tokens(self, message: ChatMessage) -> int:
+        # ~4 tokens of per-message overhead in the chat format
+        return len(self._tokenizer(message.content or "")) + 4
+
+    async def _get_state(self, ctx: Context) -> SummaryState:
+        state = await ctx.get("context_summary", default=None)
+        if state is None:
+            state = SummaryState()
+            await ctx.set("context_summary", state)
+        return state
+
+    async def _summarize(self, llm: LLM, state: SummaryState, messages: list[ChatMessage]) -> None:
+        try:
+            transcript = "\n".join(f"{m.role.value}: {m.content}" for m in messages)
+            response = await llm.achat([
+                ChatMessage(
+                    role="user",
+                    content=SUMMARY_PROMPT.format(summary=state.summary or "(none)", messages=transcript),
+                )
+            ])
+            state.summary = (response.message.content or "").strip()
+            state.summarized.update(_fingerprint(m) for m in messages)
+        except Exception as e:
+            print(f"failed to summarize chat history: {e}")
+        finally:
+            state.task = None
+
+    async def build_llm_input(
+        self, ctx: Context, llm: LLM, system_prompt: str, chat_history: list[ChatMessage]
+    ) -> list[ChatMessage]:
+        state = await self._get_state(ctx)
+        turns = split_turns(chat_history)
+        current = turns[-1] if turns else []
+        previous = [[m for m in turn if not _is_tool_noise(m)] for turn in turns[:-1]]
+        split_at = max(len(previous) - self.keep_turns, 0)
+        recent = [m for turn in previous[split_at:] for m in turn]
+        older = [m for turn in previous[:split_at] for m in turn]
+
+        unsummarized = [m for m in older if _fingerprint(m) not in state.summarized]
+        if unsummarized and state.task is None:
+            state.task = asyncio.create_task(self._summarize(llm, state, unsummarized))
+
+        if state.summary:
+            system_prompt += f"\n\nSummary of the earlier conversation:\n{state.summary}"
+        system_message = ChatMessage(role="system", content=system_prompt)
+
+        # fill what's left of the budget with the newest context first; older
+        # messages the summary doesn't cover yet are sent until it catches up
+        budget = self.token_budget - self.count_tokens(system_message)
+        budget -= sum(self.count_tokens(m) for m in current)
+        kept = []
+        for message in reversed(unsummarized + recent):
+            budget -= self.count_tokens(message)
+            if budget < 0:
+                break
+            kept.append(message)
+
+        return [system_message] + kept[::-1] + current
@@ -0,0 +1,216 @@
+import csv
+import math
+import os
+import threading
+
+import numpy as np
+from pydantic import BaseModel
+
+from server.utils.geo import EARTH_RADIUS_KM, haversine_km
+
+# provider directory with columns id, name, specialty, address, lat, lon (.csv or .parquet)
+DOCTORS_PATH = os.getenv("DOCTORS_PATH", "data/reference/doctors.csv")
+# grid cell size in degrees; 0.1 is ~11 km of latitude
+DOCTOR_GRID_CELL_DEG = float(os.getenv("DOCTOR_GRID_CELL_DEG", "0.1"))
+# past this many rings around the query cell, the rest is searched by brute force
+DOCTOR_GRID_MAX_RINGS = int(os.getenv("DOCTOR_GRID_MAX_RINGS", "64"))
+
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+
+class Doctor(BaseModel):
+    id: str
+    name: str
+    specialty: str
+    address: str
+    lat: float
+    lon: float
+    distance_km: float | None = None
+
+
+class GridIndex:
+    """
+    Points bucketed into a lat/lon grid, sorted by cell.
+
+    Queries scan rings of cells outward from the query's cell and stop once
+    no unscanned cell can hold a closer point than the ones found.
+    """
+
+    def __init__(self, lats: np.ndarray, lons: np.ndarray, rows: np.ndarray, cell_deg: float = DOCTOR_GRID_CELL_DEG):
+        self.cell_deg = cell_deg
+        self.num_rows = math.ceil(180 / cell_deg)
+        self.num_cols = math.ceil(360 / cell_deg)
+        cells = self._cell_keys(lats, lons)
+        order = np.argsort(cells, kind="stable")
+        self.lats, self.lons, self.rows = lats[order], lons[order], rows[order]
+        keys, starts, counts = np.unique(cells[order], return_index=True, return_counts=True)
+        self._cells = dict(zip(keys.tolist(), zip(starts.tolist(), (starts + counts).tolist())))
+
+    def __len__(self):
+        return len(self.rows)
+
+    def _row_col(self, lat, lon):
+        row = np.minimum(((np.asarray(lat) + 90) / self.cell_deg).astype(np.int64), self.num_rows - 1)
+        col = ((np.asarray(lon) + 180) / self.cell_deg).astype(np.int64) % self.num_cols
+        return row, col
+
+    def _cell_keys(self, lats, lons):
+        row, col = self._row_col(lats, lons)
+        return row * self.num_cols + col
+
+    def _ring(self, row, col, r):
+        """Yields (start, end) slices of the cells at Chebyshev distance r from (row, col)."""
+        if r == 0:
+            cells = [(row, col)]
+        else:
+            cells = [(row + dr, col + dc) for dr in (-r, r) for dc in range(-r, r + 1)]
+            cells += [(row + dr, col + dc) for dc in (-r, r) for dr in range(-r + 1, r)]
+        for cell_row, cell_col in cells:
+            if 0 <= cell_row < self.num_rows:
+                span = self._cells.get(cell_row * self.num_cols + cell_col % self.num_cols)
+                if span is not None:
+                    yield span
+
+    def _covered_km(self, lat, r):
+        """Distance within which all points have been scanned after rings 0..r."""
+        # cells narrow towards the poles, so bound by the highest latitude in the block
+        top_lat = min(abs(lat) + (r + 1) * self.cell_deg, 90.0)
+        return r * self.cell_deg * KM_PER_DEGREE * math.cos(math.radians(top_lat))
+
+    def _search(self, lat, lon, done):
+        """Scans rings until `done(positions, distances, covered_km)`; returns what was scanned."""
+        row, col = (int(x) for x in self._row_col(lat, lon))
+        positions, distances = [], []
+        for r in range(min(DOCTOR_GRID_MAX_RINGS, self.num_cols // 2) + 1):
+            spans = list(self._ring(row, col, r))
+            if spans:
+                ring = np.concatenate([np.arange(start, end) for start, end in spans])
+                positions.append(ring)
+                distances.append(haversine_km(lat, lon, self.lats[ring], self.lons[ring]))
+            if positions and done(np.concatenate(distances), self._covered_km(lat, r)):
+                return np.concatenate(positions), np.concatenate(distances)
+        # far from every point: fall back to all of them
+        return np.arange(len(self.rows)), haversine_km(lat, lon, self.lats, self.lons)
+
+    def nearest(self, lat: float, lon: float, k: int, max_km: float | None = None):
+        """Returns the rows and distances of the k nearest points, optionally within max_km."""
+        if not len(self.rows):
+            return np.empty(0, dtype=np.int64), np.empty(0)
+
+        def done(distances, covered_km):
+            if max_km is not None and covered_km >= max_km:
+                return True
+            return len(distances) >= k and np.partition(distances, k - 1)[k - 1] <= covered_km
+
+        positions, distances = self._search(lat, lon, done)
+        if max_km is not None:
+            within = distances <= max_km
+            positions, distances = positions[within], distances[within]
+        top = np.argsort(distances, kind="stable")[:k]
+        return self.rows[positions[top]], distances[top]
+
+    def within(self, lat: float, lon: float, radius_km: float, limit: int | None = None):
+        """Returns the rows and distances of all points within radius_km, nearest first."""
+        if not len(self.rows):
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        positions, distances = self._search(lat, lon, lambda _, covered_km: covered_km >= radius_km)
+        inside = distances <= radius_km
+        positions, distances = positions[inside], distances[inside]
+        order = np.argsort(distances, kind="stable")[:limit]
+        return self.rows[positions[order]], distances[order]
+
+
+def _normalize_specialty(specialty):
+    return " ".join((specialty or "").lower().split())
+
+
+class DoctorDirectory:
+    """Provider directory with a grid index over all providers and one per specialty."""
+
+    def __init__(self, ids, names, specialties, addresses, lats, lons, cell_deg: float = DOCTOR_GRID_CELL_DEG):
+        self.ids, self.names, self.specialties, self.addresses = ids, names, specialties, addresses
+        self.lats = np.asarray(lats, dtype="float64")
+        self.lons = np.asarray(lons, dtype="float64")
+        rows = np.arange(len(ids))
+        self._grids = {None: GridIndex(self.lats, self.lons, rows, cell_deg)}
+
+        keys = np.array([_normalize_specialty(s) for s in specialties])
+        for key in np.unique(keys):
+            subset = rows[keys == key]
+            self._grids[key] = GridIndex(self.lats[subset], self.lons[subset], subset, cell_deg)
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def specialty_names(self):
+        return sorted(key for key in self._grids if key)
+
+    @classmethod
+    def load(cls, path: str = DOCTORS_PATH) -> "DoctorDirectory":
+        if path.endswith(".parquet"):
+            # parquet needs pandas with pyarrow, csv needs nothing extra
+            import pandas as pd
+
+            frame = pd.read_parquet(path, columns=["id", "name", "specialty", "address", "lat", "lon"])
+            columns = {name: frame[name].tolist() for name in ["id", "name", "specialty", "address"]}
+            return cls(
+                [str(i) for i in columns["id"]], columns["name"], columns["specialty"], columns["address"],
+                frame["lat"].to_numpy(), frame["lon"].to_numpy(),
+            )
+
+        ids, names, specialties, addresses, lats, lons = [], [], [], [], [], []
+        with open(path, newline="") as f:
+            for row in csv.DictReader(f):
+                ids.append(row["id"])
+                names.append(row["name"])
+                specialties.append(row["specialty"])
+                addresses.append(row["address"])
+                lats.append(float(row["lat"]))
+                lons.append(float(row["lon"]))
+        return cls(ids, names, specialties, addresses, lats, lons)
+
+    def _grid(self, specialty):
+        if not specialty:
+            return self._grids[None]
+        return self._grids.get(_normalize_specialty(specialty))
+
+    def _doctors(self, rows, distances):
+        return [
+            Doctor(
+                id=self.ids[row],
+                name=self.names[row],
+                specialty=self.specialties[row],
+                address=self.addresses[row],
+                lat=float(self.lats[row]),
+                lon=float(self.lons[row]),
+                distance_km=round(float(distance), 2),
+            )
+            for row, distance in zip(rows, distances)
+        ]
+
+    def nearest(self, lat: float, lon: float, k: int = 5, specialty: str | None = None, max_km: float | None = None) -> list[Doctor]:
+        grid = self._grid(specialty)
+        if grid is None:
+            return []
+        return self._doctors(*grid.nearest(lat, lon, k, max_km=max_km))
+
+    def within(self, lat: float, lon: float, radius_km: float, specialty: str | None = None, limit: int | None = None) -> list[Doctor]:
+        grid = self._grid(specialty)
+        if grid is None:
+            return []
+        return self._doctors(*grid.within(lat, lon, radius_km, limit=limit))
+
+
+_directory = None
+_directory_lock = threading.Lock()
+
+
+def get_doctor_directory() -> DoctorDirectory | None:
+    """Loads the directory at DOCTORS_PATH once; None if there is no directory file."""
+    global _directory
+    if _directory is None:
+        with _directory_lock:
+            if _directory is None and os.path.exists(DOCTORS_PATH):
+                _directory = DoctorDirectory.load(DOCTORS_PATH)
+    return _directory
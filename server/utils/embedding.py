@@ -1,10 +1,24 @@
+import asyncio
+import contextlib
+import hashlib
+import itertools
 import json
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from urllib.parse import urlparse
 
 import faiss
-from llama_index.core import SimpleDirectoryReader
+from llama_index.core import Settings, SimpleDirectoryReader
 from llama_index.core import StorageContext, VectorStoreIndex
+from llama_index.core.ingestion import run_transformations
+from llama_index.core.constants import DEFAULT_SIMILARITY_TOP_K
+from llama_index.core.schema import MetadataMode, NodeWithScore, QueryBundle
+from llama_index.core.vector_stores.types import ExactMatchFilter, MetadataFilters
 from llama_index.vector_stores.faiss import FaissVectorStore
-from llama_index.readers.file import HTMLTagReader
+from llama_index.embeddings.openai import OpenAIEmbedding
 
 from llama_index.core import StorageContext
 from llama_index.vector_stores.faiss import FaissVectorStore
@@ -16,101 +30,748 @@ from llama_index.readers.web import SimpleWebPageReader
 
 load_dotenv(find_dotenv())
 
-import re
+from typing import Optional
 # from llama_index.readers.web import SimpleWebPageReader
-import requests
+import httpx
 from llama_index.core import Document
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.core.readers.base import BaseReader
+
+from server.utils.answer_cache import answer_cache
+from server.utils.chunking import StructuredChunker
+from server.utils.embedding_cache import CachedEmbedding
+from server.utils.html_cleaning import aclean_pages, html_to_markdown, remove_links
+from server.utils.medicine_names import medicine_name_index
+from server.utils.vector_index import (
+    FAISS_INDEX_FACTORY,
+    MedFaissVectorStore,
+    make_faiss_index,
+    needs_retrain,
+    retrain_from_flat,
+)
+
+# ingestion and query engines share one on-disk embedding cache
+Settings.embed_model = CachedEmbedding(OpenAIEmbedding())
+# documents are chunked along their headings, tables and FAQ entries
+Settings.transformations = [StructuredChunker()]
+
+PERSIST_DIR = "storage"
+DATA_DIR = "server/data"
+MANIFEST_FNAME = "ingest_manifest.json"
+# nodes handed to the vector store per `add` call
+INSERT_BATCH_SIZE = 50000
+# embedding requests in flight at once during ingestion
+EMBED_CONCURRENCY = 8
+# ETag/Last-Modified of ingested web pages, for conditional GETs
+WEB_VALIDATORS_FNAME = "webpage_validators.json"
+WEB_FETCH_TIMEOUT = 20.0
+WEB_FETCH_RETRIES = 2
+WEB_MAX_CONNECTIONS = 100
+WEB_CONNECTIONS_PER_HOST = 8
+# answers synthesized at once by a batch lookup
+SYNTHESIS_CONCURRENCY = 8
+# "hybrid" fuses FAISS and BM25 rankings, "default" is dense-only
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "hybrid")
+# nodes handed to the synthesizer per query
+SIMILARITY_TOP_K = int(os.getenv("SIMILARITY_TOP_K", str(DEFAULT_SIMILARITY_TOP_K)))
+# metadata added at ingestion for filtering; kept out of embeddings and prompts
+INGEST_METADATA_KEYS = ["drug_name", "source_type", "source", "ingested_at"]
+
+
+def clear_web_validators(persist_dir=PERSIST_DIR):
+    """Forgets the validators of ingested web pages, so they are fetched in full again."""
+    path = os.path.join(persist_dir, WEB_VALIDATORS_FNAME)
+    if os.path.exists(path):
+        os.remove(path)
+
 
 class MedWebPageReader(SimpleWebPageReader):
+    _validators: Optional[dict] = PrivateAttr(default=None)
+    _fetched_validators: dict = PrivateAttr(default_factory=dict)
+
     def _remove_links(self, string) -> str:
         """Removes all URLs and * (URL)[text] * patterns from a given string."""
-        # Pattern to match * (URL)[text] *
-        pattern = r"\*\s*\(https?://[^\)]+\)\[.*?\]\s*\*"
-        # Remove the matched patterns
-        string = re.sub(pattern, "", string)
-        
-        # Existing URL removal logic
-        def replace_match(match):
-            text = match.group(1)
-            return text if text else ""
-        
-        url_pattern = r"https?://(?:www\.)?((?!www\.).)+?"
-        return re.sub(url_pattern, replace_match, string)
+        return remove_links(string)
 
-    def load_data(self, urls):
+    def _load_validators(self):
+        if self._validators is None:
+            path = os.path.join(PERSIST_DIR, WEB_VALIDATORS_FNAME)
+            self._validators = {}
+            if os.path.exists(path):
+                with open(path, 'r') as f:
+                    self._validators = json.load(f)
+        return self._validators
+
+    def save_validators(self):
+        """Persists ETag/Last-Modified of fetched pages; call once they are indexed."""
+        if not self._fetched_validators:
+            return
+        validators = self._load_validators()
+        validators.update(self._fetched_validators)
+        self._fetched_validators = {}
+        os.makedirs(PERSIST_DIR, exist_ok=True)
+        with open(os.path.join(PERSIST_DIR, WEB_VALIDATORS_FNAME), 'w') as f:
+            json.dump(validators, f, indent=4)
+
+    async def _fetch(self, client, url, host_limits):
+        """Fetches a page, returns its body or None if unchanged or unreachable."""
+        headers = {}
+        validator = self._load_validators().get(url, {})
+        if validator.get('etag'):
+            headers['If-None-Match'] = validator['etag']
+        if validator.get('last_modified'):
+            headers['If-Modified-Since'] = validator['last_modified']
+
+        host = httpx.URL(url).host
+        semaphore = host_limits.setdefault(host, asyncio.Semaphore(WEB_CONNECTIONS_PER_HOST))
+        for attempt in range(WEB_FETCH_RETRIES + 1):
+            try:
+                async with semaphore:
+                    response = await client.get(url, headers=headers)
+            except httpx.HTTPError as e:
+                error = e
+            else:
+                if response.status_code == 304:
+                    print(f'{url} not modified since last ingestion, skipping.')
+                    return None
+                if response.status_code < 400:
+                    self._fetched_validators[url] = {
+                        'etag': response.headers.get('ETag'),
+                        'last_modified': response.headers.get('Last-Modified'),
+                    }
+                    return response.text
+                error = f'HTTP {response.status_code}'
+                if response.status_code != 429 and response.status_code < 500:
+                    break
+            if attempt < WEB_FETCH_RETRIES:
+                await asyncio.sleep(0.5 * 2 ** attempt)
+
+        print(f'failed to fetch {url}: {error}')
+        return None
+
+    async def aload_data(self, urls):
+        """Fetches all urls concurrently, bounded per host, and returns their documents."""
         if not isinstance(urls, list):
             raise ValueError("urls must be a list of strings.")
-        documents = []
         headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3'
         }
-        for url in urls:
-            response = requests.get(url, headers=headers).text
-            if self.html_to_text:
-                import html2text
-                response = html2text.html2text(response)
-                response = self._remove_links(response)
+        host_limits = {}
+        async with httpx.AsyncClient(
+            headers=headers,
+            timeout=WEB_FETCH_TIMEOUT,
+            follow_redirects=True,
+            limits=httpx.Limits(max_connections=WEB_MAX_CONNECTIONS),
+        ) as client:
+            pages = await asyncio.gather(
+                *(self._fetch(client, url, host_limits) for url in urls)
+            )
 
+        fetched = [(url, page) for url, page in zip(urls, pages) if page is not None]
+        texts = [page for _, page in fetched]
+        if self.html_to_text:
+            texts = await aclean_pages(texts)
+
+        documents = []
+        for (url, _), text in zip(fetched, texts):
             metadata = None
             if self._metadata_fn is not None:
                 metadata = self._metadata_fn(url)
 
-            documents.append(Document(text=response, id_=url, metadata=metadata or {}))
+            documents.append(Document(text=text, id_=url, metadata=metadata or {}))
 
-        return documents
+        return await asyncio.to_thread(annotate_documents, documents, 'webpage')
 
-def create_index():
-    # dimensions of text-ada-embedding-002
-    d = 1536
-    faiss_index = faiss.IndexFlatL2(d)
+    def load_data(self, urls):
+        return asyncio.run(self.aload_data(urls))
+
+
+class MedHTMLReader(BaseReader):
+    """Reads an HTML file as one markdown document, without page chrome, for structure-aware chunking."""
+
+    def load_data(self, file, extra_info=None):
+        with open(file, 'r', encoding='utf-8', errors='ignore') as f:
+            text = html_to_markdown(f.read())
+        return [Document(text=text, metadata=extra_info or {})]
+
+
+async def aembed_nodes(nodes, batch_size=None, concurrency=EMBED_CONCURRENCY):
+    """Embeds nodes in place, running up to `concurrency` embedding batches at once."""
+    embed_model = Settings.embed_model
+    batch_size = batch_size or embed_model.embed_batch_size
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def embed(texts):
+        async with semaphore:
+            return await embed_model.aget_text_embedding_batch(texts)
+
+    texts = [node.get_content(metadata_mode=MetadataMode.EMBED) for node in nodes]
+    batches = [texts[i:i + batch_size] for i in range(0, len(texts), batch_size)]
+    embeddings = await asyncio.gather(*(embed(batch) for batch in batches))
+
+    for node, embedding in zip(nodes, itertools.chain.from_iterable(embeddings)):
+        node.embedding = embedding
+    return nodes
+
+
+async def aprepare_nodes(documents):
+    """Chunks all documents together and embeds the resulting nodes."""
+    nodes = await asyncio.to_thread(run_transformations, documents, Settings.transformations)
+    return await aembed_nodes(nodes)
+
+
+def _file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def scan_data_dir(data_dir=DATA_DIR):
+    """Returns {file path: content hash} for the files create_index would ingest."""
+    return {
+        str(path): _file_hash(path)
+        for path in sorted(Path(data_dir).iterdir())
+        if path.is_file() and not path.name.startswith('.')
+    }
 
-    # load documents
-    parser = HTMLTagReader()
-    file_extractor = {".html": parser}
+
+def load_manifest(persist_dir=PERSIST_DIR):
+    """Loads the {file path: content hash} manifest of ingested files, if any."""
+    manifest_path = os.path.join(persist_dir, MANIFEST_FNAME)
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path, 'r') as f:
+        return json.load(f)
+
+
+def save_manifest(manifest, persist_dir=PERSIST_DIR):
+    os.makedirs(persist_dir, exist_ok=True)
+    with open(os.path.join(persist_dir, MANIFEST_FNAME), 'w') as f:
+        json.dump(manifest, f, indent=4, sort_keys=True)
+
+
+_manifest_lock = threading.Lock()
+
+
+def record_files(paths, persist_dir=PERSIST_DIR):
+    """
+    Adds files ingested outside create_index (e.g. uploads) to the manifest.
+
+    Files that are already listed keep their old hash, so a file overwritten
+    with new content still triggers a rebuild that drops its stale vectors.
+    """
+    with _manifest_lock:
+        manifest = load_manifest(persist_dir) or {}
+        for path in paths:
+            manifest.setdefault(str(path), _file_hash(path))
+        save_manifest(manifest, persist_dir)
+
+
+def annotate_documents(documents, source_type):
+    """
+    Adds the metadata searches can filter on: the medicine a source is about,
+    the source type, the file or URL and the ingestion time.
+
+    Pages and sections of one file share its drug_name, detected from the
+    file name or URL first and from the medicines the text mentions otherwise.
+    """
+    ingested_at = datetime.now(timezone.utc).isoformat(timespec='seconds')
+    by_source = {}
+    for doc in documents:
+        source = doc.metadata.get('file_path') or doc.get_doc_id()
+        by_source.setdefault(source, []).append(doc)
+
+    for source, docs in by_source.items():
+        drug_name = medicine_name_index.detect(
+            '\n'.join(doc.text for doc in docs), Path(urlparse(source).path).stem
+        )
+        for doc in docs:
+            doc.metadata.update(source_type=source_type, source=source, ingested_at=ingested_at)
+            if drug_name is not None:
+                doc.metadata['drug_name'] = drug_name
+            for excluded in (doc.excluded_embed_metadata_keys, doc.excluded_llm_metadata_keys):
+                excluded.extend(key for key in INGEST_METADATA_KEYS if key not in excluded)
+    return documents
+
+
+def load_files(input_files, source_type='file'):
+    parser = MedHTMLReader()
+    file_extractor = {".html": parser, ".htm": parser}
     documents = SimpleDirectoryReader(
-        "server/data", file_extractor=file_extractor
+        input_files=input_files, file_extractor=file_extractor, filename_as_id=True
     ).load_data()
+    return annotate_documents(documents, source_type)
+
 
-    vector_store = FaissVectorStore(faiss_index=faiss_index)
+def build_index(documents):
+    """Builds a new index from scratch, persists it and makes it the current one."""
+    nodes = asyncio.run(aprepare_nodes(documents))
+    faiss_index = make_faiss_index([node.get_embedding() for node in nodes])
+
+    vector_store = MedFaissVectorStore(faiss_index=faiss_index)
     storage_context = StorageContext.from_defaults(
         vector_store=vector_store
     )
-    index = VectorStoreIndex.from_documents(
-        documents, storage_context=storage_context
+    index = VectorStoreIndex(
+        nodes, storage_context=storage_context, insert_batch_size=INSERT_BATCH_SIZE
     )
+    for doc in documents:
+        index.docstore.set_document_hash(doc.get_doc_id(), document_hash(doc))
 
     # save index to disk
-    index.storage_context.persist()
-    print('created med index successfully.')
+    index.storage_context.persist(persist_dir=PERSIST_DIR)
+    # the rebuilt index holds no web pages, a 304 must not skip their re-upload
+    clear_web_validators(PERSIST_DIR)
+    med_index.set(index)
+    return index
+
+
+def create_index():
+    """
+    Brings the persisted index in line with the files in server/data.
+
+    Files are tracked by content hash, so only new files are embedded. The
+    FAISS store can't delete vectors, hence a changed or removed file
+    triggers a full rebuild. Once a flat index outgrows FAISS_MIN_TRAIN_VECTORS
+    it is retrained as FAISS_INDEX_FACTORY from its stored vectors.
+    """
+    files = scan_data_dir(DATA_DIR)
+    manifest = load_manifest(PERSIST_DIR)
+
+    stale = []
+    if manifest is not None:
+        stale = [path for path, digest in manifest.items() if files.get(path) != digest]
+
+    if manifest is None or stale or not os.path.exists(PERSIST_DIR):
+        build_index(load_files(list(files)))
+        save_manifest(files, PERSIST_DIR)
+        print('created med index successfully.')
+        return
+
+    new_files = [path for path in files if path not in manifest]
+    if new_files:
+        store_documents(load_files(new_files))
+        save_manifest(files, PERSIST_DIR)
+        print(f'added {len(new_files)} new file(s) to med index: {new_files}')
+    else:
+        print('med index is up to date.')
+
+    if needs_retrain(get_med_index().vector_store.client):
+        med_index.update(
+            lambda index: index.vector_store.set_faiss_index(
+                retrain_from_flat(index.vector_store.client)
+            )
+        )
+        print(f'retrained med index as {FAISS_INDEX_FACTORY}.')
+
+
+def _backfill_bm25(index):
+    """Keyword-indexes the nodes of an index persisted before it had a BM25 index."""
+    nodes_dict = index.index_struct.nodes_dict
+    nodes = index.docstore.get_nodes(list(nodes_dict.values()))
+    for faiss_id, node in zip(nodes_dict, nodes):
+        index.vector_store.bm25.add(int(faiss_id), node.get_content(metadata_mode=MetadataMode.NONE))
+    print(f'built BM25 index for {len(nodes)} nodes.')
+
+
+def _load_index(persist_dir):
+    vector_store = MedFaissVectorStore.from_persist_dir(persist_dir)
+    storage_context = StorageContext.from_defaults(
+        vector_store=vector_store, persist_dir=persist_dir
+    )
+    index = load_index_from_storage(
+        storage_context=storage_context, insert_batch_size=INSERT_BATCH_SIZE
+    )
+    if not len(vector_store.bm25) and index.index_struct.nodes_dict:
+        _backfill_bm25(index)
+    return index
+
+
+class ReadWriteLock:
+    """Any number of readers or a single writer; a waiting writer goes before new readers."""
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._readers = 0
+        self._writing = False
+        self._waiting_writers = 0
+
+    @contextlib.contextmanager
+    def read(self):
+        with self._condition:
+            while self._writing or self._waiting_writers:
+                self._condition.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._readers -= 1
+                if not self._readers:
+                    self._condition.notify_all()
+
+    @contextlib.contextmanager
+    def write(self):
+        with self._condition:
+            self._waiting_writers += 1
+            while self._writing or self._readers:
+                self._condition.wait()
+            self._waiting_writers -= 1
+            self._writing = True
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._writing = False
+                self._condition.notify_all()
+
+
+class MedIndexManager:
+    """
+    Process-wide handle to the med index.
+
+    The index is loaded from disk once and all readers share it in memory.
+    Writers are serialized and change the index in place, but only while no
+    reader is searching it: searches hold `reading()`, so they never see a
+    half-applied write. Every write bumps the version, which keys the answer
+    cache.
+    """
+
+    def __init__(self, persist_dir: str = PERSIST_DIR):
+        self.persist_dir = persist_dir
+        # (index, version), replaced as a whole so readers always see a matching pair
+        self._snapshot = (None, 0)
+        self._write_lock = threading.Lock()
+        self._access = ReadWriteLock()
+        self._persist_lock = threading.Lock()
+        # writes applied to the index and writes on disk
+        self._writes = 0
+        self._persisted = 0
+
+    @property
+    def version(self):
+        return self._snapshot[1]
+
+    @property
+    def _index(self):
+        return self._snapshot[0]
+
+    def _swap(self, index):
+        self._snapshot = (index, self._snapshot[1] + 1)
+
+    def _replace(self, index):
+        """Swaps in an index that is already on disk."""
+        self._swap(index)
+        self._persisted = self._writes
+
+    def load(self):
+        """(Re)loads the index from disk."""
+        with self._write_lock:
+            self._replace(_load_index(self.persist_dir))
+        return self._index
+
+    def snapshot(self):
+        """Returns the current (index, version) pair."""
+        if self._snapshot[0] is None:
+            with self._write_lock:
+                if self._snapshot[0] is None:
+                    self._replace(_load_index(self.persist_dir))
+        return self._snapshot
+
+    def get(self):
+        return self.snapshot()[0]
+
+    def reading(self):
+        """Context manager to hold while searching the index or reading its nodes."""
+        return self._access.read()
+
+    def set(self, index):
+        """Replaces the current snapshot with a persisted index, e.g. after a full rebuild."""
+        with self._write_lock:
+            self._replace(index)
+
+    def update(self, apply):
+        """
+        Applies `apply(index)` to the index once no reader is using it, bumps
+        the version and returns after the change is persisted.
+        """
+        with self._write_lock:
+            if self._index is None:
+                self._replace(_load_index(self.persist_dir))
+            with self._access.write():
+                result = apply(self._index)
+                self._swap(self._index)
+                self._writes += 1
+                write = self._writes
+        self._persist(write)
+        return result
+
+    def _persist(self, write):
+        """
+        Persists the index unless a persist since `write` already did, so
+        writes queued behind another persist are saved together.
+        """
+        with self._persist_lock:
+            if self._persisted >= write:
+                return
+            # persisting only reads the index, searches can go on meanwhile
+            with self._access.read():
+                writes = self._writes
+                self._index.storage_context.persist(persist_dir=self.persist_dir)
+            self._persisted = writes
+
+
+med_index = MedIndexManager()
+
 
 def get_med_index():
-    # load index from disk
-	vector_store = FaissVectorStore.from_persist_dir("storage")
-	storage_context = StorageContext.from_defaults(
-		vector_store=vector_store, persist_dir="storage"
-	)
-	index = load_index_from_storage(storage_context=storage_context)
-	return index
+    return med_index.get()
+
+def drug_filters(index, drug_name):
+    """
+    Metadata filters limiting retrieval to the documents about drug_name, or
+    None to search everything when no ingested document is about it.
+    """
+    if not drug_name:
+        return None
+    drug_name = medicine_name_index.canonical_name(drug_name)
+    if not index.vector_store.partition_size('drug_name', drug_name):
+        print(f'no documents tagged with drug_name={drug_name!r}, searching all documents.')
+        return None
+    return MetadataFilters(filters=[ExactMatchFilter(key='drug_name', value=drug_name)])
+
+
+def _query_engine(index, filters=None):
+    return index.as_query_engine(
+        filters=filters, similarity_top_k=SIMILARITY_TOP_K, vector_store_query_mode=RETRIEVAL_MODE
+    )
 
-def get_answer(query):
-    index = get_med_index()
 
-    query_engine = index.as_query_engine()
-    response = query_engine.query(query)
+def _retrieve(index, filters, query_bundle):
+    """Retrieves the nodes for query_bundle, holding off writes to the index meanwhile."""
+    with med_index.reading():
+        return _query_engine(index, filters).retrieve(query_bundle)
 
+
+def _cache_scope(filters):
+    """Answers are only reused between lookups with the same drug filter."""
+    return filters.filters[0].value if filters is not None else None
+
+
+def get_answer(query, drug_name=None):
+    """Answers query from the med index, only from documents about drug_name if given."""
+    index, version = med_index.snapshot()
+    filters = drug_filters(index, drug_name)
+    scope = _cache_scope(filters)
+
+    embedding = None
+    if answer_cache.similarity_threshold:
+        embedding = Settings.embed_model.get_query_embedding(query)
+
+    answer = answer_cache.get(query, version, embedding=embedding, scope=scope)
+    if answer is not None:
+        return answer
+
+    # embedded before taking the read lock, so a write doesn't wait on the OpenAI call
+    query_bundle = QueryBundle(query, embedding=embedding or Settings.embed_model.get_query_embedding(query))
+    nodes = _retrieve(index, filters, query_bundle)
+    response = _query_engine(index, filters).synthesize(query_bundle, nodes)
+
+    answer_cache.put(query, version, response.response, embedding=embedding, scope=scope)
     return response.response
 
 
+async def aget_answer(query, drug_name=None):
+    """Async get_answer: embedding, retrieval and synthesis don't block the event loop."""
+    if med_index.version == 0:
+        # loading from disk is slow, normally done once at startup
+        await asyncio.to_thread(med_index.snapshot)
+    index, version = med_index.snapshot()
+    filters = drug_filters(index, drug_name)
+    scope = _cache_scope(filters)
+
+    embedding = None
+    if answer_cache.similarity_threshold:
+        embedding = await Settings.embed_model.aget_query_embedding(query)
+
+    answer = answer_cache.get(query, version, embedding=embedding, scope=scope)
+    if answer is not None:
+        return answer
+
+    query_bundle = QueryBundle(query, embedding=embedding or await Settings.embed_model.aget_query_embedding(query))
+    # waiting for the read lock would block the event loop
+    nodes = await asyncio.to_thread(_retrieve, index, filters, query_bundle)
+    response = await _query_engine(index, filters).asynthesize(query_bundle, nodes)
+
+    answer_cache.put(query, version, response.response, embedding=embedding, scope=scope)
+    return response.response
+
+
+async def aget_answers(queries, drug_names=None):
+    """
+    Answers several queries with a single embedding request and one FAISS
+    search per drug filter (plus a BM25 search per query in hybrid mode);
+    answers not in the cache are synthesized concurrently.
+
+    `drug_names`, if given, holds a drug (or None) per query to filter its retrieval by.
+    """
+    if med_index.version == 0:
+        await asyncio.to_thread(med_index.snapshot)
+    index, version = med_index.snapshot()
+
+    drug_names = drug_names or [None] * len(queries)
+    keys = [(query, drug_name) for query, drug_name in zip(queries, drug_names)]
+    unique = list(dict.fromkeys(keys))
+    filters = {key: drug_filters(index, key[1]) for key in unique}
+    texts = list(dict.fromkeys(query for query, _ in unique))
+    # queries and texts are embedded by the same OpenAI model
+    embeddings = dict(zip(texts, await Settings.embed_model.aget_text_embedding_batch(texts)))
+    answers = {
+        key: answer_cache.get(key[0], version, embedding=embeddings[key[0]], scope=_cache_scope(filters[key]))
+        for key in unique
+    }
+    missing = [key for key, answer in answers.items() if answer is None]
+
+    if missing:
+        # one faiss call per distinct filter
+        by_filter = {}
+        for key in missing:
+            drug_name = filters[key].filters[0].value if filters[key] is not None else None
+            by_filter.setdefault(drug_name, []).append(key)
+
+        def search():
+            results = {}
+            with med_index.reading():
+                for drug_name, group in by_filter.items():
+                    ids = None
+                    if drug_name is not None:
+                        ids = index.vector_store.filter_ids(filters[group[0]])
+                    found = index.vector_store.query_many(
+                        [embeddings[query] for query, _ in group],
+                        SIMILARITY_TOP_K,
+                        ids=ids,
+                        query_strs=[query for query, _ in group] if RETRIEVAL_MODE == 'hybrid' else None,
+                    )
+                    for key, result in zip(group, found):
+                        node_ids = [index.index_struct.nodes_dict[idx] for idx in result.ids]
+                        results[key] = [
+                            NodeWithScore(node=node, score=score)
+                            for node, score in zip(index.docstore.get_nodes(node_ids), result.similarities)
+                        ]
+            return results
+
+        results = await asyncio.to_thread(search)
+
+        query_engine = _query_engine(index)
+        semaphore = asyncio.Semaphore(SYNTHESIS_CONCURRENCY)
+
+        async def synthesize(key, nodes):
+            query = key[0]
+            async with semaphore:
+                response = await query_engine.asynthesize(
+                    QueryBundle(query, embedding=embeddings[query]), nodes
+                )
+            answer_cache.put(
+                query, version, response.response, embedding=embeddings[query], scope=_cache_scope(filters[key])
+            )
+            answers[key] = response.response
+
+        await asyncio.gather(*(synthesize(key, results[key]) for key in missing))
+
+    return [answers[key] for key in keys]
+
+
+def document_hash(doc):
+    # unlike doc.hash, ignores metadata such as file modification dates
+    return hashlib.sha256(doc.text.encode("utf-8", "surrogatepass")).hexdigest()
+
+
+def _new_documents(index, documents):
+    """
+    Drops documents that are already indexed with the same content hash.
+
+    The pages of a file are chunked together, so if one page changed all of
+    them are kept.
+    """
+    by_file = {}
+    for doc in {doc.get_doc_id(): doc for doc in documents}.values():
+        by_file.setdefault(doc.metadata.get('file_path') or doc.get_doc_id(), []).append(doc)
+    return [
+        doc for docs in by_file.values()
+        if any(index.docstore.get_document_hash(doc.get_doc_id()) != document_hash(doc) for doc in docs)
+        for doc in docs
+    ]
+
+
+def _delete_documents(index, doc_ids):
+    """Removes the nodes of documents from the docstore, faiss and BM25; returns how many were removed."""
+    node_ids = set()
+    for doc_id in doc_ids:
+        ref_doc_info = index.docstore.get_ref_doc_info(doc_id)
+        if ref_doc_info is not None:
+            node_ids.update(ref_doc_info.node_ids)
+    if not node_ids:
+        return 0
+
+    nodes_dict = index.index_struct.nodes_dict
+    faiss_ids = [faiss_id for faiss_id, node_id in nodes_dict.items() if node_id in node_ids]
+    nodes = index.docstore.get_nodes([nodes_dict[faiss_id] for faiss_id in faiss_ids])
+    index.vector_store.delete_ids(
+        faiss_ids, [node.get_content(metadata_mode=MetadataMode.NONE) for node in nodes]
+    )
+    for faiss_id in faiss_ids:
+        del nodes_dict[faiss_id]
+    for doc_id in doc_ids:
+        index.docstore.delete_ref_doc(doc_id, raise_error=False)
+    index.storage_context.index_store.add_index_struct(index.index_struct)
+    return len(faiss_ids)
+
+
+async def astore_documents(documents):
+    """
+    Bulk-inserts documents into the med index.
+
+    Documents already indexed with the same id and content are skipped; a
+    document whose content changed has its old nodes deleted first. The
+    rest are chunked and embedded up front, outside the write lock, then
+    added to FAISS in one go and persisted once. Returns ingestion stats.
+    """
+    start = time.perf_counter()
+    received = len(documents)
+    documents = _new_documents(get_med_index(), documents)
+    nodes = await aprepare_nodes(documents)
+
+    def insert(index):
+        # re-check, another writer may have stored the same documents meanwhile
+        new_doc_ids = {doc.get_doc_id() for doc in _new_documents(index, documents)}
+        new_nodes = [node for node in nodes if node.ref_doc_id in new_doc_ids]
+        replaced = _delete_documents(index, new_doc_ids)
+        if replaced:
+            print(f'deleted {replaced} outdated nodes of re-ingested documents.')
+        index.insert_nodes(new_nodes)
+        for doc in documents:
+            if doc.get_doc_id() in new_doc_ids:
+                index.docstore.set_document_hash(doc.get_doc_id(), document_hash(doc))
+        return len(new_doc_ids), len(new_nodes)
+
+    if documents:
+        stored_docs, stored_nodes = await asyncio.to_thread(med_index.update, insert)
+    else:
+        stored_docs, stored_nodes = 0, 0
+
+    elapsed = time.perf_counter() - start
+    stats = {
+        'documents': stored_docs,
+        'skipped_documents': received - stored_docs,
+        'nodes': stored_nodes,
+        'seconds': round(elapsed, 3),
+        'nodes_per_sec': round(stored_nodes / elapsed, 1) if elapsed else 0.0,
+    }
+    print(f"stored {stats['documents']} documents ({stats['skipped_documents']} already indexed) as {stats['nodes']} nodes in {stats['seconds']}s ({stats['nodes_per_sec']} nodes/sec)")
+    return stats
+
+
 def store_documents(documents):
-	index = get_med_index()
-
-	for doc in documents:
-		index.insert(document=doc)
-
-	# save index to disk
-	index.storage_context.persist()
-    
-def save_chat(memory):
-    """Save memory to file."""
-    with open('server/memory.json', 'w') as f:
-        json.dump(memory.to_dict(), f, indent=4)
+    return asyncio.run(astore_documents(documents))
@@ -0,0 +1,144 @@
+import asyncio
+import hashlib
+import os
+import sqlite3
+import threading
+from typing import List
+
+import numpy as np
+from llama_index.core.base.embeddings.base import BaseEmbedding, Embedding
+from llama_index.core.bridge.pydantic import PrivateAttr
+
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "storage/embedding_cache.sqlite3")
+# sqlite's default limit on bound parameters is 999
+LOOKUP_BATCH_SIZE = 900
+
+
+def text_hash(text: str) -> bytes:
+    return hashlib.sha256(text.encode("utf-8", "surrogatepass")).digest()
+
+
+class EmbeddingStore:
+    """
+    Persistent (model, text hash) -> float32 vector store backed by SQLite in WAL mode.
+
+    The database is opened on first use, so importing the app touches no files.
+    """
+
+    def __init__(self, path: str = EMBEDDING_CACHE_PATH):
+        self.path = path
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        # callers hold self._lock
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                " model TEXT NOT NULL, text_hash BLOB NOT NULL, vector BLOB NOT NULL,"
+                " PRIMARY KEY (model, text_hash)) WITHOUT ROWID"
+            )
+            self._conn = conn
+        return self._conn
+
+    def get_many(self, model: str, hashes: List[bytes]) -> dict:
+        found = {}
+        with self._lock:
+            conn = self._connect()
+            for i in range(0, len(hashes), LOOKUP_BATCH_SIZE):
+                batch = hashes[i:i + LOOKUP_BATCH_SIZE]
+                rows = conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND text_hash IN ({','.join('?' * len(batch))})",
+                    [model, *batch],
+                )
+                for digest, vector in rows:
+                    found[digest] = np.frombuffer(vector, dtype="float32").tolist()
+        return found
+
+    def put_many(self, model: str, items: dict) -> None:
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO embeddings (model, text_hash, vector) VALUES (?, ?, ?)",
+                    [
+                        (model, digest, np.asarray(vector, dtype="float32").tobytes())
+                        for digest, vector in items.items()
+                    ],
+                )
+
+
+class CachedEmbedding(BaseEmbedding):
+    """
+    Wraps an embedding model with a persistent cache keyed by (model, text hash).
+
+    Ingestion and queries share the cache, so re-embedding known text costs a
+    SQLite lookup instead of a network round-trip.
+    """
+
+    _embed_model: BaseEmbedding = PrivateAttr()
+    _store: EmbeddingStore = PrivateAttr()
+
+    def __init__(self, embed_model: BaseEmbedding, store: EmbeddingStore | None = None):
+        super().__init__(
+            model_name=embed_model.model_name,
+            embed_batch_size=embed_model.embed_batch_size,
+            num_workers=embed_model.num_workers,
+        )
+        self._embed_model = embed_model
+        self._store = store or EmbeddingStore()
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "CachedEmbedding"
+
+    def _lookup(self, texts: List[str]):
+        hashes = [text_hash(text) for text in texts]
+        found = self._store.get_many(self.model_name, list(set(hashes)))
+        missing = list({digest: text for digest, text in zip(hashes, texts) if digest not in found}.items())
+        return hashes, found, missing
+
+    def _get_query_embedding(self, query: str) -> Embedding:
+        digest = text_hash(query)
+        found = self._store.get_many(self.model_name, [digest])
+        if digest not in found:
+            found[digest] = self._embed_model.get_query_embedding(query)
+            self._store.put_many(self.model_name, {digest: found[digest]})
+        return found[digest]
+
+    async def _aget_query_embedding(self, query: str) -> Embedding:
+        # SQLite calls, and waiting for the store's lock, run off the event loop
+        digest = text_hash(query)
+        found = await asyncio.to_thread(self._store.get_many, self.model_name, [digest])
+        if digest not in found:
+            found[digest] = await self._embed_model.aget_query_embedding(query)
+            await asyncio.to_thread(self._store.put_many, self.model_name, {digest: found[digest]})
+        return found[digest]
+
+    def _get_text_embedding(self, text: str) -> Embedding:
+        return self._get_text_embeddings([text])[0]
+
+    async def _aget_text_embedding(self, text: str) -> Embedding:
+        return (await self._aget_text_embeddings([text]))[0]
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[Embedding]:
+        hashes, found, missing = self._lookup(texts)
+        if missing:
+            vectors = self._embed_model.get_text_embedding_batch([text for _, text in missing])
+            computed = {digest: vector for (digest, _), vector in zip(missing, vectors)}
+            self._store.put_many(self.model_name, computed)
+            found.update(computed)
+        return [found[digest] for digest in hashes]
+
+    async def _aget_text_embeddings(self, texts: List[str]) -> List[Embedding]:
+        hashes, found, missing = await asyncio.to_thread(self._lookup, texts)
+        if missing:
+            vectors = await self._embed_model.aget_text_embedding_batch([text for _, text in missing])
+            computed = {digest: vector for (digest, _), vector in zip(missing, vectors)}
+            await asyncio.to_thread(self._store.put_many, self.model_name, computed)
+            found.update(computed)
+        return [found[digest] for digest in hashes]
@@ -0,0 +1,118 @@
+import csv
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0088
+# zip code -> centroid table used to geocode addresses without an external service
+ZIP_CENTROIDS_PATH = os.getenv("ZIP_CENTROIDS_PATH", "data/reference/zip_centroids.csv")
+# one JSON line per resolved address, appended as addresses are resolved
+GEOCODE_CACHE_PATH = os.getenv("GEOCODE_CACHE_PATH", "storage/geocode_cache.jsonl")
+# least recently used addresses are dropped past this many
+GEOCODE_CACHE_MAX_ENTRIES = int(os.getenv("GEOCODE_CACHE_MAX_ENTRIES", "100000"))
+
+ZIP_CODE_PATTERN = re.compile(r"\b\d{5}\b")
+LAT_LON_PATTERN = re.compile(r"^\s*(-?\d{1,2}(?:\.\d+)?)\s*,\s*(-?\d{1,3}(?:\.\d+)?)\s*$")
+
+
+def zip_code_from_address(address: str | None) -> str | None:
+    match = ZIP_CODE_PATTERN.search(address or "")
+    return match.group(0) if match else None
+
+
+def haversine_km(lat, lon, lats, lons):
+    """Great-circle distance in km from (lat, lon) to each of `lats`/`lons`, all in degrees."""
+    lat, lon = np.radians(lat), np.radians(lon)
+    lats, lons = np.radians(lats), np.radians(lons)
+    a = np.sin((lats - lat) / 2) ** 2 + np.cos(lat) * np.cos(lats) * np.sin((lons - lon) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+class OfflineGeocoder:
+    """
+    Resolves addresses to (lat, lon) without an external service.
+
+    An address is a "lat, lon" pair or is located by the centroid of its zip
+    code. Up to `max_entries` resolved addresses are cached, least recently
+    used first out. Each new one is appended to `cache_path`, which is
+    rewritten with just the cached entries once it holds twice as many lines.
+    """
+
+    def __init__(
+        self,
+        centroids_path: str = ZIP_CENTROIDS_PATH,
+        cache_path: str = GEOCODE_CACHE_PATH,
+        max_entries: int = GEOCODE_CACHE_MAX_ENTRIES,
+    ):
+        self.centroids_path = centroids_path
+        self.cache_path = cache_path
+        self.max_entries = max_entries
+        self._centroids = None
+        self._cache = None
+        # lines in the cache file
+        self._lines = 0
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self._centroids is None:
+            centroids = {}
+            if os.path.exists(self.centroids_path):
+                with open(self.centroids_path, newline="") as f:
+                    for row in csv.DictReader(f):
+                        centroids[row["zip"].zfill(5)] = (float(row["lat"]), float(row["lon"]))
+            cache, lines = OrderedDict(), 0
+            if os.path.exists(self.cache_path):
+                with open(self.cache_path, "r") as f:
+                    for line in f:
+                        # a line cut short by a crash mid-append is dropped
+                        if not line.endswith("\n"):
+                            break
+                        key, lat, lon = json.loads(line)
+                        cache[key] = (lat, lon)
+                        cache.move_to_end(key)
+                        lines += 1
+            while len(cache) > self.max_entries:
+                cache.popitem(last=False)
+            self._centroids, self._cache, self._lines = centroids, cache, lines
+
+    def _save(self, key, location):
+        os.makedirs(os.path.dirname(self.cache_path) or ".", exist_ok=True)
+        if self._lines < 2 * self.max_entries:
+            with open(self.cache_path, "a") as f:
+                f.write(json.dumps([key, *location]) + "\n")
+            self._lines += 1
+            return
+        tmp_path = self.cache_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            f.writelines(json.dumps([k, *v]) + "\n" for k, v in self._cache.items())
+        os.replace(tmp_path, self.cache_path)
+        self._lines = len(self._cache)
+
+    def geocode(self, address: str | None) -> tuple[float, float] | None:
+        if not address:
+            return None
+        key = " ".join(address.lower().split())
+        with self._lock:
+            self._load()
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return tuple(self._cache[key])
+
+            match = LAT_LON_PATTERN.match(address)
+            if match:
+                location = (float(match.group(1)), float(match.group(2)))
+            else:
+                location = self._centroids.get(zip_code_from_address(address))
+            if location is not None:
+                self._cache[key] = location
+                if len(self._cache) > self.max_entries:
+                    self._cache.popitem(last=False)
+                self._save(key, location)
+            return location
+
+
+geocoder = OfflineGeocoder()
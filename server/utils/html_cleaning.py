@@ -0,0 +1,77 @@
+import asyncio
+import multiprocessing
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+import html2text
+from bs4 import BeautifulSoup
+
+# * (URL)[text] * patterns are dropped entirely
+STARRED_LINK_PATTERN = re.compile(r"\*\s*\(https?://[^\)]+\)\[.*?\]\s*\*")
+# bare URLs only lose their scheme and www. prefix; a constant replacement
+# keeps re.sub in C instead of calling back into Python for every match
+URL_PREFIX_PATTERN = re.compile(r"https?://(?:www\.)?(?!www\.)(?=.)")
+
+# page chrome dropped before converting a page for chunking
+BOILERPLATE_TAGS = ["nav", "header", "footer", "aside", "form", "script", "style", "noscript", "svg", "button"]
+
+# batches with more HTML than this are converted in a process pool
+PROCESS_POOL_MIN_CHARS = 2_000_000
+# the pool is shared by the whole server, so it stays small
+HTML_CLEAN_WORKERS = int(os.getenv("HTML_CLEAN_WORKERS", str(min(os.cpu_count() or 1, 4))))
+
+_pool = None
+
+
+def remove_links(text: str) -> str:
+    """Removes all URLs and * (URL)[text] * patterns from a given string."""
+    if "(http" in text:
+        text = STARRED_LINK_PATTERN.sub("", text)
+    return URL_PREFIX_PATTERN.sub("", text)
+
+
+def html_to_clean_text(html: str) -> str:
+    """Converts HTML to markdown-ish text without links."""
+    return remove_links(html2text.html2text(html))
+
+
+def html_to_markdown(html: str) -> str:
+    """
+    Converts HTML to markdown for structure-aware chunking: headings, lists and
+    tables are kept, navigation, headers, footers, links and images are not.
+    """
+    soup = BeautifulSoup(html, "html.parser")
+    for element in soup.find_all(BOILERPLATE_TAGS):
+        element.decompose()
+    converter = html2text.HTML2Text()
+    converter.ignore_links = True
+    converter.ignore_images = True
+    converter.body_width = 0
+    return converter.handle(str(soup))
+
+
+def _get_pool():
+    global _pool
+    if _pool is None:
+        # forking a threaded server can deadlock the children, so workers start fresh
+        method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+        _pool = ProcessPoolExecutor(max_workers=HTML_CLEAN_WORKERS, mp_context=multiprocessing.get_context(method))
+    return _pool
+
+
+def clean_pages(pages: list[str]) -> list[str]:
+    """Converts a batch of HTML pages, spreading large batches over CPU cores."""
+    if len(pages) > 1 and sum(len(page) for page in pages) >= PROCESS_POOL_MIN_CHARS:
+        return list(_get_pool().map(html_to_clean_text, pages))
+    return [html_to_clean_text(page) for page in pages]
+
+
+async def aclean_pages(pages: list[str]) -> list[str]:
+    """Same as clean_pages, but keeps the event loop free while converting."""
+    if len(pages) > 1 and sum(len(page) for page in pages) >= PROCESS_POOL_MIN_CHARS:
+        loop = asyncio.get_running_loop()
+        return list(await asyncio.gather(
+            *(loop.run_in_executor(_get_pool(), html_to_clean_text, page) for page in pages)
+        ))
+    return await asyncio.to_thread(clean_pages, pages)
@@ -0,0 +1,120 @@
+import os
+import threading
+import time
+
+import numpy as np
+from llama_index.core import Settings
+from llama_index.core.base.embeddings.base import BaseEmbedding
+
+# best agent's cosine similarity must reach this to skip the orchestrator LLM
+ROUTER_MIN_SCORE = float(os.getenv("ROUTER_MIN_SCORE", "0.82"))
+# ... and beat the runner-up by this much
+ROUTER_MIN_MARGIN = float(os.getenv("ROUTER_MIN_MARGIN", "0.04"))
+
+
+class IntentRouter:
+    """
+    Routes a user message to an agent by embedding similarity.
+
+    Each agent is represented by its description and example utterances. A
+    message is routed locally only when the best agent is a confident and
+    clear winner whose required user state is set; otherwise `aroute`
+    returns None and the caller falls back to the orchestrator LLM.
+
+    Agent vectors are embedded once per set of agents, but each message
+    costs one query embedding from `embed_model` (Settings.embed_model by
+    default, an OpenAI request unless the embedding cache has the text).
+    That is a round-trip of tens of milliseconds against an orchestrator
+    completion of a second or more; pass a local model to route offline.
+    """
+
+    def __init__(
+        self,
+        min_score: float = ROUTER_MIN_SCORE,
+        min_margin: float = ROUTER_MIN_MARGIN,
+        embed_model: BaseEmbedding | None = None,
+    ):
+        self.min_score = min_score
+        self.min_margin = min_margin
+        self.embed_model = embed_model
+        self._agent_vectors = {}
+        self._lock = threading.Lock()
+        self._stats = {"local": 0, "llm": 0, "router_ms": 0.0, "llm_ms": 0.0}
+
+    @property
+    def _embed_model(self) -> BaseEmbedding:
+        return self.embed_model or Settings.embed_model
+
+    async def _get_agent_vectors(self, agent_configs):
+        key = tuple((ac.name, ac.description, tuple(ac.example_utterances)) for ac in agent_configs)
+        if key not in self._agent_vectors:
+            texts, owners = [], []
+            for ac in agent_configs:
+                for text in [ac.description, *ac.example_utterances]:
+                    texts.append(text)
+                    owners.append(ac.name)
+            vectors = np.array(
+                await self._embed_model.aget_text_embedding_batch(texts), dtype="float32"
+            )
+            vectors /= np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-9
+            self._agent_vectors[key] = (vectors, np.array(owners))
+        return self._agent_vectors[key]
+
+    async def aroute(self, user_msg: str, agent_configs, user_state: dict | None = None) -> str | None:
+        """
+        Returns the agent name to transfer to, or None if the match is
+        ambiguous or the agent needs user state that isn't set yet.
+        """
+        if not user_msg or not agent_configs:
+            return None
+        start = time.perf_counter()
+        try:
+            vectors, owners = await self._get_agent_vectors(agent_configs)
+            query = np.array(await self._embed_model.aget_query_embedding(user_msg), dtype="float32")
+        except Exception as e:
+            print(f"intent router unavailable, falling back to the orchestrator: {e}")
+            return None
+        scores = vectors @ (query / (np.linalg.norm(query) + 1e-9))
+
+        best_by_agent = {}
+        for owner, score in zip(owners, scores):
+            best_by_agent[owner] = max(best_by_agent.get(owner, -1.0), float(score))
+        ranked = sorted(best_by_agent.items(), key=lambda item: item[1], reverse=True)
+        best, best_score = ranked[0]
+        runner_up_score = ranked[1][1] if len(ranked) > 1 else -1.0
+
+        # e.g. balance lookups before login: the orchestrator sees the state and decides
+        required = next(ac.router_requires_state for ac in agent_configs if ac.name == best)
+        missing_state = any((user_state or {}).get(key) is None for key in required)
+
+        with self._lock:
+            self._stats["router_ms"] += (time.perf_counter() - start) * 1000
+        if best_score >= self.min_score and best_score - runner_up_score >= self.min_margin and not missing_state:
+            with self._lock:
+                self._stats["local"] += 1
+            return best
+        return None
+
+    def record_llm_route(self, elapsed_ms: float) -> None:
+        with self._lock:
+            self._stats["llm"] += 1
+            self._stats["llm_ms"] += elapsed_ms
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+        routed = stats["local"] + stats["llm"]
+        avg_llm_ms = stats["llm_ms"] / stats["llm"] if stats["llm"] else 0.0
+        avg_router_ms = stats["router_ms"] / routed if routed else 0.0
+        return {
+            "routed_locally": stats["local"],
+            "routed_by_llm": stats["llm"],
+            "local_hit_rate": round(stats["local"] / routed, 3) if routed else 0.0,
+            "avg_router_ms": round(avg_router_ms, 2),
+            "avg_llm_route_ms": round(avg_llm_ms, 2),
+            # every local hit skipped one orchestrator LLM round-trip
+            "estimated_ms_saved": round(stats["local"] * max(avg_llm_ms - avg_router_ms, 0.0), 1),
+        }
+
+
+intent_router = IntentRouter()
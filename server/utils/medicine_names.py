@@ -0,0 +1,267 @@
+import collections
+import csv
+import functools
+import os
+import re
+
+from pydantic import BaseModel
+
+# extra names as "canonical,alias" rows, added to DEFAULT_MEDICINE_NAMES
+MEDICINE_NAMES_PATH = os.getenv("MEDICINE_NAMES_PATH", "data/reference/medicine_names.csv")
+# typos corrected silently; many drug names are a letter or two apart
+# (citalopram/escitalopram, prednisolone/prednisone), so keep this at 1
+MEDICINE_MAX_EDIT_DISTANCE = int(os.getenv("MEDICINE_MAX_EDIT_DISTANCE", "1"))
+# shorter inputs are never corrected, too many words are a typo away from a name
+MEDICINE_FUZZY_MIN_LENGTH = int(os.getenv("MEDICINE_FUZZY_MIN_LENGTH", "6"))
+# names this close are offered as "did you mean", and make a correction ambiguous
+MEDICINE_SUGGEST_DISTANCE = 2
+MEDICINE_NAME_CACHE_SIZE = 10000
+# mentions a medicine needs to be taken as the subject of a document
+DETECT_MIN_MENTIONS = 3
+
+# generic name -> brand names and other common aliases
+DEFAULT_MEDICINE_NAMES = {
+    "sildenafil": ["viagra", "revatio"],
+    "tadalafil": ["cialis", "adcirca"],
+    "atorvastatin": ["lipitor"],
+    "simvastatin": ["zocor"],
+    "rosuvastatin": ["crestor"],
+    "metformin": ["glucophage", "fortamet", "glumetza"],
+    "lisinopril": ["zestril", "prinivil"],
+    "amlodipine": ["norvasc"],
+    "losartan": ["cozaar"],
+    "metoprolol": ["lopressor", "toprol xl", "toprol"],
+    "omeprazole": ["prilosec"],
+    "esomeprazole": ["nexium"],
+    "pantoprazole": ["protonix"],
+    "levothyroxine": ["synthroid", "levoxyl", "unithroid"],
+    "albuterol": ["proair", "ventolin", "proventil", "salbutamol"],
+    "ibuprofen": ["advil", "motrin"],
+    "acetaminophen": ["tylenol", "paracetamol"],
+    "aspirin": ["ecotrin", "acetylsalicylic acid"],
+    "sertraline": ["zoloft"],
+    "escitalopram": ["lexapro"],
+    "fluoxetine": ["prozac"],
+    "duloxetine": ["cymbalta"],
+    "bupropion": ["wellbutrin", "zyban"],
+    "gabapentin": ["neurontin"],
+    "amoxicillin": ["amoxil"],
+    "amoxicillin clavulanate": ["augmentin", "co-amoxiclav"],
+    "azithromycin": ["zithromax", "z-pak", "zpack"],
+    "prednisone": ["deltasone"],
+    "hydrochlorothiazide": ["microzide", "hctz"],
+    "furosemide": ["lasix"],
+    "montelukast": ["singulair"],
+    "clopidogrel": ["plavix"],
+    "warfarin": ["coumadin", "jantoven"],
+    "apixaban": ["eliquis"],
+    "rivaroxaban": ["xarelto"],
+    "insulin glargine": ["lantus", "basaglar", "toujeo"],
+    "semaglutide": ["ozempic", "wegovy", "rybelsus"],
+    "tramadol": ["ultram"],
+    "cetirizine": ["zyrtec"],
+    "loratadine": ["claritin"],
+    "fexofenadine": ["allegra"],
+    "alprazolam": ["xanax"],
+    "zolpidem": ["ambien"],
+    "finasteride": ["propecia", "proscar"],
+}
+
+DOSAGE_PATTERN = re.compile(r"\b(\d+(?:\.\d+)?)\s*(mg|mcg|µg|g|ml|iu|units?|%)(?![a-z])", re.IGNORECASE)
+# dosage forms and release modifiers that are not part of the name
+FORM_WORDS = {
+    "tablet", "tablets", "tab", "tabs", "capsule", "capsules", "cap", "caps", "pill", "pills",
+    "oral", "solution", "suspension", "injection", "cream", "ointment", "inhaler", "syrup",
+    "er", "xr", "sr", "dr", "odt", "extended", "release", "generic", "brand",
+}
+
+
+class MedicineName(BaseModel):
+    canonical: str
+    dosage: str | None = None
+    # dictionary name the input matched and its edit distance to it
+    matched: str
+    distance: int = 0
+
+
+def _clean(text: str) -> str:
+    text = re.sub(r"[^a-z0-9\s-]", " ", text.lower()).replace("-", " ")
+    return " ".join(word for word in text.split() if word not in FORM_WORDS)
+
+
+def _deletes(term: str, max_distance: int) -> set[str]:
+    """All strings obtained by deleting up to max_distance characters from term."""
+    deletes, frontier = {term}, {term}
+    for _ in range(max_distance):
+        frontier = {word[:i] + word[i + 1:] for word in frontier for i in range(len(word))}
+        deletes |= frontier
+    return deletes
+
+
+def edit_distance(a: str, b: str, max_distance: int) -> int:
+    """Optimal string alignment distance, or max_distance + 1 once it is exceeded."""
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    previous2, previous = None, list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i] + [0] * len(b)
+        for j, char_b in enumerate(b, 1):
+            cost = char_a != char_b
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and char_a == b[j - 2] and a[i - 2] == char_b:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        if min(current) > max_distance:
+            return max_distance + 1
+        previous2, previous = previous, current
+    return previous[-1]
+
+
+class MedicineNameIndex:
+    """
+    Maps brand, generic, misspelled and dosage-suffixed medicine names to a canonical name.
+
+    Brand and generic names are matched exactly; input naming several
+    medicines is ambiguous to `normalize`, `normalize_all` returns each of
+    them. A misspelled name is only corrected if it is at most
+    `max_distance` edits from a single dictionary name and no other one is
+    within MEDICINE_SUGGEST_DISTANCE; anything less certain is left alone,
+    `suggest` offers the closest name instead.
+
+    Fuzzy matching is SymSpell-style: every dictionary name is indexed under
+    the strings left after deleting up to MEDICINE_SUGGEST_DISTANCE characters,
+    so a query only has to look up its own deletes and verify the few candidates.
+    """
+
+    def __init__(
+        self,
+        names: dict[str, list[str]],
+        max_distance: int = MEDICINE_MAX_EDIT_DISTANCE,
+        min_length: int = MEDICINE_FUZZY_MIN_LENGTH,
+    ):
+        self.max_distance = max_distance
+        self.min_length = min_length
+        self.suggest_distance = max(max_distance, MEDICINE_SUGGEST_DISTANCE)
+        # cleaned name -> canonical name
+        self._names = {}
+        for canonical, aliases in names.items():
+            for name in [canonical, *aliases]:
+                self._names.setdefault(_clean(name), _clean(canonical))
+        self._longest = max(len(name.split()) for name in self._names)
+        self._deletes = {}
+        for name in self._names:
+            for deleted in _deletes(name, self.suggest_distance):
+                self._deletes.setdefault(deleted, []).append(name)
+        self.normalize = functools.lru_cache(maxsize=MEDICINE_NAME_CACHE_SIZE)(self._normalize)
+        self.normalize_all = functools.lru_cache(maxsize=MEDICINE_NAME_CACHE_SIZE)(self._normalize_all)
+
+    @classmethod
+    def load(cls, path: str = MEDICINE_NAMES_PATH) -> "MedicineNameIndex":
+        names = {canonical: list(aliases) for canonical, aliases in DEFAULT_MEDICINE_NAMES.items()}
+        if os.path.exists(path):
+            with open(path, newline="") as f:
+                for row in csv.DictReader(f):
+                    names.setdefault(row["canonical"], []).append(row["alias"])
+        return cls(names)
+
+    def _near(self, term: str) -> list[tuple[int, str]]:
+        """(distance, name) of the dictionary names within suggest_distance of term, closest first."""
+        if len(term) < self.min_length:
+            return []
+        found = set()
+        for deleted in _deletes(term, self.suggest_distance):
+            for name in self._deletes.get(deleted, ()):
+                distance = edit_distance(term, name, self.suggest_distance)
+                if distance <= self.suggest_distance:
+                    found.add((distance, name))
+        return sorted(found)
+
+    @staticmethod
+    def _parse(raw: str) -> tuple[str, str | None]:
+        dosage_match = DOSAGE_PATTERN.search(raw)
+        dosage = "".join(dosage_match.groups()).lower() if dosage_match else None
+        return _clean(DOSAGE_PATTERN.sub(" ", raw)), dosage
+
+    def _exact_names(self, words: list[str]):
+        """Yields the dictionary names in words, left to right, the longest one at each position."""
+        i = 0
+        while i < len(words):
+            for length in range(min(self._longest, len(words) - i), 0, -1):
+                span = " ".join(words[i:i + length])
+                if span in self._names:
+                    yield span
+                    i += length
+                    break
+            else:
+                i += 1
+
+    def _normalize_all(self, raw: str) -> tuple[MedicineName, ...]:
+        text, dosage = self._parse(raw)
+        if not text:
+            return ()
+
+        # exact brand or generic names anywhere in the input, e.g. "viagra" in "viagra for ed"
+        matches = {}
+        for span in self._exact_names(text.split()):
+            matches.setdefault(self._names[span], span)
+        if matches:
+            # with several medicines there's no telling which one the dosage is for
+            dosage = dosage if len(matches) == 1 else None
+            return tuple(
+                MedicineName(canonical=canonical, dosage=dosage, matched=span) for canonical, span in matches.items()
+            )
+
+        # only the whole name is corrected, and only if one medicine is that close
+        near = self._near(text)
+        if near and near[0][0] <= self.max_distance:
+            if len({self._names[name] for _, name in near}) == 1:
+                distance, name = near[0]
+                return (MedicineName(canonical=self._names[name], dosage=dosage, matched=name, distance=distance),)
+        return ()
+
+    def _normalize(self, raw: str) -> MedicineName | None:
+        matches = self._normalize_all(raw)
+        # input naming several medicines, e.g. "advil and tylenol", is ambiguous
+        return matches[0] if len(matches) == 1 else None
+
+    def suggest(self, raw: str) -> MedicineName | None:
+        """The closest dictionary name for a "did you mean", if one is nearer than all others."""
+        text, dosage = self._parse(raw)
+        near = self._near(text)
+        closest = [(distance, name) for distance, name in near if distance == near[0][0]]
+        if len({self._names[name] for _, name in closest}) != 1:
+            return None
+        distance, name = closest[0]
+        return MedicineName(canonical=self._names[name], dosage=dosage, matched=name, distance=distance)
+
+    def mentions(self, text: str) -> collections.Counter:
+        """Counts exact mentions of dictionary names in text, by canonical name."""
+        return collections.Counter(self._names[span] for span in self._exact_names(_clean(text).split()))
+
+    def detect(self, text: str, source_name: str | None = None) -> str | None:
+        """
+        The medicine a document is about: the one its file name or URL names,
+        else the one making up most of its mentions. Only exact brand or
+        generic names count, and a source naming several medicines, e.g.
+        "prilosec-vs-nexium", is about none of them.
+        """
+        if source_name:
+            named = self.mentions(re.sub(r"[_.]", " ", source_name))
+            if len(named) == 1:
+                return next(iter(named))
+            if named:
+                return None
+        counts = self.mentions(text)
+        if not counts:
+            return None
+        canonical, count = counts.most_common(1)[0]
+        return canonical if count >= DETECT_MIN_MENTIONS and count * 2 > sum(counts.values()) else None
+
+    def canonical_name(self, raw: str) -> str:
+        """The canonical name if known, else the input without dosage and form words."""
+        match = self.normalize(raw)
+        if match is not None:
+            return match.canonical
+        return self._parse(raw)[0] or raw.strip()
+
+
+medicine_name_index = MedicineNameIndex.load()
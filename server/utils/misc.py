@@ -1,3 +1,9 @@
+import asyncio
+import contextvars
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 from inspect import signature
 from pydantic import BaseModel, create_model
 from pydantic.fields import FieldInfo
@@ -14,6 +20,72 @@ from llama_index.core.workflow import (
 
 AsyncCallable = Callable[..., Awaitable[Any]]
 
+# threads shared by all sync tools, separate from the loop's default executor
+TOOL_THREADS = int(os.getenv("TOOL_THREADS", "16"))
+_tool_executor = ThreadPoolExecutor(max_workers=TOOL_THREADS, thread_name_prefix="tool")
+
+
+@dataclass
+class CachedToolMetadata(ToolMetadata):
+    """Tool metadata that builds the JSON schema of its parameters only once."""
+
+    def get_parameters_dict(self) -> dict:
+        parameters = self.__dict__.get("_parameters")
+        if parameters is None:
+            parameters = super().get_parameters_dict()
+            self.__dict__["_parameters"] = parameters
+        # callers (e.g. the OpenAI LLM) add top-level keys to the returned dict
+        return dict(parameters)
+
+
+def with_cached_schema(tool: FunctionTool) -> FunctionTool:
+    """Swaps a function tool's metadata for CachedToolMetadata, in place."""
+    metadata = tool.metadata
+    if isinstance(tool, FunctionTool) and not isinstance(metadata, CachedToolMetadata):
+        tool._metadata = CachedToolMetadata(
+            description=metadata.description,
+            name=metadata.name,
+            fn_schema=metadata.fn_schema,
+            return_direct=metadata.return_direct,
+        )
+    return tool
+
+
+class ThreadSafeContext:
+    """
+    Workflow context handed to a sync tool running in a worker thread.
+
+    Events are scheduled onto the event loop instead of being put on its
+    queues from the worker thread; everything else is passed through.
+    """
+
+    def __init__(self, ctx: Context, loop: asyncio.AbstractEventLoop):
+        self._ctx = ctx
+        self._loop = loop
+
+    def write_event_to_stream(self, ev) -> None:
+        self._loop.call_soon_threadsafe(self._ctx.write_event_to_stream, ev)
+
+    def send_event(self, message, step: Optional[str] = None) -> None:
+        self._loop.call_soon_threadsafe(self._ctx.send_event, message, step)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._ctx, name)
+
+
+def offload_tool_fn(fn: Callable[..., Any]) -> AsyncCallable:
+    """Wraps a sync tool function taking ctx first so it runs in the tool thread pool."""
+
+    @functools.wraps(fn)
+    async def _offloaded(ctx: Context, *args: Any, **kwargs: Any) -> Any:
+        loop = asyncio.get_running_loop()
+        call = functools.partial(fn, ThreadSafeContext(ctx, loop), *args, **kwargs)
+        return await loop.run_in_executor(
+            _tool_executor, contextvars.copy_context().run, call
+        )
+
+    return _offloaded
+
 
 def create_schema_from_function(
     name: str,
@@ -69,7 +141,9 @@ class FunctionToolWithContext(FunctionTool):
     """
     A function tool that also includes passing in workflow context.
 
-    Only overrides the call methods to include the context.
+    Only overrides the call methods to include the context. Sync functions
+    without an async counterpart run in the tool thread pool when called
+    asynchronously, so they never block the event loop.
     """
 
     @classmethod
@@ -89,22 +163,27 @@ class FunctionToolWithContext(FunctionTool):
             name = name or fn_to_parse.__name__
             docstring = fn_to_parse.__doc__
 
-            # TODO: Very hacky way to remove the ctx parameter from the signature
-            signature_str = str(signature(fn_to_parse))
-            signature_str = signature_str.replace(
-                "ctx: llama_index.core.workflow.context.Context, ", ""
+            # the LLM never passes ctx, so leave it out of the description
+            fn_signature = signature(fn_to_parse)
+            fn_signature = fn_signature.replace(
+                parameters=[
+                    param for param in fn_signature.parameters.values()
+                    if param.name != "ctx"
+                ]
             )
-            description = description or f"{name}{signature_str}\n{docstring}"
+            description = description or f"{name}{fn_signature}\n{docstring}"
             if fn_schema is None:
                 fn_schema = create_schema_from_function(
                     f"{name}", fn_to_parse, additional_fields=None
                 )
-            tool_metadata = ToolMetadata(
+            tool_metadata = CachedToolMetadata(
                 name=name,
                 description=description,
                 fn_schema=fn_schema,
                 return_direct=return_direct,
             )
+        if async_fn is None:
+            async_fn = offload_tool_fn(fn)
         return cls(fn=fn, metadata=tool_metadata, async_fn=async_fn)
 
     def call(self, ctx: Context, *args: Any, **kwargs: Any) -> ToolOutput:
@@ -0,0 +1,239 @@
+import abc
+import asyncio
+import os
+import threading
+import time
+import urllib.parse
+
+import httpx
+from pydantic import BaseModel
+
+# seconds a provider's quote stays cached
+PRICE_CACHE_TTL = float(os.getenv("PRICE_CACHE_TTL", "900"))
+PRICE_CACHE_MAX_ENTRIES = int(os.getenv("PRICE_CACHE_MAX_ENTRIES", "10000"))
+# seconds a comparison waits for providers; slower ones finish in the background
+PRICE_LATENCY_BUDGET = float(os.getenv("PRICE_LATENCY_BUDGET", "1.5"))
+# seconds before a single provider request is abandoned
+PRICE_PROVIDER_TIMEOUT = float(os.getenv("PRICE_PROVIDER_TIMEOUT", "5"))
+# "Name=https://vendor/api?q={medicine}&dosage={dosage}&zip={zip_code},Other=..."
+PRICE_PROVIDER_URLS = os.getenv("PRICE_PROVIDER_URLS", "")
+
+
+class PriceQuote(BaseModel):
+    provider: str
+    medicine: str
+    price: float
+    dosage: str | None = None
+    url: str | None = None
+
+
+class PriceProvider(abc.ABC):
+    """A vendor to fetch medicine prices from; `afetch` returns None if it has no offer."""
+
+    name: str = "provider"
+    timeout: float = PRICE_PROVIDER_TIMEOUT
+
+    @abc.abstractmethod
+    async def afetch(self, medicine: str, dosage: str | None, zip_code: str | None) -> PriceQuote | None:
+        ...
+
+    async def aclose(self) -> None:
+        """Releases the provider's connections."""
+
+
+class StaticPriceProvider(PriceProvider):
+    """Quotes from a fixed price list, optionally slow or failing, for defaults and local testing."""
+
+    def __init__(self, name: str, prices: dict | None = None, default: float | None = None, delay: float = 0.0, error: str | None = None):
+        self.name = name
+        self.prices = {medicine.lower(): price for medicine, price in (prices or {}).items()}
+        self.default = default
+        self.delay = delay
+        self.error = error
+
+    async def afetch(self, medicine, dosage, zip_code):
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        if self.error:
+            raise RuntimeError(self.error)
+        price = self.prices.get(medicine.lower(), self.default)
+        if price is None:
+            return None
+        return PriceQuote(provider=self.name, medicine=medicine, price=price, dosage=dosage)
+
+
+class HttpPriceProvider(PriceProvider):
+    """
+    Fetches a JSON quote from a vendor endpoint.
+
+    `url_template` is formatted with medicine, dosage and zip_code; the
+    response must have a numeric "price" and may have a "url".
+    """
+
+    def __init__(self, name: str, url_template: str, client: httpx.AsyncClient | None = None, timeout: float = PRICE_PROVIDER_TIMEOUT):
+        self.name = name
+        self.url_template = url_template
+        self.timeout = timeout
+        self._client = client
+        # a client passed in is closed by its owner
+        self._owns_client = client is None
+
+    def _get_client(self):
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=self.timeout)
+        return self._client
+
+    async def aclose(self):
+        if self._owns_client and self._client is not None:
+            client, self._client = self._client, None
+            await client.aclose()
+
+    async def afetch(self, medicine, dosage, zip_code):
+        url = self.url_template.format(
+            medicine=urllib.parse.quote(medicine),
+            dosage=urllib.parse.quote(dosage or ""),
+            zip_code=zip_code or "",
+        )
+        response = await self._get_client().get(url)
+        if response.status_code == 404:
+            return None
+        response.raise_for_status()
+        data = response.json()
+        if data.get("price") is None:
+            return None
+        return PriceQuote(
+            provider=self.name, medicine=medicine, price=float(data["price"]), dosage=dosage, url=data.get("url")
+        )
+
+
+def providers_from_env(spec: str = PRICE_PROVIDER_URLS) -> list[PriceProvider]:
+    providers = []
+    for entry in filter(None, (entry.strip() for entry in spec.split(","))):
+        name, _, url_template = entry.partition("=")
+        providers.append(HttpPriceProvider(name.strip(), url_template.strip()))
+    return providers
+
+
+def default_providers() -> list[PriceProvider]:
+    """Vendors configured in PRICE_PROVIDER_URLS, or the demo price list without them."""
+    return providers_from_env() or [
+        StaticPriceProvider("Amazon", default=10.99),
+        StaticPriceProvider("Walmart", default=9.99),
+        StaticPriceProvider("Target", default=8.99),
+    ]
+
+
+class PriceComparer:
+    """
+    Queries all price providers concurrently and caches their quotes.
+
+    Quotes are cached per provider under (medicine, dosage, zip) for `ttl`
+    seconds. A comparison returns whatever arrived within `latency_budget`;
+    providers that are still running keep going in the background, bounded
+    by their own timeout, and fill the cache for the next request. Failing
+    providers are reported and not cached.
+    """
+
+    def __init__(
+        self,
+        providers: list[PriceProvider] | None = None,
+        ttl: float = PRICE_CACHE_TTL,
+        latency_budget: float = PRICE_LATENCY_BUDGET,
+        max_entries: int = PRICE_CACHE_MAX_ENTRIES,
+    ):
+        self.providers = providers if providers is not None else default_providers()
+        self.ttl = ttl
+        self.latency_budget = latency_budget
+        self.max_entries = max_entries
+        # (provider, medicine, dosage, zip) -> (expires_at, quote or None)
+        self._cache = {}
+        self._lock = threading.Lock()
+        # fetches in flight, shared by concurrent comparisons of the same key
+        self._inflight = {}
+
+    @staticmethod
+    def _key(provider, medicine, dosage, zip_code):
+        return (provider.name, medicine.strip().lower(), (dosage or "").strip().lower(), zip_code or "")
+
+    def _cached(self, key):
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is None:
+                return False, None
+            if entry[0] < time.monotonic():
+                del self._cache[key]
+                return False, None
+            return True, entry[1]
+
+    def _store(self, key, quote):
+        with self._lock:
+            if len(self._cache) >= self.max_entries:
+                now = time.monotonic()
+                self._cache = {k: v for k, v in self._cache.items() if v[0] >= now}
+                while len(self._cache) >= self.max_entries:
+                    del self._cache[next(iter(self._cache))]
+            self._cache[key] = (time.monotonic() + self.ttl, quote)
+
+    async def _fetch(self, provider, key, medicine, dosage, zip_code):
+        try:
+            quote = await asyncio.wait_for(provider.afetch(medicine, dosage, zip_code), provider.timeout)
+        finally:
+            self._inflight.pop(key, None)
+        # "no offer" is cached too, so it isn't asked for again until it expires
+        self._store(key, quote)
+        return quote
+
+    def _start_fetch(self, provider, key, medicine, dosage, zip_code):
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._fetch(provider, key, medicine, dosage, zip_code))
+            # retrieve the exception of fetches nobody waits for anymore
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+            self._inflight[key] = task
+        return task
+
+    async def acompare(self, medicine: str, dosage: str | None = None, zip_code: str | None = None) -> dict:
+        """Returns quotes sorted by price, the best one, and the providers that failed or are still pending."""
+        start = time.perf_counter()
+        quotes, tasks = [], {}
+        for provider in self.providers:
+            key = self._key(provider, medicine, dosage, zip_code)
+            hit, quote = self._cached(key)
+            if hit:
+                if quote is not None:
+                    quotes.append(quote)
+            else:
+                tasks[provider.name] = self._start_fetch(provider, key, medicine, dosage, zip_code)
+
+        failed, pending = [], []
+        if tasks:
+            # fetches still running after the budget are not cancelled
+            await asyncio.wait(tasks.values(), timeout=self.latency_budget)
+            for name, task in tasks.items():
+                if not task.done():
+                    pending.append(name)
+                elif task.cancelled() or task.exception() is not None:
+                    failed.append(name)
+                elif task.result() is not None:
+                    quotes.append(task.result())
+
+        quotes.sort(key=lambda quote: quote.price)
+        return {
+            "medicine": medicine,
+            "dosage": dosage,
+            "zip_code": zip_code,
+            "quotes": quotes,
+            "best": quotes[0] if quotes else None,
+            "failed": failed,
+            "pending": pending,
+            "elapsed_ms": round((time.perf_counter() - start) * 1000, 1),
+        }
+
+    async def aclose(self) -> None:
+        """Cancels fetches still in flight and closes the providers' connections."""
+        for task in list(self._inflight.values()):
+            task.cancel()
+        await asyncio.gather(*(provider.aclose() for provider in self.providers))
+
+
+price_comparer = PriceComparer()
@@ -0,0 +1,106 @@
+import copy
+import os
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Callable
+
+from llama_index.core.memory import ChatMemoryBuffer
+
+# max tokens of history handed to the workflow per session; the workflow
+# compacts it further to CONTEXT_TOKEN_BUDGET before each LLM call
+CHAT_TOKEN_LIMIT = int(os.getenv("CHAT_TOKEN_LIMIT", "16000"))
+# sessions without a connection are dropped from memory after this many seconds
+SESSION_IDLE_TTL = float(os.getenv("SESSION_IDLE_TTL", "1800"))
+# max sessions kept in memory; least recently used idle ones are evicted first
+MAX_SESSIONS = int(os.getenv("MAX_SESSIONS", "1000"))
+
+SESSION_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{8,64}$")
+
+
+class ChatSession:
+    def __init__(self, session_id: str, memory: ChatMemoryBuffer, user_state: dict):
+        self.session_id = session_id
+        self.memory = memory
+        self.user_state = user_state
+        self.connections = 0
+        self.last_active = time.monotonic()
+
+
+class SessionStore:
+    """
+    Chat sessions keyed by the session id the client sends on connect.
+
+    Each session has its own token-bounded memory, loaded on first connect,
+    and its own copy of `initial_state`. `on_disconnect` runs whenever a
+    connection closes. Sessions without an open connection are dropped once
+    idle for `idle_ttl` seconds, or least recently used first when more than
+    `max_sessions` are resident.
+    """
+
+    def __init__(
+        self,
+        load_memory: Callable[[str], ChatMemoryBuffer],
+        on_disconnect: Callable[[str, ChatMemoryBuffer], None],
+        initial_state: dict | None = None,
+        idle_ttl: float = SESSION_IDLE_TTL,
+        max_sessions: int = MAX_SESSIONS,
+    ):
+        self.load_memory = load_memory
+        self.on_disconnect = on_disconnect
+        self.initial_state = initial_state or {}
+        self.idle_ttl = idle_ttl
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def _drop(self, session):
+        del self._sessions[session.session_id]
+
+    def _evict(self):
+        now = time.monotonic()
+        idle = [session for session in self._sessions.values() if session.connections == 0]
+        for session in idle:
+            if now - session.last_active > self.idle_ttl:
+                self._drop(session)
+        # sessions are ordered from least to most recently used
+        for session in idle:
+            if len(self._sessions) <= self.max_sessions:
+                break
+            if session.session_id in self._sessions:
+                self._drop(session)
+
+    def connect(self, session_id: str | None) -> ChatSession:
+        """Returns the session for `session_id`, starting a new one if it is missing or invalid."""
+        if not session_id or not SESSION_ID_PATTERN.match(session_id):
+            session_id = uuid.uuid4().hex
+
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = ChatSession(
+                    session_id, self.load_memory(session_id), copy.deepcopy(self.initial_state)
+                )
+                self._sessions[session_id] = session
+            self._sessions.move_to_end(session_id)
+            session.connections += 1
+            session.last_active = time.monotonic()
+            self._evict()
+        return session
+
+    def touch(self, session: ChatSession) -> None:
+        with self._lock:
+            session.last_active = time.monotonic()
+            if session.session_id in self._sessions:
+                self._sessions.move_to_end(session.session_id)
+
+    def disconnect(self, session: ChatSession) -> None:
+        with self._lock:
+            session.connections -= 1
+            session.last_active = time.monotonic()
+        self.on_disconnect(session.session_id, session.memory)
@@ -0,0 +1,42 @@
+import os
+import threading
+from collections import defaultdict, deque
+
+import numpy as np
+
+# latency percentiles are computed over each tool's most recent calls
+TOOL_STATS_WINDOW = int(os.getenv("TOOL_STATS_WINDOW", "1000"))
+
+
+class ToolStats:
+    """Per-tool call counts, failures and latency of recent calls."""
+
+    def __init__(self, window: int = TOOL_STATS_WINDOW):
+        self._lock = threading.Lock()
+        self._counts = defaultdict(lambda: {"calls": 0, "errors": 0, "timeouts": 0})
+        self._latencies = defaultdict(lambda: deque(maxlen=window))
+
+    def record(self, tool_name: str, elapsed_ms: float, error: bool = False, timeout: bool = False) -> None:
+        with self._lock:
+            counts = self._counts[tool_name]
+            counts["calls"] += 1
+            counts["errors"] += error
+            counts["timeouts"] += timeout
+            self._latencies[tool_name].append(elapsed_ms)
+
+    def stats(self) -> dict:
+        with self._lock:
+            snapshot = {name: (dict(counts), list(self._latencies[name])) for name, counts in self._counts.items()}
+        stats = {}
+        for name, (counts, latencies) in snapshot.items():
+            p50, p95, top = np.percentile(latencies, [50, 95, 100])
+            stats[name] = {
+                **counts,
+                "p50_ms": round(float(p50), 1),
+                "p95_ms": round(float(p95), 1),
+                "max_ms": round(float(top), 1),
+            }
+        return stats
+
+
+tool_stats = ToolStats()
@@ -0,0 +1,331 @@
+import json
+import math
+import os
+import re
+
+import faiss
+import numpy as np
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.core.schema import MetadataMode
+from llama_index.core.vector_stores.types import (
+    FilterCondition,
+    FilterOperator,
+    MetadataFilters,
+    VectorStoreQueryMode,
+    VectorStoreQueryResult,
+)
+from llama_index.vector_stores.faiss import FaissVectorStore
+
+from server.utils.bm25 import BM25Index, reciprocal_rank_fusion
+
+# dimensions of text-ada-embedding-002
+EMBED_DIM = 1536
+# faiss index_factory string, e.g. "Flat", "IVF,Flat", "IVF1024,Flat", "HNSW32", "IVF,PQ64".
+# "IVF" without a list count gets one sized to the corpus at training time.
+FAISS_INDEX_FACTORY = os.getenv("FAISS_INDEX_FACTORY", "Flat")
+# below this many vectors brute force is exact and fast enough, so nothing is trained
+FAISS_MIN_TRAIN_VECTORS = int(os.getenv("FAISS_MIN_TRAIN_VECTORS", "10000"))
+DEFAULT_SEARCH_PARAMS = {"nprobe": 16, "efSearch": 64}
+SEARCH_PARAMS_FNAME = "faiss_search_params.json"
+# node metadata keys whose values map to faiss ids, so searches can be restricted to them
+FILTER_METADATA_KEYS = ("drug_name", "source_type")
+PARTITIONS_FNAME = "faiss_partitions.json"
+# faiss ids of deleted vectors, skipped by every search until the next rebuild
+DELETED_FNAME = "faiss_deleted.json"
+BM25_FNAME = "bm25_index.json"
+# dense and keyword candidates per query that hybrid search fuses
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "20"))
+
+
+def _env_search_params():
+    params = {}
+    if os.getenv("FAISS_NPROBE"):
+        params["nprobe"] = int(os.getenv("FAISS_NPROBE"))
+    if os.getenv("FAISS_EF_SEARCH"):
+        params["efSearch"] = int(os.getenv("FAISS_EF_SEARCH"))
+    return params
+
+
+def _resolve_factory(factory, num_vectors):
+    nlist = max(1, min(int(4 * math.sqrt(num_vectors)), num_vectors // 39))
+    return re.sub(r"IVF(?!\d)", f"IVF{nlist}", factory)
+
+
+def get_search_params(faiss_index):
+    """Returns the query-time parameters currently set on the index."""
+    params = {}
+    ivf = faiss.try_extract_index_ivf(faiss_index)
+    if ivf is not None:
+        params["nprobe"] = ivf.nprobe
+    index = faiss.downcast_index(faiss_index)
+    if hasattr(index, "hnsw"):
+        params["efSearch"] = index.hnsw.efSearch
+    return params
+
+
+def set_search_params(faiss_index, params):
+    ivf = faiss.try_extract_index_ivf(faiss_index)
+    if ivf is not None and "nprobe" in params:
+        ivf.nprobe = params["nprobe"]
+    index = faiss.downcast_index(faiss_index)
+    if hasattr(index, "hnsw") and "efSearch" in params:
+        index.hnsw.efSearch = params["efSearch"]
+
+
+def restricted_search_params(faiss_index, selector):
+    """Search parameters limiting a search to the ids in `selector`, keeping nprobe/efSearch."""
+    params = get_search_params(faiss_index)
+    if faiss.try_extract_index_ivf(faiss_index) is not None:
+        return faiss.SearchParametersIVF(sel=selector, nprobe=params["nprobe"])
+    if "efSearch" in params:
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=params["efSearch"])
+    return faiss.SearchParameters(sel=selector)
+
+
+def make_faiss_index(training_vectors, factory=FAISS_INDEX_FACTORY, min_train_vectors=FAISS_MIN_TRAIN_VECTORS):
+    """
+    Creates an empty faiss index of the configured type, trained on `training_vectors`.
+
+    Falls back to flat L2 search when the corpus is too small to train on.
+    """
+    training_vectors = np.ascontiguousarray(training_vectors, dtype="float32").reshape(-1, EMBED_DIM)
+    if factory == "Flat" or len(training_vectors) < min_train_vectors:
+        return faiss.IndexFlatL2(EMBED_DIM)
+
+    faiss_index = faiss.index_factory(EMBED_DIM, _resolve_factory(factory, len(training_vectors)))
+    if not faiss_index.is_trained:
+        faiss_index.train(training_vectors)
+    set_search_params(faiss_index, {**DEFAULT_SEARCH_PARAMS, **_env_search_params()})
+    return faiss_index
+
+
+def needs_retrain(faiss_index):
+    """True if a flat index has grown large enough for the configured index type."""
+    return (
+        FAISS_INDEX_FACTORY != "Flat"
+        and isinstance(faiss.downcast_index(faiss_index), faiss.IndexFlat)
+        and faiss_index.ntotal >= FAISS_MIN_TRAIN_VECTORS
+    )
+
+
+def retrain_from_flat(faiss_index):
+    """Moves the vectors of a flat index into a newly trained one, keeping their ids."""
+    vectors = faiss_index.reconstruct_n(0, faiss_index.ntotal)
+    trained = make_faiss_index(vectors)
+    trained.add(vectors)
+    return trained
+
+
+class MedFaissVectorStore(FaissVectorStore):
+    """
+    FAISS vector store for the med index.
+
+    Adds a whole batch of nodes in a single faiss `add` call and persists the
+    query-time search parameters (nprobe/efSearch) next to the index.
+
+    For the FILTER_METADATA_KEYS it also keeps {key: {value: [faiss ids]}},
+    so metadata filters become an id selector: faiss only ranks the vectors
+    of the matching documents instead of the whole corpus.
+
+    Node texts also go into a BM25 index under their faiss ids; hybrid
+    queries fuse the dense and keyword rankings with reciprocal-rank fusion.
+
+    Not every faiss index type can remove vectors without renumbering the
+    rest, so deleted ids are dropped from the partitions and BM25 and only
+    masked out of faiss searches; a rebuild reclaims their space.
+    """
+
+    _partitions: dict = PrivateAttr(default_factory=dict)
+    _bm25: BM25Index = PrivateAttr(default_factory=BM25Index)
+    # (key, value) -> sorted id array, rebuilt after adds
+    _partition_ids: dict = PrivateAttr(default_factory=dict)
+    _deleted: set = PrivateAttr(default_factory=set)
+    # selectors excluding the deleted ids, rebuilt after deletes
+    _deleted_selector: tuple | None = PrivateAttr(default=None)
+
+    @classmethod
+    def from_persist_path(cls, persist_path, fs=None):
+        vector_store = super().from_persist_path(persist_path, fs=fs)
+        params = dict(DEFAULT_SEARCH_PARAMS)
+        params_path = os.path.join(os.path.dirname(persist_path), SEARCH_PARAMS_FNAME)
+        if os.path.exists(params_path):
+            with open(params_path, "r") as f:
+                params.update(json.load(f))
+        set_search_params(vector_store.client, {**params, **_env_search_params()})
+
+        partitions_path = os.path.join(os.path.dirname(persist_path), PARTITIONS_FNAME)
+        if os.path.exists(partitions_path):
+            with open(partitions_path, "r") as f:
+                vector_store.set_partitions(json.load(f))
+        bm25_path = os.path.join(os.path.dirname(persist_path), BM25_FNAME)
+        if os.path.exists(bm25_path):
+            vector_store.set_bm25(BM25Index.load(bm25_path))
+        deleted_path = os.path.join(os.path.dirname(persist_path), DELETED_FNAME)
+        if os.path.exists(deleted_path):
+            with open(deleted_path, "r") as f:
+                vector_store.set_deleted(json.load(f))
+        return vector_store
+
+    def persist(self, persist_path, fs=None):
+        super().persist(persist_path, fs=fs)
+        params_path = os.path.join(os.path.dirname(persist_path), SEARCH_PARAMS_FNAME)
+        with open(params_path, "w") as f:
+            json.dump(get_search_params(self._faiss_index), f, indent=4)
+        with open(os.path.join(os.path.dirname(persist_path), PARTITIONS_FNAME), "w") as f:
+            json.dump(self._partitions, f)
+        self._bm25.save(os.path.join(os.path.dirname(persist_path), BM25_FNAME))
+        with open(os.path.join(os.path.dirname(persist_path), DELETED_FNAME), "w") as f:
+            json.dump(sorted(self._deleted), f)
+
+    def set_faiss_index(self, faiss_index):
+        self._faiss_index = faiss_index
+
+    def set_partitions(self, partitions):
+        self._partitions = partitions
+        self._partition_ids = {}
+
+    @property
+    def bm25(self) -> BM25Index:
+        return self._bm25
+
+    def set_bm25(self, bm25):
+        self._bm25 = bm25
+
+    def set_deleted(self, ids):
+        self._deleted = set(ids)
+        self._deleted_selector = None
+
+    def add(self, nodes, **add_kwargs):
+        if not nodes:
+            return []
+        start = self._faiss_index.ntotal
+        embeddings = np.array([node.get_embedding() for node in nodes], dtype="float32")
+        self._faiss_index.add(embeddings)
+        for i, node in enumerate(nodes):
+            for key in FILTER_METADATA_KEYS:
+                value = node.metadata.get(key)
+                if value is not None:
+                    self._partitions.setdefault(key, {}).setdefault(str(value), []).append(start + i)
+            self._bm25.add(start + i, node.get_content(metadata_mode=MetadataMode.NONE))
+        self._partition_ids = {}
+        return [str(start + i) for i in range(len(nodes))]
+
+    def delete_ids(self, ids, texts):
+        """Deletes the vectors with faiss `ids`; `texts` are their node texts, to unindex them from BM25."""
+        ids = [int(id_) for id_ in ids]
+        removed = set(ids)
+        for values in self._partitions.values():
+            for value, partition in values.items():
+                if not removed.isdisjoint(partition):
+                    values[value] = [id_ for id_ in partition if id_ not in removed]
+        for id_, text in zip(ids, texts):
+            self._bm25.remove(id_, text)
+        self.set_deleted(self._deleted | removed)
+        self._partition_ids = {}
+
+    @property
+    def num_deleted(self):
+        return len(self._deleted)
+
+    def partition_size(self, key, value):
+        """Number of vectors whose node has metadata `key` == `value`."""
+        return len(self._partitions.get(key, {}).get(str(value), ()))
+
+    def _ids_for(self, key, value):
+        ids = self._partition_ids.get((key, str(value)))
+        if ids is None:
+            ids = np.array(self._partitions.get(key, {}).get(str(value), ()), dtype="int64")
+            self._partition_ids[(key, str(value))] = ids
+        return ids
+
+    def filter_ids(self, filters: MetadataFilters):
+        """Faiss ids of the vectors matching `filters`; supports ==/in on FILTER_METADATA_KEYS."""
+        id_sets = []
+        for metadata_filter in filters.filters:
+            if isinstance(metadata_filter, MetadataFilters):
+                id_sets.append(self.filter_ids(metadata_filter))
+                continue
+            if metadata_filter.key not in FILTER_METADATA_KEYS:
+                raise ValueError(f"Can't filter on {metadata_filter.key!r}, only on {FILTER_METADATA_KEYS}.")
+            if metadata_filter.operator == FilterOperator.EQ:
+                values = [metadata_filter.value]
+            elif metadata_filter.operator == FilterOperator.IN:
+                values = list(metadata_filter.value)
+            else:
+                raise ValueError(f"Unsupported filter operator {metadata_filter.operator} for the faiss store.")
+            id_sets.append(np.unique(np.concatenate(
+                [self._ids_for(metadata_filter.key, value) for value in values] or [np.empty(0, dtype="int64")]
+            )))
+
+        if not id_sets:
+            return None
+        combine = np.union1d if filters.condition == FilterCondition.OR else np.intersect1d
+        ids = id_sets[0]
+        for other in id_sets[1:]:
+            ids = combine(ids, other)
+        return ids
+
+    def _search(self, queries, similarity_top_k, ids=None):
+        if ids is None and self._deleted:
+            if self._deleted_selector is None:
+                # IDSelectorNot doesn't own the selector it wraps, so both are kept
+                deleted = faiss.IDSelectorBatch(np.array(sorted(self._deleted), dtype="int64"))
+                self._deleted_selector = (deleted, faiss.IDSelectorNot(deleted))
+            return self._faiss_index.search(
+                queries, similarity_top_k,
+                params=restricted_search_params(self._faiss_index, self._deleted_selector[1]),
+            )
+        if ids is None:
+            return self._faiss_index.search(queries, similarity_top_k)
+        if not len(ids):
+            return np.empty((len(queries), 0), dtype="float32"), np.empty((len(queries), 0), dtype="int64")
+        selector = faiss.IDSelectorBatch(ids)
+        return self._faiss_index.search(
+            queries, similarity_top_k, params=restricted_search_params(self._faiss_index, selector)
+        )
+
+    def query(self, query, **kwargs):
+        hybrid = query.mode == VectorStoreQueryMode.HYBRID and bool(query.query_str)
+        if query.filters is None and not hybrid and not self._deleted:
+            return super().query(query, **kwargs)
+        return self.query_many(
+            [query.query_embedding],
+            query.similarity_top_k,
+            ids=self.filter_ids(query.filters) if query.filters is not None else None,
+            query_strs=[query.query_str] if hybrid else None,
+        )[0]
+
+    def query_many(self, query_embeddings, similarity_top_k, ids=None, query_strs=None):
+        """
+        Searches for all query embeddings in one faiss call, returns a result per query.
+
+        `ids` (e.g. from `filter_ids`) restricts the search to those vectors.
+        With `query_strs` the dense candidates of each query are fused with its
+        BM25 candidates, and similarities are the fused scores.
+        """
+        queries = np.array(query_embeddings, dtype="float32").reshape(-1, self._faiss_index.d)
+        if query_strs is not None:
+            return self._hybrid_many(queries, query_strs, similarity_top_k, ids)
+        dists, indices = self._search(queries, similarity_top_k, ids)
+        results = []
+        for row_dists, row_indices in zip(dists, indices):
+            found = [(float(dist), str(idx)) for dist, idx in zip(row_dists, row_indices) if idx >= 0]
+            results.append(VectorStoreQueryResult(
+                similarities=[dist for dist, _ in found],
+                ids=[idx for _, idx in found],
+            ))
+        return results
+
+    def _hybrid_many(self, queries, query_strs, similarity_top_k, ids):
+        num_candidates = max(HYBRID_CANDIDATES, similarity_top_k)
+        _, indices = self._search(queries, num_candidates, ids)
+        results = []
+        for row_indices, query_str in zip(indices, query_strs):
+            dense = [int(idx) for idx in row_indices if idx >= 0]
+            sparse = [idx for idx, _ in self._bm25.search(query_str, num_candidates, ids)]
+            fused = reciprocal_rank_fusion([dense, sparse])[:similarity_top_k]
+            results.append(VectorStoreQueryResult(
+                similarities=[score for _, score in fused],
+                ids=[str(idx) for idx, _ in fused],
+            ))
+        return results
@@ -1,7 +1,12 @@
+import asyncio
+import copy
+import os
+import time
+import uuid
 from typing import Any
 from pydantic import BaseModel, ConfigDict, Field
 
-from llama_index.core.llms import ChatMessage, LLM
+from llama_index.core.llms import ChatMessage, ChatResponse, LLM
 from llama_index.core.program.function_program import get_function_tool
 from llama_index.core.tools import (
     BaseTool,
@@ -18,7 +23,15 @@ from llama_index.core.workflow import (
 from llama_index.core.workflow.events import InputRequiredEvent, HumanResponseEvent
 from llama_index.llms.openai import OpenAI
 
-from server.utils.misc import FunctionToolWithContext
+from server.utils.context_window import ContextCompactor
+from server.utils.intent_router import IntentRouter, intent_router
+from server.utils.misc import FunctionToolWithContext, with_cached_schema
+from server.utils.tool_stats import ToolStats, tool_stats as shared_tool_stats
+
+# tool calls of one conversation running at once
+TOOL_CONCURRENCY = int(os.getenv("TOOL_CONCURRENCY", "4"))
+# seconds a tool call may take before its result is replaced by an error
+TOOL_TIMEOUT = float(os.getenv("TOOL_TIMEOUT", "30"))
 
 
 # ---- Pydantic models for config/llm prediction ----
@@ -34,6 +47,10 @@ class AgentConfig(BaseModel):
     system_prompt: str | None = None
     tools: list[BaseTool] | None = None
     tools_requiring_human_confirmation: list[str] = Field(default_factory=list)
+    # sample user messages this agent handles, used for local intent routing
+    example_utterances: list[str] = Field(default_factory=list)
+    # user state keys that must be set for the local intent router to pick this agent
+    router_requires_state: list[str] = Field(default_factory=list)
 
 
 class TransferToAgent(BaseModel):
@@ -48,6 +65,46 @@ class RequestTransfer(BaseModel):
     pass
 
 
+# ---- Compiled agents ----
+
+
+class CompiledAgent:
+    """An AgentConfig with its tool list, tool lookup and system prompt built once."""
+
+    def __init__(self, config: AgentConfig):
+        self.config = config
+        self.name = config.name
+        self.tools = [with_cached_schema(get_function_tool(RequestTransfer))] + [
+            with_cached_schema(tool) for tool in config.tools or []
+        ]
+        self.tools_by_name = {tool.metadata.get_name(): tool for tool in self.tools}
+        self.system_prompt = (config.system_prompt or "").strip()
+        self.tools_requiring_human_confirmation = set(config.tools_requiring_human_confirmation)
+
+
+class AgentRegistry:
+    """
+    Everything the workflow derives from the agent configs, built once.
+
+    Tool JSON schemas are cached on the tool metadata, so a turn only copies
+    them instead of regenerating them from the pydantic models.
+    """
+
+    def __init__(self, agent_configs: list[AgentConfig]):
+        self.configs = list(agent_configs)
+        self.agents = {ac.name: CompiledAgent(ac) for ac in self.configs}
+        self.orchestrator_tools = [with_cached_schema(get_function_tool(TransferToAgent))]
+        self.agent_context_str = "".join(
+            f"{ac.name}: {ac.description}\n" for ac in self.configs
+        )
+
+    def __getitem__(self, name: str) -> CompiledAgent:
+        return self.agents[name]
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.agents
+
+
 # ---- Events used to orchestrate the workflow ----
 
 
@@ -59,25 +116,37 @@ class OrchestratorEvent(Event):
     pass
 
 
+# tool events carry the batch of the LLM response that requested them and
+# their position in it, so results are put back in the order of the calls
+
+
 class ToolCallEvent(Event):
     tool_call: ToolSelection
-    tools: list[BaseTool]
+    agent_name: str
+    batch_id: str
+    index: int
 
 
 class ToolCallResultEvent(Event):
     chat_message: ChatMessage
+    batch_id: str
+    index: int
 
 
 class ToolRequestEvent(InputRequiredEvent):
     tool_name: str
     tool_id: str
     tool_kwargs: dict
+    batch_id: str
+    index: int
 
 
 class ToolApprovedEvent(HumanResponseEvent):
     tool_name: str
     tool_id: str
     tool_kwargs: dict
+    batch_id: str
+    index: int
     approved: bool
     response: str | None = None
 
@@ -86,6 +155,18 @@ class ProgressEvent(Event):
     msg: str
 
 
+class TokenEvent(Event):
+    """A chunk of the reply as the LLM generates it."""
+
+    delta: str
+
+
+class ChatMessageEvent(Event):
+    """A message added to the chat history, streamed as soon as it is added."""
+
+    message: ChatMessage
+
+
 # ---- Workflow ----
 
 DEFAULT_ORCHESTRATOR_PROMPT = (
@@ -105,6 +186,10 @@ class ConciergeAgent(Workflow):
         self,
         orchestrator_prompt: str | None = None,
         default_tool_reject_str: str | None = None,
+        context_compactor: ContextCompactor | None = None,
+        router: IntentRouter | None = None,
+        tool_stats: ToolStats | None = None,
+        tool_timeout: float = TOOL_TIMEOUT,
         **kwargs: Any,
     ):
         super().__init__(**kwargs)
@@ -112,6 +197,36 @@ class ConciergeAgent(Workflow):
         self.default_tool_reject_str = (
             default_tool_reject_str or DEFAULT_TOOL_REJECT_STR
         )
+        self.context_compactor = context_compactor or ContextCompactor()
+        self.router = router or intent_router
+        self.tool_stats = tool_stats or shared_tool_stats
+        self.tool_timeout = tool_timeout
+
+    async def _astream_with_tools(
+        self,
+        ctx: Context,
+        llm: LLM,
+        tools: list[BaseTool],
+        llm_input: list[ChatMessage],
+        **kwargs: Any,
+    ) -> ChatResponse:
+        """Calls the LLM, forwarding text deltas as TokenEvents, and returns the full response."""
+        response = ChatResponse(message=ChatMessage(role="assistant", content=""))
+        async for response in await llm.astream_chat_with_tools(
+            tools, chat_history=llm_input, **kwargs
+        ):
+            if response.delta:
+                ctx.write_event_to_stream(TokenEvent(delta=response.delta))
+        return response
+
+    async def _add_to_history(
+        self, ctx: Context, chat_history: list[ChatMessage], *messages: ChatMessage
+    ) -> None:
+        """Appends messages to the chat history and streams each one, so callers can persist it right away."""
+        for message in messages:
+            chat_history.append(message)
+            ctx.write_event_to_stream(ChatMessageEvent(message=message))
+        await ctx.set("chat_history", chat_history)
 
     @step
     async def setup(
@@ -121,12 +236,13 @@ class ConciergeAgent(Workflow):
         active_speaker = await ctx.get("active_speaker", default="")
         user_msg = ev.get("user_msg")
         agent_configs = ev.get("agent_configs", default=[])
+        agent_registry = ev.get("agent_registry", default=None)
         llm: LLM = ev.get("llm", default=OpenAI(model="gpt-4o", temperature=0.3))
         chat_history = ev.get("chat_history", default=[])
         initial_state = ev.get("initial_state", default={})
         if (
             user_msg is None
-            or agent_configs is None
+            or (agent_configs is None and agent_registry is None)
             or llm is None
             or chat_history is None
         ):
@@ -137,15 +253,19 @@ class ConciergeAgent(Workflow):
         if not llm.metadata.is_function_calling_model:
             raise ValueError("LLM must be a function calling model!")
 
-        # store the agent configs in the context
-        agent_configs_dict = {ac.name: ac for ac in agent_configs}
-        await ctx.set("agent_configs", agent_configs_dict)
+        # store the compiled agents in the context; callers running many
+        # workflows should pass a prebuilt registry instead of the configs
+        if agent_registry is None:
+            agent_registry = AgentRegistry(agent_configs)
+        await ctx.set("agent_registry", agent_registry)
         await ctx.set("llm", llm)
 
-        chat_history.append(ChatMessage(role="user", content=user_msg))
-        await ctx.set("chat_history", chat_history)
+        await self._add_to_history(ctx, chat_history, ChatMessage(role="user", content=user_msg))
 
-        await ctx.set("user_state", initial_state)
+        # a continued conversation keeps its state; tools update it in place,
+        # so a new one starts from a copy rather than the caller's dict
+        if await ctx.get("user_state", default=None) is None:
+            await ctx.set("user_state", copy.deepcopy(initial_state))
 
         # if there is an active speaker, we need to transfer forward the user to them
         if active_speaker:
@@ -157,35 +277,36 @@ class ConciergeAgent(Workflow):
     @step
     async def speak_with_sub_agent(
         self, ctx: Context, ev: ActiveSpeakerEvent
-    ) -> ToolCallEvent | ToolRequestEvent | StopEvent:
+    ) -> ToolCallEvent | OrchestratorEvent | StopEvent:
         """Speaks with the active sub-agent and handles tool calls (if any)."""
         # Setup the agent for the active speaker
         active_speaker = await ctx.get("active_speaker")
 
-        agent_config: AgentConfig = (await ctx.get("agent_configs"))[active_speaker]
+        agent: CompiledAgent = (await ctx.get("agent_registry"))[active_speaker]
         chat_history = await ctx.get("chat_history")
         llm = await ctx.get("llm")
 
         user_state = await ctx.get("user_state")
         user_state_str = "\n".join([f"{k}: {v}" for k, v in user_state.items()])
         system_prompt = (
-            agent_config.system_prompt.strip()
+            agent.system_prompt
             + f"\n\nHere is the current user state:\n{user_state_str}"
         )
 
-        llm_input = [ChatMessage(role="system", content=system_prompt)] + chat_history
-
-        # inject the request transfer tool into the list of tools
-        tools = [get_function_tool(RequestTransfer)] + agent_config.tools
+        llm_input = await self.context_compactor.build_llm_input(
+            ctx, llm, system_prompt, chat_history
+        )
 
-        response = await llm.achat_with_tools(tools, chat_history=llm_input)
+        # agent.tools already includes the request transfer tool
+        response = await self._astream_with_tools(
+            ctx, llm, agent.tools, llm_input, allow_parallel_tool_calls=True
+        )
 
         tool_calls: list[ToolSelection] = llm.get_tool_calls_from_response(
             response, error_on_no_tool_call=False
         )
         if len(tool_calls) == 0:
-            chat_history.append(response.message)
-            await ctx.set("chat_history", chat_history)
+            await self._add_to_history(ctx, chat_history, response.message)
             return StopEvent(
                 result={
                     "response": response.message.content,
@@ -193,32 +314,44 @@ class ConciergeAgent(Workflow):
                 }
             )
 
-        await ctx.set("num_tool_calls", len(tool_calls))
+        if any(tool_call.tool_name == "RequestTransfer" for tool_call in tool_calls):
+            await ctx.set("active_speaker", None)
+            await ctx.set("transfer_from", active_speaker)
+            ctx.write_event_to_stream(
+                ProgressEvent(msg="Agent is requesting a transfer. Please hold.")
+            )
+            return OrchestratorEvent()
+
+        # the assistant message must precede its tool results in the history
+        await self._add_to_history(ctx, chat_history, response.message)
 
-        for tool_call in tool_calls:
-            if tool_call.tool_name == "RequestTransfer":
-                await ctx.set("active_speaker", None)
-                ctx.write_event_to_stream(
-                    ProgressEvent(msg="Agent is requesting a transfer. Please hold.")
-                )
-                return OrchestratorEvent()
-            elif tool_call.tool_name in agent_config.tools_requiring_human_confirmation:
+        batch_id = uuid.uuid4().hex
+        tool_batches = await ctx.get("tool_batches", default={})
+        tool_batches[batch_id] = {"expected": len(tool_calls), "results": {}}
+        await ctx.set("tool_batches", tool_batches)
+
+        for index, tool_call in enumerate(tool_calls):
+            if tool_call.tool_name in agent.tools_requiring_human_confirmation:
                 ctx.write_event_to_stream(
                     ToolRequestEvent(
                         prefix=f"Tool {tool_call.tool_name} requires human approval.",
                         tool_name=tool_call.tool_name,
                         tool_kwargs=tool_call.tool_kwargs,
                         tool_id=tool_call.tool_id,
+                        batch_id=batch_id,
+                        index=index,
                     )
                 )
             else:
                 ctx.send_event(
-                    ToolCallEvent(tool_call=tool_call, tools=agent_config.tools)
+                    ToolCallEvent(
+                        tool_call=tool_call,
+                        agent_name=active_speaker,
+                        batch_id=batch_id,
+                        index=index,
+                    )
                 )
 
-        chat_history.append(response.message)
-        await ctx.set("chat_history", chat_history)
-
     @step
     async def handle_tool_approval(
         self, ctx: Context, ev: ToolApprovedEvent
@@ -226,85 +359,105 @@ class ConciergeAgent(Workflow):
         """Handles the approval or rejection of a tool call."""
         if ev.approved:
             active_speaker = await ctx.get("active_speaker")
-            agent_config = (await ctx.get("agent_configs"))[active_speaker]
             return ToolCallEvent(
-                tools=agent_config.tools,
+                agent_name=active_speaker,
                 tool_call=ToolSelection(
                     tool_id=ev.tool_id,
                     tool_name=ev.tool_name,
                     tool_kwargs=ev.tool_kwargs,
                 ),
+                batch_id=ev.batch_id,
+                index=ev.index,
             )
         else:
             return ToolCallResultEvent(
                 chat_message=ChatMessage(
                     role="tool",
                     content=ev.response or self.default_tool_reject_str,
-                )
+                    additional_kwargs={"tool_call_id": ev.tool_id, "name": ev.tool_name},
+                ),
+                batch_id=ev.batch_id,
+                index=ev.index,
             )
 
-    @step(num_workers=4)
+    @step(num_workers=TOOL_CONCURRENCY)
     async def handle_tool_call(
         self, ctx: Context, ev: ToolCallEvent
-    ) -> ActiveSpeakerEvent:
+    ) -> ToolCallResultEvent:
         """Handles the execution of a tool call."""
         tool_call = ev.tool_call
-        tools_by_name = {tool.metadata.get_name(): tool for tool in ev.tools}
+        agent: CompiledAgent = (await ctx.get("agent_registry"))[ev.agent_name]
 
-        tool_msg = None
-
-        tool = tools_by_name.get(tool_call.tool_name)
+        tool = agent.tools_by_name.get(tool_call.tool_name)
         additional_kwargs = {
             "tool_call_id": tool_call.tool_id,
-            "name": tool.metadata.get_name(),
+            "name": tool_call.tool_name,
         }
-        if not tool:
-            tool_msg = ChatMessage(
-                role="tool",
-                content=f"Tool {tool_call.tool_name} does not exist",
-                additional_kwargs=additional_kwargs,
-            )
 
+        start = time.perf_counter()
+        error = timeout = False
         try:
+            if tool is None:
+                raise ValueError(f"Tool {tool_call.tool_name} does not exist")
             if isinstance(tool, FunctionToolWithContext):
-                tool_output = await tool.acall(ctx, **tool_call.tool_kwargs)
+                call = tool.acall(ctx, **tool_call.tool_kwargs)
             else:
-                tool_output = await tool.acall(**tool_call.tool_kwargs)
+                call = tool.acall(**tool_call.tool_kwargs)
+            tool_output = await asyncio.wait_for(call, self.tool_timeout)
 
             tool_msg = ChatMessage(
                 role="tool",
                 content=tool_output.content,
                 additional_kwargs=additional_kwargs,
             )
+        except asyncio.TimeoutError:
+            timeout = True
+            tool_msg = ChatMessage(
+                role="tool",
+                content=f"Tool {tool_call.tool_name} timed out after {self.tool_timeout:g} seconds",
+                additional_kwargs=additional_kwargs,
+            )
         except Exception as e:
+            error = True
             tool_msg = ChatMessage(
                 role="tool",
                 content=f"Encountered error in tool call: {e}",
                 additional_kwargs=additional_kwargs,
             )
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        self.tool_stats.record(tool_call.tool_name, elapsed_ms, error=error, timeout=timeout)
 
         ctx.write_event_to_stream(
             ProgressEvent(
-                msg=f"Tool {tool_call.tool_name} called with {tool_call.tool_kwargs} returned {tool_msg.content}"
+                msg=f"Tool {tool_call.tool_name} called with {tool_call.tool_kwargs} returned {tool_msg.content} in {elapsed_ms:.0f} ms"
             )
         )
 
-        return ToolCallResultEvent(chat_message=tool_msg)
+        return ToolCallResultEvent(
+            chat_message=tool_msg, batch_id=ev.batch_id, index=ev.index
+        )
 
     @step
     async def aggregate_tool_results(
         self, ctx: Context, ev: ToolCallResultEvent
     ) -> ActiveSpeakerEvent:
-        """Collects the results of all tool calls and updates the chat history."""
-        num_tool_calls = await ctx.get("num_tool_calls")
-        results = ctx.collect_events(ev, [ToolCallResultEvent] * num_tool_calls)
-        if not results:
+        """Collects the results of a batch of tool calls and adds them to the chat history in call order."""
+        tool_batches = await ctx.get("tool_batches", default={})
+        batch = tool_batches.get(ev.batch_id)
+        if batch is None:
+            # left over from a run that ended before all its tools returned
             return
+        batch["results"][ev.index] = ev.chat_message
+        if len(batch["results"]) < batch["expected"]:
+            await ctx.set("tool_batches", tool_batches)
+            return
+        del tool_batches[ev.batch_id]
+        await ctx.set("tool_batches", tool_batches)
 
         chat_history = await ctx.get("chat_history")
-        for result in results:
-            chat_history.append(result.chat_message)
-        await ctx.set("chat_history", chat_history)
+        await self._add_to_history(
+            ctx, chat_history, *(batch["results"][index] for index in sorted(batch["results"]))
+        )
 
         return ActiveSpeakerEvent()
 
@@ -313,33 +466,52 @@ class ConciergeAgent(Workflow):
         self, ctx: Context, ev: OrchestratorEvent
     ) -> ActiveSpeakerEvent | StopEvent:
         """Decides which agent to run next, if any."""
-        agent_configs = await ctx.get("agent_configs")
+        agent_registry: AgentRegistry = await ctx.get("agent_registry")
         chat_history = await ctx.get("chat_history")
 
-        agent_context_str = ""
-        for agent_name, agent_config in agent_configs.items():
-            agent_context_str += f"{agent_name}: {agent_config.description}\n"
-
+        # try the local router first; an agent that just asked to be
+        # transferred away is not a candidate
+        transfer_from = await ctx.get("transfer_from", default=None)
+        await ctx.set("transfer_from", None)
+        user_msg = next(
+            (m.content for m in reversed(chat_history) if m.role == "user"), None
+        )
         user_state = await ctx.get("user_state")
+        selected_agent = await self.router.aroute(
+            user_msg,
+            [ac for ac in agent_registry.configs if ac.name != transfer_from],
+            user_state,
+        )
+        if selected_agent:
+            await ctx.set("active_speaker", selected_agent)
+            ctx.write_event_to_stream(
+                ProgressEvent(msg=f"Transferring to agent {selected_agent}")
+            )
+            return ActiveSpeakerEvent()
+
         user_state_str = "\n".join([f"{k}: {v}" for k, v in user_state.items()])
         system_prompt = self.orchestrator_prompt.format(
-            agent_context_str=agent_context_str, user_state_str=user_state_str
+            agent_context_str=agent_registry.agent_context_str,
+            user_state_str=user_state_str,
         )
 
-        llm_input = [ChatMessage(role="system", content=system_prompt)] + chat_history
         llm = await ctx.get("llm")
+        llm_input = await self.context_compactor.build_llm_input(
+            ctx, llm, system_prompt, chat_history
+        )
 
-        # convert the TransferToAgent pydantic model to a tool
-        tools = [get_function_tool(TransferToAgent)]
-
-        response = await llm.achat_with_tools(tools, chat_history=llm_input)
+        start = time.perf_counter()
+        response = await self._astream_with_tools(
+            ctx, llm, agent_registry.orchestrator_tools, llm_input
+        )
+        self.router.record_llm_route((time.perf_counter() - start) * 1000)
         tool_calls = llm.get_tool_calls_from_response(
             response, error_on_no_tool_call=False
         )
 
         # if no tool calls were made, the orchestrator probably needs more information
         if len(tool_calls) == 0:
-            chat_history.append(response.message)
+            await self._add_to_history(ctx, chat_history, response.message)
             return StopEvent(
                 result={
                     "response": response.message.content,
@@ -0,0 +1,45 @@
+import os
+import re
+import zlib
+
+import pytest
+
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+from llama_index.core import Settings  # noqa: E402
+from llama_index.core.embeddings import MockEmbedding  # noqa: E402
+
+from server.utils import embedding  # noqa: E402
+from server.utils.vector_index import EMBED_DIM  # noqa: E402
+
+
+class WordEmbedding(MockEmbedding):
+    """Deterministic bag-of-words vectors, so texts sharing words are close."""
+
+    def _vector(self, text):
+        vector = [1e-3] * self.embed_dim
+        for word in re.findall(r"\w+", text.lower()):
+            vector[zlib.crc32(word.encode()) % self.embed_dim] += 1.0
+        return vector
+
+    def _get_text_embedding(self, text):
+        return self._vector(text)
+
+    def _get_query_embedding(self, query):
+        return self._vector(query)
+
+    async def _aget_text_embedding(self, text):
+        return self._vector(text)
+
+    async def _aget_query_embedding(self, query):
+        return self._vector(query)
+
+
+@pytest.fixture
+def med_store(tmp_path, monkeypatch):
+    """The embedding module with an empty index persisted under tmp_path and a local embedding model."""
+    persist_dir = str(tmp_path / "storage")
+    monkeypatch.setattr(embedding, "PERSIST_DIR", persist_dir)
+    monkeypatch.setattr(embedding, "med_index", embedding.MedIndexManager(persist_dir))
+    monkeypatch.setattr(Settings, "embed_model", WordEmbedding(embed_dim=EMBED_DIM))
+    return embedding
@@ -0,0 +1,46 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from server.router import agent
+
+
+@pytest.fixture
+def client(monkeypatch):
+    calls = []
+
+    async def aget_answers(queries, drug_names=None):
+        calls.append((queries, drug_names))
+        return [f"answer to {query}" for query in queries]
+
+    monkeypatch.setattr(agent, "aget_answers", aget_answers)
+    app = FastAPI()
+    app.include_router(agent.router)
+    client = TestClient(app)
+    client.calls = calls
+    return client
+
+
+def test_batch_queries_are_filtered_by_their_drug(client):
+    response = client.post(
+        "/agent/query_batch",
+        params=[("drug_names", "ibuprofen"), ("drug_names", "")],
+        json=["dose?", "what is aspirin?"],
+    )
+
+    assert response.status_code == 200
+    assert [item["answer"] for item in response.json()] == ["answer to dose?", "answer to what is aspirin?"]
+    assert client.calls == [(["dose?", "what is aspirin?"], ["ibuprofen", None])]
+
+
+def test_batch_queries_without_drugs_search_everything(client):
+    assert client.post("/agent/query_batch", json=["dose?"]).status_code == 200
+    assert client.calls == [(["dose?"], None)]
+
+
+def test_drug_names_must_match_the_queries(client):
+    response = client.post("/agent/query_batch", params={"drug_names": "ibuprofen"}, json=["a?", "b?"])
+
+    assert response.status_code == 422
+    assert "1 entries for 2 queries" in response.json()["detail"]
+    assert client.calls == []
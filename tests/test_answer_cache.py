@@ -0,0 +1,29 @@
+from server.utils.answer_cache import AnswerCache
+
+
+def test_newer_version_drops_entries():
+    cache = AnswerCache()
+    cache.put("What is ibuprofen?", 1, "an NSAID")
+    assert cache.get("what is ibuprofen", 1) == "an NSAID"
+
+    assert cache.get("what is ibuprofen", 2) is None
+
+
+def test_older_version_is_ignored():
+    cache = AnswerCache()
+    cache.put("What is ibuprofen?", 2, "an NSAID")
+
+    cache.put("What is aspirin?", 1, "stale")
+    assert cache.get("what is ibuprofen", 1) is None
+    assert cache.get("what is aspirin", 2) is None
+    assert cache.get("what is ibuprofen", 2) == "an NSAID"
+
+
+def test_similar_matches_stay_within_scope():
+    cache = AnswerCache(similarity_threshold=0.9)
+    cache.put("side effects", 1, "ibuprofen effects", embedding=[1.0, 0.0], scope="ibuprofen")
+
+    assert cache.get("what are the side effects", 1, embedding=[1.0, 0.1], scope="ibuprofen") == "ibuprofen effects"
+    assert cache.get("what are the side effects", 1, embedding=[1.0, 0.1], scope="aspirin") is None
+    assert cache.get("what are the side effects", 1, embedding=[1.0, 0.1]) is None
+    assert cache.get("side effects", 1, scope="aspirin") is None
@@ -0,0 +1,84 @@
+import json
+
+import numpy as np
+
+from server.utils.bm25 import BM25Index, reciprocal_rank_fusion, tokenize
+
+
+def test_tokenize_drops_stopwords_and_splits_codes():
+    assert tokenize("What is the dose of Ibuprofen?") == ["dose", "ibuprofen"]
+    assert tokenize("NDC 0069-4200-30, 50mg") == ["ndc", "0069-4200-30", "0069", "4200", "30", "50mg", "50", "mg"]
+
+
+def test_search_ranks_by_term_frequency_and_rarity():
+    index = BM25Index()
+    index.add(0, "ibuprofen ibuprofen tablets")
+    index.add(1, "ibuprofen tablets")
+    index.add(2, "aspirin tablets")
+
+    assert [id_ for id_, _ in index.search("ibuprofen", 5)] == [0, 1]
+    # "aspirin" is rarer than "tablets", so it outweighs a match on tablets alone
+    assert [id_ for id_, _ in index.search("aspirin tablets", 5)][0] == 2
+    assert index.search("ibuprofen", 1) == index.search("ibuprofen", 5)[:1]
+    assert [id_ for id_, _ in index.search("ibuprofen", 5, ids=np.array([1, 2]))] == [1]
+    assert index.search("metformin", 5) == []
+
+
+def test_removed_documents_are_not_found():
+    index = BM25Index()
+    index.add(0, "ibuprofen tablets")
+    index.add(1, "ibuprofen gel")
+    assert [id_ for id_, _ in index.search("ibuprofen", 5)] == [0, 1]
+
+    index.remove(0, "ibuprofen tablets")
+
+    assert len(index) == 1
+    assert [id_ for id_, _ in index.search("ibuprofen", 5)] == [1]
+    assert index.search("tablets", 5) == []
+
+
+def test_rrf_prefers_ids_ranked_high_in_several_lists():
+    fused = reciprocal_rank_fusion([[1, 2, 3], [2, 3, 4]], k=60)
+
+    assert [id_ for id_, _ in fused] == [2, 3, 1, 4]
+    assert fused[0][1] == 1 / 62 + 1 / 61
+    # equal scores are ordered by id
+    assert [id_ for id_, _ in reciprocal_rank_fusion([[5], [4]])] == [4, 5]
+
+
+def test_saves_append_changes_to_a_log(tmp_path):
+    path = str(tmp_path / "bm25.json")
+    index = BM25Index()
+    for id_ in range(4):
+        index.add(id_, f"ibuprofen dose {id_}")
+    index.save(path)
+    with open(path) as f:
+        saved = f.read()
+
+    index.add(4, "aspirin dose")
+    index.remove(0, "ibuprofen dose 0")
+    index.save(path)
+
+    with open(path) as f:
+        assert f.read() == saved
+    with open(path + ".log") as f:
+        assert [json.loads(line)[0] for line in f] == ["add", "remove"]
+    loaded = BM25Index.load(path)
+    assert len(loaded) == 4
+    assert loaded.search("aspirin dose", 5) == index.search("aspirin dose", 5)
+
+
+def test_log_is_folded_in_once_it_outgrows_the_index(tmp_path):
+    path = str(tmp_path / "bm25.json")
+    index = BM25Index()
+    index.add(0, "ibuprofen")
+    index.save(path)
+
+    index.add(1, "aspirin")
+    index.save(path)
+    assert (tmp_path / "bm25.json.log").exists()
+    index.remove(1, "aspirin")
+    index.save(path)
+
+    assert not (tmp_path / "bm25.json.log").exists()
+    assert BM25Index.load(path).search("aspirin", 5) == []
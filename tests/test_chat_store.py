@@ -0,0 +1,42 @@
+import json
+
+from llama_index.core.llms import ChatMessage
+from llama_index.core.memory import ChatMemoryBuffer
+
+from server.utils.chat_store import ChatJournal
+
+
+def messages(*texts):
+    return [ChatMessage(role="user" if i % 2 == 0 else "assistant", content=text) for i, text in enumerate(texts)]
+
+
+def test_appended_messages_survive_a_partial_line(tmp_path):
+    journal = ChatJournal(str(tmp_path))
+    journal.append("session-a", messages("hi"))
+    journal.append("session-a", messages("how much is ibuprofen?"))
+    with open(tmp_path / "session-a.jsonl", "a") as f:
+        f.write('{"role": "assis')
+
+    assert [message.content for message in journal.load("session-a")] == ["hi", "how much is ibuprofen?"]
+    assert journal.load("session-b") == []
+
+
+def test_compact_keeps_recent_messages_from_a_user_turn(tmp_path):
+    journal = ChatJournal(str(tmp_path), compact_bytes=1 << 20, keep_messages=3)
+    journal.append("session-a", messages("q1", "a1", "q2", "a2"))
+
+    assert not journal.compact("session-a")
+    assert journal.compact("session-a", force=True)
+    assert [message.content for message in journal.load("session-a")] == ["q2", "a2"]
+
+
+def test_legacy_memory_moves_to_a_session_once(tmp_path):
+    legacy_path = tmp_path / "memory.json"
+    memory = ChatMemoryBuffer.from_defaults(chat_history=messages("hi", "hello"))
+    legacy_path.write_text(json.dumps(memory.to_dict()))
+    journal = ChatJournal(str(tmp_path / "memory"))
+
+    assert journal.migrate_legacy(str(legacy_path), "legacy-session") == 2
+    assert journal.migrate_legacy(str(legacy_path), "legacy-session") == 0
+    assert [message.content for message in journal.load("legacy-session")] == ["hi", "hello"]
+    assert not legacy_path.exists()
@@ -0,0 +1,61 @@
+from llama_index.core import Document
+
+from server.utils.chunking import StructuredChunker
+
+SHARED = "Store below 25 degrees Celsius, away from moisture and out of the reach of children."
+NAV = "Home | Drugs | Pharmacies | Sign in"
+
+
+def site_pages():
+    return [
+        Document(
+            text=f"{NAV}\n\nSildenafil is taken an hour before activity.\n\n{SHARED}\n\n{SHARED}",
+            id_="https://goodrx.example/sildenafil",
+            metadata={"drug_name": "sildenafil"},
+        ),
+        Document(
+            text=f"{NAV}\n\nTadalafil lasts up to 36 hours.\n\n{SHARED}",
+            id_="https://goodrx.example/tadalafil",
+            metadata={"drug_name": "tadalafil"},
+        ),
+        Document(
+            text=f"{NAV}\n\nMetformin lowers blood sugar.",
+            id_="https://goodrx.example/metformin",
+            metadata={"drug_name": "metformin"},
+        ),
+    ]
+
+
+def test_pages_of_one_site_are_chunked_separately():
+    documents = site_pages()
+
+    nodes = StructuredChunker()(documents)
+
+    assert {node.ref_doc_id for node in nodes} == {doc.id_ for doc in documents}
+    for doc in documents:
+        text = "\n\n".join(node.get_content() for node in nodes if node.ref_doc_id == doc.id_)
+        first_sentence = doc.text.split("\n\n")[1]
+        assert first_sentence in text
+        for node in nodes:
+            if node.ref_doc_id == doc.id_:
+                assert node.metadata["drug_name"] == doc.metadata["drug_name"]
+            else:
+                assert first_sentence not in node.get_content()
+
+
+def test_repeated_blocks_are_dropped_within_a_document_only():
+    documents = site_pages()[:2] + [
+        Document(text=f"Aspirin thins the blood.\n\n{SHARED}", id_="https://other.example/aspirin"),
+    ]
+
+    nodes = StructuredChunker()(documents)
+
+    for doc in documents:
+        text = "\n\n".join(node.get_content() for node in nodes if node.ref_doc_id == doc.id_)
+        assert text.count(SHARED) == 1
+
+
+def test_site_boilerplate_is_dropped():
+    nodes = StructuredChunker()(site_pages())
+
+    assert all(NAV not in node.get_content() for node in nodes)
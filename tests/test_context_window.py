@@ -0,0 +1,101 @@
+import asyncio
+from types import SimpleNamespace
+
+from llama_index.core.llms import ChatMessage
+
+from server.utils.context_window import ContextCompactor
+
+
+class StubContext:
+    """The get/set part of a workflow Context."""
+
+    def __init__(self):
+        self.data = {}
+
+    async def get(self, key, default=None):
+        return self.data.get(key, default)
+
+    async def set(self, key, value):
+        self.data[key] = value
+
+
+class StubLLM:
+    """Summarizes into a fixed text once `release` is set."""
+
+    def __init__(self):
+        self.release = asyncio.Event()
+        self.prompts = []
+
+    async def achat(self, messages):
+        self.prompts.append(messages[0].content)
+        await self.release.wait()
+        return SimpleNamespace(message=ChatMessage(role="assistant", content="User asked about ibuprofen."))
+
+
+def turn(i, words=5):
+    return [
+        ChatMessage(role="user", content=f"question {i} " + "word " * words),
+        ChatMessage(role="assistant", content="", additional_kwargs={"tool_calls": [{"id": f"call-{i}"}]}),
+        ChatMessage(role="tool", content=f"tool result {i}", additional_kwargs={"tool_call_id": f"call-{i}"}),
+        ChatMessage(role="assistant", content=f"answer {i} " + "word " * words),
+    ]
+
+
+def contents(messages):
+    return [message.content for message in messages]
+
+
+def test_previous_tool_calls_are_dropped_and_the_current_turn_is_kept():
+    history = turn(0) + turn(1) + turn(2)
+
+    async def build():
+        return await ContextCompactor(keep_turns=3).build_llm_input(StubContext(), StubLLM(), "system", history)
+
+    messages = asyncio.run(build())
+
+    assert messages[0].role.value == "system"
+    assert messages[1:-4] == [message for message in history[:8] if message.role.value != "tool" and message.content]
+    assert messages[-4:] == history[8:]
+
+
+def test_newest_messages_fill_the_token_budget():
+    history = [message for i in range(6) for message in turn(i, words=300)]
+    compactor = ContextCompactor(token_budget=3000, keep_turns=3)
+
+    async def build():
+        return await compactor.build_llm_input(StubContext(), StubLLM(), "system", history)
+
+    messages = asyncio.run(build())
+
+    assert sum(compactor.count_tokens(message) for message in messages) <= 3000
+    assert messages[-4:] == history[-4:]
+    kept = contents(messages[1:-4])
+    expected = [message.content for message in history[:-4] if message.role.value != "tool" and message.content]
+    # a suffix of the earlier messages, cut where the budget ran out
+    assert kept and kept == expected[-len(kept):]
+    assert len(kept) < len(expected)
+
+
+def test_older_turns_are_summarized_in_the_background():
+    history = [message for i in range(5) for message in turn(i)]
+    compactor = ContextCompactor(keep_turns=2)
+    ctx, llm = StubContext(), StubLLM()
+
+    async def build_twice():
+        first = await compactor.build_llm_input(ctx, llm, "system", history)
+        # the summary is still pending, the next call doesn't start another one
+        pending = await compactor.build_llm_input(ctx, llm, "system", history)
+        llm.release.set()
+        await ctx.data["context_summary"].task
+        return first, pending, await compactor.build_llm_input(ctx, llm, "system", history)
+
+    first, pending, summarized = asyncio.run(build_twice())
+
+    assert len(llm.prompts) == 1
+    assert "question 0" in llm.prompts[0] and "question 2" not in llm.prompts[0]
+    assert first == pending
+    assert "question 0" in contents(first)[1]
+    assert "User asked about ibuprofen." in summarized[0].content
+    # turns 0 and 1 are only in the summary now
+    assert contents(summarized[1:])[0].startswith("question 2")
+    assert summarized[-4:] == history[-4:]
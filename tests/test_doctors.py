@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+
+from server.utils.doctors import DoctorDirectory
+from server.utils.geo import haversine_km
+
+SPECIALTIES = ["family medicine", "cardiology", "pediatrics"]
+
+
+@pytest.fixture(scope="module")
+def directory():
+    rng = np.random.default_rng(0)
+    size = 20_000
+    # providers clustered around metros, plus some rural ones and a few near the antimeridian and poles
+    metros = np.column_stack([rng.uniform(25, 49, 30), rng.uniform(-124, -67, 30)])
+    metro = rng.integers(0, len(metros), size)
+    lats = metros[metro, 0] + rng.normal(0, 0.3, size)
+    lons = metros[metro, 1] + rng.normal(0, 0.3, size)
+    rural = rng.random(size) < 0.1
+    lats[rural] = rng.uniform(-89, 89, rural.sum())
+    lons[rural] = rng.uniform(-180, 180, rural.sum())
+    ids = [str(i) for i in range(size)]
+    specialties = [SPECIALTIES[i] for i in rng.integers(0, len(SPECIALTIES), size)]
+    return DoctorDirectory(ids, ids, specialties, ids, lats, lons)
+
+
+def queries():
+    rng = np.random.default_rng(1)
+    points = np.column_stack([rng.uniform(25, 49, 40), rng.uniform(-124, -67, 40)])
+    return [*points.tolist(), [0.0, 179.95], [88.0, 10.0], [-60.0, -40.0]]
+
+
+def brute_force(directory, lat, lon, specialty=None):
+    rows = np.arange(len(directory))
+    if specialty:
+        rows = rows[[directory.specialties[row] == specialty for row in rows]]
+    return rows, haversine_km(lat, lon, directory.lats[rows], directory.lons[rows])
+
+
+@pytest.mark.parametrize("specialty", [None, "cardiology"])
+def test_nearest_matches_brute_force(directory, specialty):
+    for lat, lon in queries():
+        rows, distances = brute_force(directory, lat, lon, specialty)
+        expected = np.sort(distances)[:5]
+
+        found = directory.nearest(lat, lon, 5, specialty=specialty)
+
+        assert np.allclose([doctor.distance_km for doctor in found], np.round(expected, 2))
+        assert all(doctor.specialty == specialty for doctor in found if specialty)
+
+
+def test_within_matches_brute_force(directory):
+    for lat, lon in queries():
+        rows, distances = brute_force(directory, lat, lon)
+
+        found = directory.within(lat, lon, 25.0)
+
+        assert {doctor.id for doctor in found} == {str(row) for row in rows[distances <= 25.0]}
+        assert [doctor.distance_km for doctor in found] == sorted(doctor.distance_km for doctor in found)
+
+
+def test_nearest_within_max_km(directory):
+    for lat, lon in queries():
+        rows, distances = brute_force(directory, lat, lon)
+
+        found = directory.nearest(lat, lon, 5, max_km=10.0)
+
+        assert len(found) == min(5, int((distances <= 10.0).sum()))
+        assert all(doctor.distance_km <= 10.0 for doctor in found)
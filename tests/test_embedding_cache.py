@@ -0,0 +1,55 @@
+import asyncio
+import threading
+
+from llama_index.core.embeddings import MockEmbedding
+
+from server.utils.embedding_cache import CachedEmbedding, EmbeddingStore
+
+
+class RecordingStore(EmbeddingStore):
+    """Records the threads its SQLite calls run on."""
+
+    def __init__(self, path):
+        super().__init__(path)
+        self.threads = []
+
+    def get_many(self, model, hashes):
+        self.threads.append(threading.get_ident())
+        return super().get_many(model, hashes)
+
+    def put_many(self, model, items):
+        self.threads.append(threading.get_ident())
+        super().put_many(model, items)
+
+
+class CountingEmbedding(MockEmbedding):
+    calls: int = 0
+
+    async def _aget_text_embedding(self, text):
+        self.calls += 1
+        return await super()._aget_text_embedding(text)
+
+    async def _aget_query_embedding(self, query):
+        self.calls += 1
+        return await super()._aget_query_embedding(query)
+
+
+def test_async_embeddings_are_cached_off_the_event_loop(tmp_path):
+    model = CountingEmbedding(embed_dim=4)
+    store = RecordingStore(str(tmp_path / "cache.sqlite3"))
+    cached = CachedEmbedding(model, store)
+
+    async def embed():
+        loop_thread = threading.get_ident()
+        first = await cached.aget_text_embedding_batch(["ibuprofen", "aspirin", "ibuprofen"])
+        query = await cached.aget_query_embedding("ibuprofen dose")
+        again = await cached.aget_text_embedding_batch(["aspirin", "ibuprofen"])
+        again_query = await cached.aget_query_embedding("ibuprofen dose")
+        return loop_thread, first, query, again, again_query
+
+    loop_thread, first, query, again, again_query = asyncio.run(embed())
+
+    assert model.calls == 3
+    assert again == [first[1], first[0]]
+    assert again_query == query
+    assert store.threads and loop_thread not in store.threads
@@ -0,0 +1,56 @@
+from server.utils.geo import OfflineGeocoder
+
+
+def make_geocoder(tmp_path, **kwargs):
+    centroids = tmp_path / "zip_centroids.csv"
+    centroids.write_text("zip,lat,lon\n10001,40.75,-73.99\n94103,37.77,-122.41\n2134,42.35,-71.13\n")
+    return OfflineGeocoder(str(centroids), str(tmp_path / "geocode_cache.jsonl"), **kwargs)
+
+
+def cache_lines(tmp_path):
+    return (tmp_path / "geocode_cache.jsonl").read_text().splitlines()
+
+
+def test_addresses_resolve_by_coordinates_or_zip_code(tmp_path):
+    geocoder = make_geocoder(tmp_path)
+
+    assert geocoder.geocode("40.1, -75.2") == (40.1, -75.2)
+    assert geocoder.geocode("1 Main St, New York, NY 10001") == (40.75, -73.99)
+    assert geocoder.geocode("Allston, MA 02134") == (42.35, -71.13)
+    assert geocoder.geocode("somewhere without a zip") is None
+    assert geocoder.geocode("") is None
+
+
+def test_new_addresses_are_appended_and_reloaded(tmp_path):
+    geocoder = make_geocoder(tmp_path)
+    geocoder.geocode("New York 10001")
+    geocoder.geocode("new  york 10001")
+    geocoder.geocode("San Francisco 94103")
+
+    assert len(cache_lines(tmp_path)) == 2
+    with open(tmp_path / "geocode_cache.jsonl", "a") as f:
+        f.write('["cut short", 1.0')
+    reloaded = make_geocoder(tmp_path)
+    (tmp_path / "zip_centroids.csv").unlink()
+    assert reloaded.geocode("New York 10001") == (40.75, -73.99)
+    assert reloaded.geocode("San Francisco 94103") == (37.77, -122.41)
+
+
+def test_cache_is_capped_and_its_file_compacted(tmp_path):
+    geocoder = make_geocoder(tmp_path, max_entries=2)
+    geocoder.geocode("1.0, 1.0")
+    geocoder.geocode("2.0, 2.0")
+    # a hit makes 1.0 the most recently used
+    geocoder.geocode("1.0, 1.0")
+    geocoder.geocode("3.0, 3.0")
+
+    assert list(geocoder._cache) == ["1.0, 1.0", "3.0, 3.0"]
+    assert len(cache_lines(tmp_path)) == 3
+    geocoder.geocode("4.0, 4.0")
+    assert len(cache_lines(tmp_path)) == 4
+
+    geocoder.geocode("5.0, 5.0")
+    assert len(cache_lines(tmp_path)) == 2
+    reloaded = make_geocoder(tmp_path, max_entries=2)
+    reloaded.geocode("5.0, 5.0")
+    assert list(reloaded._cache) == ["4.0, 4.0", "5.0, 5.0"]
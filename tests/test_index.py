@@ -0,0 +1,204 @@
+import hashlib
+import threading
+import time
+
+from llama_index.core import Document, Settings
+
+from server.utils import embedding
+
+SILDENAFIL_URL = "https://goodrx.example/sildenafil"
+TADALAFIL_URL = "https://goodrx.example/tadalafil"
+
+
+def drug_pages(embedding):
+    documents = [
+        Document(
+            text="Sildenafil is taken an hour before sexual activity.\n\nDo not combine sildenafil with nitrates.",
+            id_=SILDENAFIL_URL,
+        ),
+        Document(
+            text="Tadalafil works for up to 36 hours.\n\nTadalafil can also be taken daily at a low dose.",
+            id_=TADALAFIL_URL,
+        ),
+    ]
+    return embedding.annotate_documents(documents, "webpage")
+
+
+def node_docs(index, result):
+    """The ref_doc_id of each node in a vector store query result."""
+    node_ids = [index.index_struct.nodes_dict[idx] for idx in result.ids]
+    return [node.ref_doc_id for node in index.docstore.get_nodes(node_ids)]
+
+
+def test_same_site_pages_get_their_own_partitions(med_store):
+    index = med_store.build_index(drug_pages(med_store))
+    vector_store = index.vector_store
+    nodes = index.docstore.get_nodes(list(index.index_struct.nodes_dict.values()))
+
+    for drug_name, url in [("sildenafil", SILDENAFIL_URL), ("tadalafil", TADALAFIL_URL)]:
+        expected = sum(node.ref_doc_id == url for node in nodes)
+        assert expected > 0
+        assert vector_store.partition_size("drug_name", drug_name) == expected
+
+        filters = med_store.drug_filters(index, drug_name)
+        query = f"how long does {drug_name} work"
+        result = vector_store.query_many(
+            [Settings.embed_model.get_query_embedding(query)], 5,
+            ids=vector_store.filter_ids(filters), query_strs=[query],
+        )[0]
+        assert result.ids
+        assert set(node_docs(index, result)) == {url}
+
+
+def test_unknown_drug_falls_back_to_all_documents(med_store, capsys):
+    index = med_store.build_index(drug_pages(med_store))
+
+    assert med_store.drug_filters(index, "metformin") is None
+    assert "drug_name='metformin'" in capsys.readouterr().out
+
+
+def test_changed_document_replaces_its_nodes(med_store):
+    med_store.build_index(drug_pages(med_store))
+    changed = Document(
+        text="Sildenafil now ships as chewable tablets.\n\nIt is taken thirty minutes before activity.",
+        id_=SILDENAFIL_URL,
+    )
+
+    stats = med_store.store_documents(med_store.annotate_documents([changed], "webpage"))
+
+    index = med_store.med_index.get()
+    vector_store = index.vector_store
+    nodes = index.docstore.get_nodes(list(index.index_struct.nodes_dict.values()))
+    texts = [node.get_content() for node in nodes if node.ref_doc_id == SILDENAFIL_URL]
+    assert stats["documents"] == 1
+    assert texts and all("chewable" in text for text in texts)
+    assert vector_store.partition_size("drug_name", "sildenafil") == len(texts)
+    assert index.docstore.get_document_hash(SILDENAFIL_URL) == med_store.document_hash(changed)
+
+    query = "sildenafil nitrates hour before sexual activity"
+    for filters in [None, med_store.drug_filters(index, "sildenafil")]:
+        result = vector_store.query_many(
+            [Settings.embed_model.get_query_embedding(query)], 10,
+            ids=vector_store.filter_ids(filters) if filters else None, query_strs=[query],
+        )[0]
+        found = index.docstore.get_nodes([index.index_struct.nodes_dict[idx] for idx in result.ids])
+        assert not any("nitrates" in node.get_content() for node in found)
+        dense = vector_store.query_many([Settings.embed_model.get_query_embedding(query)], 10)[0]
+        assert all(idx in index.index_struct.nodes_dict for idx in dense.ids)
+
+
+def test_unchanged_documents_are_skipped(med_store):
+    med_store.build_index(drug_pages(med_store))
+
+    stats = med_store.store_documents(drug_pages(med_store))
+
+    assert stats["documents"] == 0
+    assert stats["skipped_documents"] == 2
+
+
+def test_deletes_survive_a_reload(med_store):
+    med_store.build_index(drug_pages(med_store))
+    changed = Document(text="Sildenafil now ships as chewable tablets.", id_=SILDENAFIL_URL)
+    med_store.store_documents(med_store.annotate_documents([changed], "webpage"))
+
+    index = med_store.med_index.load()
+
+    assert index.vector_store.num_deleted > 0
+    result = index.vector_store.query_many([Settings.embed_model.get_query_embedding("nitrates")], 10)[0]
+    assert all(idx in index.index_struct.nodes_dict for idx in result.ids)
+
+
+def test_writes_update_the_index_in_place_and_bump_the_version(med_store):
+    index = med_store.build_index(drug_pages(med_store))
+    version = med_store.med_index.version
+
+    changed = Document(text="Sildenafil now ships as chewable tablets.", id_=SILDENAFIL_URL)
+    med_store.store_documents(med_store.annotate_documents([changed], "webpage"))
+    assert med_store.med_index.snapshot() == (index, version + 1)
+
+    med_store.store_documents(drug_pages(med_store)[1:])
+    assert med_store.med_index.version == version + 1
+
+
+def test_writes_wait_for_searches(med_store):
+    med_store.build_index(drug_pages(med_store))
+    version = med_store.med_index.version
+    applied = threading.Event()
+
+    with med_store.med_index.reading():
+        writer = threading.Thread(target=med_store.med_index.update, args=(lambda index: applied.set(),))
+        writer.start()
+        assert not applied.wait(0.2)
+        assert med_store.med_index.version == version
+    writer.join()
+
+    assert applied.is_set()
+    assert med_store.med_index.version == version + 1
+
+
+def test_manifest_hashes_visible_files(tmp_path):
+    (tmp_path / "ibuprofen.txt").write_text("Ibuprofen is an NSAID.")
+    (tmp_path / ".DS_Store").write_text("")
+
+    files = embedding.scan_data_dir(tmp_path)
+
+    assert files == {str(tmp_path / "ibuprofen.txt"): hashlib.sha256(b"Ibuprofen is an NSAID.").hexdigest()}
+
+
+def test_recorded_files_keep_their_first_hash(tmp_path):
+    path = tmp_path / "ibuprofen.txt"
+    path.write_text("Ibuprofen is an NSAID.")
+    embedding.record_files([path], tmp_path)
+    path.write_text("Ibuprofen is a painkiller.")
+    embedding.record_files([path], tmp_path)
+
+    assert embedding.load_manifest(tmp_path) == {str(path): hashlib.sha256(b"Ibuprofen is an NSAID.").hexdigest()}
+
+
+def test_create_index_only_embeds_new_or_changed_files(med_store, tmp_path, monkeypatch):
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    monkeypatch.setattr(med_store, "DATA_DIR", str(data_dir))
+    (data_dir / "ibuprofen.txt").write_text("Ibuprofen is taken with food.")
+
+    med_store.create_index()
+    index, version = med_store.med_index.snapshot()
+
+    med_store.create_index()
+    assert med_store.med_index.snapshot() == (index, version)
+
+    (data_dir / "aspirin.txt").write_text("Aspirin thins the blood.")
+    med_store.create_index()
+    assert med_store.med_index.snapshot() == (index, version + 1)
+    assert set(med_store.load_manifest(med_store.PERSIST_DIR)) == {
+        str(data_dir / "ibuprofen.txt"), str(data_dir / "aspirin.txt")
+    }
+
+    (data_dir / "ibuprofen.txt").write_text("Ibuprofen can upset the stomach.")
+    med_store.create_index()
+    rebuilt = med_store.med_index.get()
+    texts = [node.get_content() for node in rebuilt.docstore.docs.values()]
+    assert rebuilt is not index
+    assert any("stomach" in text for text in texts)
+    assert not any("with food" in text for text in texts)
+
+
+def test_writes_queued_behind_a_persist_share_the_next_one(med_store, monkeypatch):
+    index = med_store.build_index(drug_pages(med_store))
+    manager = med_store.med_index
+    version = manager.version
+    persists = []
+    persist = index.storage_context.persist
+    monkeypatch.setattr(index.storage_context, "persist", lambda **kwargs: (persists.append(1), persist(**kwargs)))
+
+    # another writer is persisting
+    with manager._persist_lock:
+        writers = [threading.Thread(target=manager.update, args=(lambda index: None,)) for _ in range(3)]
+        for writer in writers:
+            writer.start()
+        while manager.version < version + 3:
+            time.sleep(0.01)
+    for writer in writers:
+        writer.join()
+
+    assert len(persists) == 1
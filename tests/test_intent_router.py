@@ -0,0 +1,100 @@
+import asyncio
+
+from llama_index.core.embeddings import MockEmbedding
+
+from server.utils.intent_router import IntentRouter
+from server.utils.workflow import AgentConfig
+
+AGENTS = [
+    AgentConfig(name="Medicine Agent", description="medicines", example_utterances=["pills"]),
+    AgentConfig(name="Doctor Agent", description="doctors", example_utterances=["clinics"]),
+    AgentConfig(
+        name="Balance Agent", description="balances", router_requires_state=["session_token"],
+    ),
+]
+
+
+class TableEmbedding(MockEmbedding):
+    """Looks texts up in a table of unit vectors; unknown texts fail like an unreachable API."""
+
+    table: dict = {}
+    calls: int = 0
+
+    def _vector(self, text):
+        self.calls += 1
+        return list(self.table[text])
+
+    def _get_text_embedding(self, text):
+        return self._vector(text)
+
+    def _get_query_embedding(self, query):
+        return self._vector(query)
+
+    async def _aget_text_embedding(self, text):
+        return self._vector(text)
+
+    async def _aget_query_embedding(self, query):
+        return self._vector(query)
+
+
+def make_router(**kwargs):
+    table = {
+        "medicines": [1.0, 0.0, 0.0],
+        "pills": [1.0, 0.0, 0.0],
+        "doctors": [0.0, 1.0, 0.0],
+        "clinics": [0.0, 1.0, 0.0],
+        "balances": [0.0, 0.0, 1.0],
+        # cosine 0.9 to medicines, 0.436 to doctors
+        "clear": [0.9, 0.436, 0.0],
+        # cosine 0.8 to medicines
+        "weak": [0.8, 0.6, 0.0],
+        # cosine 0.7 to both medicines and doctors
+        "tie": [0.7, 0.7, 0.14],
+        "money": [0.0, 0.0, 1.0],
+    }
+    embed_model = TableEmbedding(embed_dim=3, table=table)
+    return IntentRouter(embed_model=embed_model, **kwargs), embed_model
+
+
+def route(router, user_msg, user_state=None):
+    return asyncio.run(router.aroute(user_msg, AGENTS, user_state))
+
+
+def test_a_confident_clear_match_is_routed_locally():
+    router, embed_model = make_router(min_score=0.82, min_margin=0.04)
+
+    assert route(router, "clear") == "Medicine Agent"
+    assert route(router, "clear") == "Medicine Agent"
+    # agent texts are embedded once, then one embedding per message
+    assert embed_model.calls == 5 + 2
+    assert router.stats()["routed_locally"] == 2
+
+
+def test_a_match_below_the_min_score_goes_to_the_orchestrator():
+    router, _ = make_router(min_score=0.82, min_margin=0.04)
+    assert route(router, "weak") is None
+
+    router, _ = make_router(min_score=0.8, min_margin=0.04)
+    assert route(router, "weak") == "Medicine Agent"
+
+
+def test_a_match_without_enough_margin_goes_to_the_orchestrator():
+    router, _ = make_router(min_score=0.5, min_margin=0.04)
+    assert route(router, "tie") is None
+
+    router, _ = make_router(min_score=0.5, min_margin=0.0)
+    assert route(router, "tie") in {"Medicine Agent", "Doctor Agent"}
+
+
+def test_an_agent_needing_unset_user_state_is_left_to_the_orchestrator():
+    router, _ = make_router(min_score=0.82, min_margin=0.04)
+
+    assert route(router, "money") is None
+    assert route(router, "money", {"session_token": None}) is None
+    assert route(router, "money", {"session_token": "abc"}) == "Balance Agent"
+
+
+def test_embedding_errors_fall_back_to_the_orchestrator():
+    router, _ = make_router()
+
+    assert route(router, "unknown message") is None
@@ -0,0 +1,67 @@
+import pytest
+
+from server.utils.medicine_names import medicine_name_index
+
+
+@pytest.mark.parametrize("raw, canonical", [
+    ("Viagra 50mg", "sildenafil"),
+    ("VIAGRA 100 mg tablets", "sildenafil"),
+    ("Toprol XL 25 mg", "metoprolol"),
+    ("co-amoxiclav 625mg", "amoxicillin clavulanate"),
+    ("sildenafill", "sildenafil"),
+    ("atorvastatine", "atorvastatin"),
+])
+def test_known_names_and_typos(raw, canonical):
+    assert medicine_name_index.canonical_name(raw) == canonical
+
+
+@pytest.mark.parametrize("raw", ["citalopram", "felodipine", "prednisolone", "allergy", "advice"])
+def test_near_misses_are_not_substituted(raw):
+    assert medicine_name_index.normalize(raw) is None
+    assert medicine_name_index.canonical_name(raw) == raw
+
+
+def test_suggests_close_names():
+    assert medicine_name_index.suggest("prednisolone").matched == "prednisone"
+    assert medicine_name_index.suggest("unknownium") is None
+
+
+@pytest.mark.parametrize("source_name, drug_name", [
+    ("lipitor-dosage-guide", "atorvastatin"),
+    ("Viagra_FAQ", "sildenafil"),
+    ("advice", None),
+    ("allergy-guide", None),
+    ("bayer-annual-report", None),
+    ("prilosec-vs-nexium", None),
+])
+def test_detect_from_source_name(source_name, drug_name):
+    assert medicine_name_index.detect("", source_name) == drug_name
+
+
+def test_detect_from_mentions():
+    text = "Sildenafil (Viagra) treats erectile dysfunction. Take sildenafil once a day. Unlike tadalafil, ..."
+    assert medicine_name_index.detect(text, "leaflet") == "sildenafil"
+    assert medicine_name_index.detect("Ibuprofen or aspirin for pain.", "leaflet") is None
+
+
+@pytest.mark.parametrize("raw, canonicals", [
+    ("Advil and Tylenol", ["ibuprofen", "acetaminophen"]),
+    ("lipitor 20mg, zocor 40mg or crestor", ["atorvastatin", "simvastatin", "rosuvastatin"]),
+    ("augmentin vs amoxicillin", ["amoxicillin clavulanate", "amoxicillin"]),
+    ("Viagra or Revatio", ["sildenafil"]),
+])
+def test_input_naming_several_medicines_is_ambiguous(raw, canonicals):
+    matches = medicine_name_index.normalize_all(raw)
+
+    assert [match.canonical for match in matches] == canonicals
+    if len(canonicals) > 1:
+        assert medicine_name_index.normalize(raw) is None
+        assert all(match.dosage is None for match in matches)
+    else:
+        assert medicine_name_index.normalize(raw) == matches[0]
+
+
+def test_single_medicine_keeps_its_dosage():
+    assert medicine_name_index.normalize_all("Viagra 50mg") == (medicine_name_index.normalize("Viagra 50mg"),)
+    assert medicine_name_index.normalize_all("sildenafill")[0].distance == 1
+    assert medicine_name_index.normalize_all("unknownium") == ()
@@ -0,0 +1,114 @@
+import asyncio
+
+import httpx
+
+from server.utils import prices
+from server.utils.prices import HttpPriceProvider, PriceComparer, StaticPriceProvider
+
+
+class CountingProvider(StaticPriceProvider):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.calls = 0
+
+    async def afetch(self, medicine, dosage, zip_code):
+        self.calls += 1
+        return await super().afetch(medicine, dosage, zip_code)
+
+
+def names(result):
+    return [quote.provider for quote in result["quotes"]]
+
+
+def test_quotes_are_sorted_and_failures_reported():
+    comparer = PriceComparer([
+        StaticPriceProvider("Amazon", default=10.99),
+        StaticPriceProvider("Walmart", error="503 from vendor"),
+        StaticPriceProvider("Target", default=8.99),
+        StaticPriceProvider("CVS", prices={"aspirin": 3.0}),
+    ])
+
+    result = asyncio.run(comparer.acompare("Ibuprofen", "200mg"))
+
+    assert names(result) == ["Target", "Amazon"]
+    assert result["best"].price == 8.99
+    assert result["failed"] == ["Walmart"]
+    assert result["pending"] == []
+
+
+def test_slow_providers_finish_in_the_background_after_the_budget():
+    slow = CountingProvider("Slow", default=5.0, delay=0.2)
+    comparer = PriceComparer([StaticPriceProvider("Fast", default=9.0), slow], latency_budget=0.05)
+
+    async def compare_twice():
+        first = await comparer.acompare("ibuprofen")
+        await asyncio.sleep(0.3)
+        return first, await comparer.acompare("ibuprofen")
+
+    first, second = asyncio.run(compare_twice())
+
+    assert names(first) == ["Fast"]
+    assert first["pending"] == ["Slow"]
+    assert first["elapsed_ms"] < 150
+    assert names(second) == ["Slow", "Fast"]
+    assert second["pending"] == []
+    assert slow.calls == 1
+
+
+def test_cached_quotes_expire_after_the_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(prices.time, "monotonic", lambda: now[0])
+    provider = CountingProvider("Amazon", prices={"ibuprofen": 10.99})
+    comparer = PriceComparer([provider], ttl=60)
+
+    asyncio.run(comparer.acompare("ibuprofen"))
+    asyncio.run(comparer.acompare(" IBUPROFEN "))
+    # "no offer" is cached as well
+    asyncio.run(comparer.acompare("metformin"))
+    asyncio.run(comparer.acompare("metformin"))
+    assert provider.calls == 2
+
+    now[0] += 61
+    asyncio.run(comparer.acompare("ibuprofen"))
+    assert provider.calls == 3
+
+
+def test_concurrent_comparisons_share_a_fetch():
+    provider = CountingProvider("Amazon", default=10.99, delay=0.05)
+    comparer = PriceComparer([provider])
+
+    async def compare_concurrently():
+        return await asyncio.gather(*(comparer.acompare("ibuprofen") for _ in range(5)))
+
+    results = asyncio.run(compare_concurrently())
+
+    assert provider.calls == 1
+    assert all(names(result) == ["Amazon"] for result in results)
+
+
+def test_http_provider_closes_only_its_own_client():
+    def vendor(request):
+        if "ibuprofen" in request.url.path:
+            return httpx.Response(200, json={"price": "7.5", "url": "https://vendor.example/ibuprofen"})
+        return httpx.Response(404)
+
+    async def fetch_and_close():
+        shared = httpx.AsyncClient(transport=httpx.MockTransport(vendor))
+        provider = HttpPriceProvider("Vendor", "https://vendor.example/{medicine}", client=shared)
+        quote = await provider.afetch("ibuprofen", None, None)
+        missing = await provider.afetch("aspirin", None, None)
+        await PriceComparer([provider]).aclose()
+        shared_open = not shared.is_closed
+
+        own = HttpPriceProvider("Vendor", "https://vendor.example/{medicine}")
+        client = own._get_client()
+        await own.aclose()
+        await shared.aclose()
+        return quote, missing, shared_open, client.is_closed
+
+    quote, missing, shared_open, own_closed = asyncio.run(fetch_and_close())
+
+    assert quote.price == 7.5 and quote.url == "https://vendor.example/ibuprofen"
+    assert missing is None
+    assert shared_open
+    assert own_closed
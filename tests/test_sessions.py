@@ -0,0 +1,92 @@
+import pytest
+from llama_index.core.memory import ChatMemoryBuffer
+
+from server.utils import sessions
+from server.utils.sessions import SessionStore
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(sessions.time, "monotonic", clock)
+    return clock
+
+
+def make_store(**kwargs):
+    loaded, saved = [], []
+
+    def load_memory(session_id):
+        loaded.append(session_id)
+        return ChatMemoryBuffer.from_defaults(token_limit=1000)
+
+    store = SessionStore(load_memory, lambda session_id, memory: saved.append(session_id), **kwargs)
+    return store, loaded, saved
+
+
+def visit(store, session_id):
+    session = store.connect(session_id)
+    store.disconnect(session)
+    return session
+
+
+def test_sessions_are_kept_per_id(clock):
+    store, loaded, saved = make_store(initial_state={"cart": []})
+    first = visit(store, "session-a")
+    first.user_state["cart"].append("ibuprofen")
+
+    assert visit(store, "session-a") is first
+    assert visit(store, "session-b").user_state == {"cart": []}
+    assert loaded == ["session-a", "session-b"]
+    assert saved == ["session-a", "session-a", "session-b"]
+    assert store.connect("bad id!").session_id != "bad id!"
+
+
+def test_idle_sessions_expire_after_the_ttl(clock):
+    store, loaded, _ = make_store(idle_ttl=60)
+    visit(store, "session-a")
+    connected = store.connect("session-b")
+    clock.now += 30
+    visit(store, "session-c")
+
+    clock.now += 31
+    visit(store, "session-d")
+
+    # a expired, b is still connected and c was active 31 seconds ago
+    assert set(store._sessions) == {"session-b", "session-c", "session-d"}
+    assert connected is store.connect("session-b")
+    visit(store, "session-a")
+    assert loaded.count("session-a") == 2
+
+
+def test_least_recently_used_idle_sessions_are_evicted_first(clock):
+    store, _, _ = make_store(max_sessions=2)
+    visit(store, "session-a")
+    visit(store, "session-b")
+    session = store.connect("session-a")
+    store.touch(session)
+    store.disconnect(session)
+
+    visit(store, "session-c")
+
+    assert list(store._sessions) == ["session-a", "session-c"]
+
+
+def test_connected_sessions_are_never_evicted(clock):
+    store, _, _ = make_store(idle_ttl=60, max_sessions=1)
+    store.connect("session-a")
+    store.connect("session-b")
+    clock.now += 120
+
+    visit(store, "session-c")
+    visit(store, "session-d")
+
+    # eviction runs on connect, when only c is idle
+    assert list(store._sessions) == ["session-a", "session-b", "session-d"]
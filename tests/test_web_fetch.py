@@ -0,0 +1,135 @@
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from server.utils import embedding
+from server.utils.embedding import MedWebPageReader
+
+PAGE = "<html><body><h1>Ibuprofen</h1><p>Take with food.</p></body></html>"
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Serves /page with an ETag, /flaky after two 503s, /missing as 404 and slow /slow/<n> pages."""
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests.append((self.path, dict(self.headers)))
+            server.in_flight += 1
+            server.max_in_flight = max(server.max_in_flight, server.in_flight)
+        try:
+            if self.path == "/page":
+                if self.headers.get("If-None-Match") == '"v1"':
+                    self._send(304)
+                else:
+                    self._send(200, PAGE, {"ETag": '"v1"'})
+            elif self.path == "/flaky":
+                with server.lock:
+                    server.flaky_failures -= 1
+                    failing = server.flaky_failures >= 0
+                self._send(503) if failing else self._send(200, PAGE)
+            elif self.path.startswith("/slow/"):
+                time.sleep(0.2)
+                self._send(200, PAGE)
+            else:
+                self._send(404)
+        finally:
+            with server.lock:
+                server.in_flight -= 1
+
+    def _send(self, status, body="", headers=None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        data = body.encode()
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        if data:
+            self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def stub_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    server.lock = threading.Lock()
+    server.requests = []
+    server.in_flight = 0
+    server.max_in_flight = 0
+    server.flaky_failures = 2
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture(autouse=True)
+def persist_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(embedding, "PERSIST_DIR", str(tmp_path))
+    return tmp_path
+
+
+def url(server, path):
+    return f"http://127.0.0.1:{server.server_address[1]}{path}"
+
+
+def paths(server):
+    return [path for path, _ in server.requests]
+
+
+def test_retries_server_errors(stub_server, monkeypatch):
+    monkeypatch.setattr(embedding, "WEB_FETCH_RETRIES", 2)
+    documents = asyncio.run(MedWebPageReader(html_to_text=False).aload_data([url(stub_server, "/flaky")]))
+
+    assert len(documents) == 1
+    assert paths(stub_server) == ["/flaky"] * 3
+
+
+def test_gives_up_on_client_errors(stub_server):
+    documents = asyncio.run(MedWebPageReader(html_to_text=False).aload_data([url(stub_server, "/missing")]))
+
+    assert documents == []
+    assert paths(stub_server) == ["/missing"]
+
+
+def test_bounds_connections_per_host(stub_server, monkeypatch):
+    monkeypatch.setattr(embedding, "WEB_CONNECTIONS_PER_HOST", 2)
+    urls = [url(stub_server, f"/slow/{i}") for i in range(6)]
+    documents = asyncio.run(MedWebPageReader(html_to_text=False).aload_data(urls))
+
+    assert [doc.id_ for doc in documents] == urls
+    assert stub_server.max_in_flight == 2
+
+
+def test_skips_unchanged_pages(stub_server, persist_dir):
+    page_url = url(stub_server, "/page")
+    reader = MedWebPageReader(html_to_text=False)
+    assert len(asyncio.run(reader.aload_data([page_url]))) == 1
+    reader.save_validators()
+    with open(persist_dir / embedding.WEB_VALIDATORS_FNAME) as f:
+        assert json.load(f)[page_url]["etag"] == '"v1"'
+
+    documents = asyncio.run(MedWebPageReader(html_to_text=False).aload_data([page_url]))
+
+    assert documents == []
+    assert stub_server.requests[-1][1].get("If-None-Match") == '"v1"'
+
+
+def test_rebuild_forgets_validators(stub_server, persist_dir):
+    page_url = url(stub_server, "/page")
+    reader = MedWebPageReader(html_to_text=False)
+    asyncio.run(reader.aload_data([page_url]))
+    reader.save_validators()
+
+    embedding.clear_web_validators(str(persist_dir))
+    documents = asyncio.run(MedWebPageReader(html_to_text=False).aload_data([page_url]))
+
+    assert len(documents) == 1
+    assert "If-None-Match" not in stub_server.requests[-1][1]
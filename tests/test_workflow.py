@@ -0,0 +1,135 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+from llama_index.core.llms import ChatMessage, ChatResponse
+from llama_index.core.tools import FunctionTool, ToolSelection
+
+from server.utils.tool_stats import ToolStats
+from server.utils.workflow import AgentConfig, AgentRegistry, ChatMessageEvent, ConciergeAgent
+
+AGENT = "Medicine Agent"
+
+
+class ScriptedLLM:
+    """A function calling LLM that answers each call with the next scripted list of tool calls."""
+
+    metadata = SimpleNamespace(is_function_calling_model=True)
+
+    def __init__(self, *turns):
+        self.turns = list(turns)
+
+    async def astream_chat_with_tools(self, tools, chat_history, **kwargs):
+        tool_calls = self.turns.pop(0)
+        message = ChatMessage(
+            role="assistant",
+            content="" if tool_calls else "done",
+            additional_kwargs={"tool_calls": tool_calls} if tool_calls else {},
+        )
+
+        async def stream():
+            yield ChatResponse(message=message, delta=message.content)
+
+        return stream()
+
+    def get_tool_calls_from_response(self, response, error_on_no_tool_call=False):
+        return response.message.additional_kwargs.get("tool_calls", [])
+
+
+class FixedRouter:
+    """Routes the first message to AGENT, then leaves it to the orchestrator."""
+
+    def __init__(self):
+        self.routes = [AGENT]
+
+    async def aroute(self, user_msg, agent_configs, user_state=None):
+        return self.routes.pop(0) if self.routes else None
+
+    def record_llm_route(self, elapsed_ms):
+        pass
+
+
+def call(tool_name, tool_id, **tool_kwargs):
+    return ToolSelection(tool_id=tool_id, tool_name=tool_name, tool_kwargs=tool_kwargs)
+
+
+def run(tools, llm, **kwargs):
+    registry = AgentRegistry([AgentConfig(name=AGENT, description="medicines", tools=tools)])
+    workflow = ConciergeAgent(timeout=10, router=FixedRouter(), **kwargs)
+
+    async def main():
+        handler = workflow.run(
+            user_msg="look these up", agent_registry=registry, llm=llm, chat_history=[], initial_state={}
+        )
+        streamed = [event.message async for event in handler.stream_events() if isinstance(event, ChatMessageEvent)]
+        return await handler, streamed
+
+    return asyncio.run(main())
+
+
+def tool_messages(chat_history):
+    return [message for message in chat_history if message.role.value == "tool"]
+
+
+def test_parallel_tool_results_keep_the_call_order():
+    calls = []
+
+    async def lookup(name: str, delay: float) -> str:
+        """Looks a medicine up."""
+        calls.append(name)
+        await asyncio.sleep(delay)
+        return f"{name} info"
+
+    llm = ScriptedLLM(
+        [call("lookup", "a", name="slow", delay=0.3), call("lookup", "b", name="medium", delay=0.2),
+         call("lookup", "c", name="fast", delay=0.0)],
+        [],
+    )
+    start = time.perf_counter()
+    result, streamed = run([FunctionTool.from_defaults(async_fn=lookup)], llm)
+    elapsed = time.perf_counter() - start
+
+    results = tool_messages(result["chat_history"])
+    assert [message.additional_kwargs["tool_call_id"] for message in results] == ["a", "b", "c"]
+    assert [message.content for message in results] == ["slow info", "medium info", "fast info"]
+    # the calls ran concurrently
+    assert elapsed < 0.45
+    assert sorted(calls) == ["fast", "medium", "slow"]
+    assert result["response"] == "done"
+    assert streamed == result["chat_history"]
+
+
+def test_slow_tools_time_out():
+    async def lookup(name: str) -> str:
+        """Looks a medicine up."""
+        await asyncio.sleep(0.5 if name == "slow" else 0)
+        return f"{name} info"
+
+    stats = ToolStats()
+    llm = ScriptedLLM([call("lookup", "a", name="slow"), call("lookup", "b", name="fast")], [])
+    result, _ = run([FunctionTool.from_defaults(async_fn=lookup)], llm, tool_timeout=0.05, tool_stats=stats)
+
+    results = tool_messages(result["chat_history"])
+    assert [message.content for message in results] == [
+        "Tool lookup timed out after 0.05 seconds", "fast info"
+    ]
+    assert stats.stats()["lookup"]["timeouts"] == 1
+    assert stats.stats()["lookup"]["calls"] == 2
+
+
+def test_a_transfer_request_drops_the_other_calls_of_its_batch():
+    calls = []
+
+    async def lookup(name: str) -> str:
+        """Looks a medicine up."""
+        calls.append(name)
+        return f"{name} info"
+
+    # the agent asks for a transfer next to a lookup; the orchestrator then answers
+    llm = ScriptedLLM([call("lookup", "a", name="ibuprofen"), call("RequestTransfer", "b")], [])
+    result, _ = run([FunctionTool.from_defaults(async_fn=lookup)], llm)
+
+    assert calls == []
+    assert tool_messages(result["chat_history"]) == []
+    assert [message.role.value for message in result["chat_history"]] == ["user", "assistant"]
+    assert result["response"] == "done"